@@ -1,11 +1,20 @@
 import streamlit as st
 import pandas as pd
+import json
 import os
+import time
+from functools import partial
 
 # Importa as funções de validação
-from validador_de_parceiro import validar_parceiros
-from validador_de_produto import validar_produtos
-from validador_de_estoque import validar_estoque
+from validador_de_parceiro import VERSAO_REGRAS_PARCEIRO, validar_parceiros
+from validador_de_produto import VERSAO_REGRAS_PRODUTO, aviso_tabela_ncm, validar_produtos
+from validador_de_estoque import VERSAO_REGRAS_ESTOQUE, carregar_mestre, validar_estoque
+from cache_resultados import LIMITE_CACHE_BYTES, CacheLRU, hash_conteudo
+from duplicidades import assinatura_carga
+from instrumentacao import Medicao
+from arquivos_download import FORMATOS, caminho_artefato, formatos_disponiveis, gerar_artefato, nome_download
+from leitor_planilha import Planilha, formato_planilha, listar_planilhas
+from tarefas import CANCELADA, CONCLUIDA, FINALIZADAS, MAX_TRABALHADORES, GerenciadorTarefas
 
 # --- CONFIGURAÇÃO DA PÁGINA ---
 st.set_page_config(
@@ -14,12 +23,6 @@ st.set_page_config(
     layout="wide"
 )
 
-# --- CONSTANTES ---
-TEMP_PARCEIRO = "temp_parceiros.csv"
-TEMP_PRODUTO = "temp_produtos.csv"
-TEMP_ESTOQUE = "temp_estoque.csv"
-TEMP_MESTRE_PRODUTO = "mestre_produtos.csv"
-
 # --- GERENCIAMENTO DE ESTADO (MEMÓRIA DO CLICK) ---
 if 'pagina_atual' not in st.session_state:
     st.session_state['pagina_atual'] = 'home'
@@ -27,8 +30,146 @@ if 'pagina_atual' not in st.session_state:
 def set_pagina(nome_pagina):
     st.session_state['pagina_atual'] = nome_pagina
 
+# --- CACHE DE RESULTADOS ---
+# Um cache por processo (compartilhado entre reruns e sessões), indexado pelo hash do
+# upload + versão das regras. O resultado exibido em cada tela fica no session_state,
+# então clicar em download/redimensionar a página não apaga o relatório.
+@st.cache_resource
+def obter_cache():
+    return CacheLRU(LIMITE_CACHE_BYTES)
+
+CACHE = obter_cache()
+
+def guardar_resultado(pagina, nome_arquivo, chave, resultados, manifesto=None):
+    if resultados is None: resultados = (None, None)
+    if resultados[1] is not None: CACHE.guardar(chave, resultados)  # erros críticos não vão para o cache
+    st.session_state[f'resultado_{pagina}'] = {'nome': nome_arquivo, 'chave': chave, 'resultados': resultados, 'novo': True,
+                                               'manifesto': manifesto, 'gravacoes': []}
+
+def exibir_resultado_salvo(pagina, arquivo, nome_arquivo_corrigido):
+    """Reexibe o último resultado da tela (enquanto o arquivo selecionado não mudar)."""
+    salvo = st.session_state.get(f'resultado_{pagina}')
+    if not salvo or (arquivo is not None and salvo['nome'] != arquivo.name): return
+    erros, df_corrigido = salvo['resultados']
+    exibir_relatorio_erros(erros, df_corrigido, nome_arquivo_corrigido, salvo['chave'], comemorar=salvo['novo'], pagina=pagina)
+    exibir_desempenho(salvo, pagina)
+    salvo['novo'] = False
+
+# --- PLANILHAS (XLSX/ODS) ---
+# Além de CSV, os uploads aceitam planilhas; com mais de uma aba, o usuário escolhe qual validar.
+TIPOS_UPLOAD = ["csv", "xlsx", "xlsm", "ods"]
+
+def escolher_aba(arquivo, pagina):
+    """Devolve (fonte para o validador, nome da aba ou None)."""
+    if arquivo is None or formato_planilha(arquivo) not in ('xlsx', 'ods'): return arquivo, None
+    abas = CACHE.obter_ou_calcular(('abas', hash_conteudo(arquivo.getbuffer())), lambda: listar_planilhas(arquivo))
+    if len(abas) <= 1: return arquivo, None
+    aba = st.selectbox("Aba da planilha", abas, key=f'aba_{pagina}')
+    return Planilha(arquivo, aba), aba
+
+# --- TAREFAS EM SEGUNDO PLANO ---
+# A validação roda fora do script (ver tarefas.py); a tela só acompanha o id da tarefa,
+# guardado na sessão e na URL (?tarefa_<tela>=id) para reencontrá-la após reconexão.
+INTERVALO_ATUALIZACAO = 1.0
+# Arquivos grandes usam vários processos; os núcleos são divididos entre as tarefas simultâneas
+PROCESSOS_POR_VALIDACAO = max(1, (os.cpu_count() or 1) // MAX_TRABALHADORES)
+FASES = {'na fila': "Aguardando na fila", 'mestre': "Carregando mestre de produtos",
+         'leitura': "Lendo arquivo", 'comparacao': "Comparando com a validação anterior", 'validacao': "Validando linhas",
+         'duplicidades': "Procurando chaves duplicadas"}
+
+@st.cache_resource
+def obter_gerenciador_tarefas():
+    return GerenciadorTarefas()
+
+TAREFAS = obter_gerenciador_tarefas()
+
+def historico_incremental(pagina, arquivo, *contexto):
+    """Reenvio do mesmo arquivo (mesmo nome) só revalida as linhas alteradas (ver revalidacao_incremental.py)."""
+    return CACHE, ('incremental', pagina, arquivo.name, *contexto)
+
+def campo_carga(pagina):
+    """Nome da carga de migração (opcional): os arquivos dela não podem repetir chaves entre si (ver duplicidades.py)."""
+    carga = st.text_input("Carga de migração (opcional)", key=f'carga_{pagina}',
+                          help="Arquivos validados com o mesmo nome de carga são conferidos entre si "
+                               "(chaves únicas repetidas em outro arquivo viram erro).")
+    return carga.strip() or None
+
+def iniciar_validacao(pagina, arquivo, chave, validar, rotulo):
+    """Usa o resultado em cache, se houver; senão agenda `validar(progresso=...)` em segundo plano."""
+    resultados = CACHE.obter(chave)
+    if resultados is not None:
+        guardar_resultado(pagina, arquivo.name, chave, resultados)
+        return
+    st.session_state.pop(f'resultado_{pagina}', None)
+    id_tarefa = TAREFAS.submeter(validar, descricao=arquivo.name,
+                                 dados={'pagina': pagina, 'nome': arquivo.name, 'chave': chave, 'rotulo': rotulo})
+    st.session_state[f'tarefa_{pagina}'] = id_tarefa
+    st.query_params[f'tarefa_{pagina}'] = id_tarefa
+
+def _esquecer_tarefa(pagina):
+    st.session_state.pop(f'tarefa_{pagina}', None)
+    if f'tarefa_{pagina}' in st.query_params: del st.query_params[f'tarefa_{pagina}']
+
+def acompanhar_tarefa(pagina):
+    """Mostra o andamento da tarefa da tela (barra + cancelar); ao terminar, guarda o resultado."""
+    id_tarefa = st.session_state.get(f'tarefa_{pagina}') or st.query_params.get(f'tarefa_{pagina}')
+    if not id_tarefa: return
+    estado = TAREFAS.estado(id_tarefa)
+    if estado is None:
+        _esquecer_tarefa(pagina)
+        return
+    st.session_state[f'tarefa_{pagina}'] = id_tarefa
+    dados = estado['dados']
+
+    if estado['status'] in FINALIZADAS:
+        _esquecer_tarefa(pagina)
+        TAREFAS.descartar(id_tarefa)
+        if estado['status'] == CONCLUIDA:
+            guardar_resultado(pagina, dados['nome'], dados['chave'], estado['resultado'], estado['manifesto'])
+        elif estado['status'] == CANCELADA:
+            st.info("Validação cancelada.")
+        else:
+            st.error(f"❌ A validação falhou inesperadamente: {estado['erro']}")
+        return
+
+    fase = FASES.get(estado['fase'], estado['fase'])
+    if estado['total']:
+        st.progress(estado['feitas'] / estado['total'],
+                    text=f"{dados['rotulo']} {fase}: {estado['feitas']:,} de {estado['total']:,} linhas".replace(',', '.'))
+    else:
+        st.progress(0, text=f"{dados['rotulo']} {fase}...")
+    if st.button("Cancelar validação", key=f"cancelar_{pagina}"):
+        TAREFAS.cancelar(id_tarefa)
+    time.sleep(INTERVALO_ATUALIZACAO)
+    st.rerun()
+
+# --- DOWNLOADS SOB DEMANDA ---
+# Nada é serializado ao exibir o relatório: o arquivo só é gerado (em disco, em fatias)
+# quando o usuário pede, e fica guardado pela chave do resultado (ver arquivos_download.py).
+def botao_download(rotulo, fonte, chave, tipo, nome_arquivo, pagina):
+    formato = st.selectbox("Formato", formatos_disponiveis(), format_func=lambda f: FORMATOS[f][0],
+                           key=f'formato_{tipo}_{pagina}')
+    chave = chave if chave is not None else ('avulso', id(fonte))
+    caminho = caminho_artefato(chave, tipo, formato)
+    if not os.path.exists(caminho):
+        if not st.button(f"Preparar: {rotulo}", key=f'preparar_{tipo}_{pagina}', type="secondary"):
+            return
+        with st.spinner("Gerando arquivo..."), Medicao(f"download {tipo} ({formato})", pagina=pagina) as medicao:
+            caminho = gerar_artefato(fonte, chave, tipo, formato, nome_arquivo)
+        salvo = st.session_state.get(f'resultado_{pagina}')
+        if salvo is not None: salvo['gravacoes'].append(medicao.manifesto)
+    with open(caminho, 'rb') as arquivo:
+        st.download_button(
+            label=rotulo,
+            data=arquivo,
+            file_name=nome_download(nome_arquivo, formato),
+            mime=FORMATOS[formato][2],
+            key=f'baixar_{tipo}_{pagina}',
+            type="secondary"
+        )
+
 # --- FUNÇÃO DE RELATÓRIO ---
-def exibir_relatorio_erros(erros, df_corrigido=None, nome_arquivo_corrigido="planilha_corrigida.csv"):
+def exibir_relatorio_erros(erros, df_corrigido=None, nome_arquivo_corrigido="planilha_corrigida.csv", chave=None, comemorar=True, pagina='relatorio'):
     
     # 1. TRATAMENTO DE ERRO CRÍTICO
     if erros is None or df_corrigido is None:
@@ -43,17 +184,10 @@ def exibir_relatorio_erros(erros, df_corrigido=None, nome_arquivo_corrigido="pla
     # 2. Caso de Sucesso
     elif not erros:
         st.success("✅ SUCESSO! Nenhum erro encontrado. Planilha pronta para importação.")
-        st.balloons() 
+        if comemorar: st.balloons() 
         
         # Botão Download SUCESSO (AGORA NEUTRO/SECONDARY)
-        csv_corrigido = df_corrigido.to_csv(index=False, sep=';', encoding='utf-8')
-        st.download_button(
-            label="⬇️ BAIXAR PLANILHA CORRIGIDA (SEM ERROS)",
-            data=csv_corrigido,
-            file_name=nome_arquivo_corrigido,
-            mime='text/csv',
-            type="secondary" # Mudado para Secondary (Neutro)
-        )
+        botao_download("⬇️ BAIXAR PLANILHA CORRIGIDA (SEM ERROS)", df_corrigido, chave, 'corrigido', nome_arquivo_corrigido, pagina)
         
     # 3. Caso de Erros Encontrados
     else:
@@ -64,41 +198,131 @@ def exibir_relatorio_erros(erros, df_corrigido=None, nome_arquivo_corrigido="pla
         
         with col_btn1:
             # Botão 1: Relatório de Erros
-            df_erros = pd.DataFrame(erros)
-            csv_erros = df_erros.to_csv(index=False, sep=';', encoding='utf-8')
-            st.download_button(
-                label="📄 BAIXAR RELATÓRIO DE ERROS",
-                data=csv_erros,
-                file_name='relatorio_erros_validacao.csv',
-                mime='text/csv',
-                type="secondary"
-            )
+            botao_download("📄 BAIXAR RELATÓRIO DE ERROS", erros, chave, 'erros', 'relatorio_erros_validacao.csv', pagina)
         
         with col_btn2:
             # Botão 2: Planilha Corrigida (AGORA NEUTRO/SECONDARY)
-            csv_corrigido = df_corrigido.to_csv(index=False, sep=';', encoding='utf-8')
-            st.download_button(
-                label="✅ BAIXAR PLANILHA CORRIGIDA",
-                data=csv_corrigido,
-                file_name=nome_arquivo_corrigido,
-                mime='text/csv',
-                type="secondary" # Mudado para Secondary (Neutro)
-            )
-
-        # Exibe a tabela de erros
-        st.subheader("Detalhamento dos Erros")
-        df_erros = pd.DataFrame(erros)
-        st.dataframe(
-            df_erros, 
-            use_container_width=True,
-            hide_index=True,
-            column_config={
-                "linha": st.column_config.NumberColumn("Linha", format="%d"),
-                "coluna": "Nome da Coluna",
-                "valor_encontrado": "Valor Original",
-                "erro": "Descrição do Erro"
-            }
-        )
+            botao_download("✅ BAIXAR PLANILHA CORRIGIDA", df_corrigido, chave, 'corrigido', nome_arquivo_corrigido, pagina)
+
+        exibir_detalhamento_erros(erros, chave, pagina)
+
+# --- RELATÓRIO AGREGADO / PAGINADO ---
+# Com centenas de milhares de erros, mandar a tabela inteira para o navegador trava a
+# página. Primeiro vai o resumo por coluna × mensagem (calculado uma vez e guardado no
+# cache); o detalhamento é filtrado e paginado aqui no servidor, e só a página visível
+# é enviada ao frontend.
+TAMANHOS_PAGINA = [50, 100, 500, 1000]
+LIMITE_RESUMO_EXIBIDO = 500
+COLUNAS_TABELA_ERROS = {
+    "linha": st.column_config.NumberColumn("Linha", format="%d"),
+    "coluna": "Nome da Coluna",
+    "valor_encontrado": "Valor Original",
+    "erro": "Descrição do Erro"
+}
+
+def exibir_detalhamento_erros(erros, chave=None, pagina='relatorio'):
+    resumo = erros.resumo() if chave is None else CACHE.obter_ou_calcular(chave + ('resumo',), erros.resumo)
+    bloqueantes = int(len(erros) - resumo['corrigidos'].sum())
+
+    m1, m2, m3 = st.columns(3)
+    m1.metric("Erros", f"{len(erros):,}".replace(',', '.'))
+    m2.metric("Bloqueantes (não corrigidos)", f"{bloqueantes:,}".replace(',', '.'))
+    m3.metric("Corrigidos automaticamente", f"{len(erros) - bloqueantes:,}".replace(',', '.'))
+
+    st.subheader("Resumo por Coluna e Erro")
+    if len(resumo) > LIMITE_RESUMO_EXIBIDO:
+        st.caption(f"Mostrando os {LIMITE_RESUMO_EXIBIDO} tipos de erro mais frequentes de {len(resumo)}.")
+    st.dataframe(
+        resumo.head(LIMITE_RESUMO_EXIBIDO),
+        use_container_width=True,
+        hide_index=True,
+        column_config={
+            "coluna": "Nome da Coluna",
+            "erro": "Descrição do Erro",
+            "quantidade": st.column_config.NumberColumn("Ocorrências", format="%d"),
+            "corrigidos": st.column_config.NumberColumn("Corrigidos", format="%d"),
+            "primeira_linha": st.column_config.NumberColumn("Primeira Linha", format="%d"),
+            "ultima_linha": st.column_config.NumberColumn("Última Linha", format="%d"),
+        }
+    )
+
+    st.subheader("Detalhamento dos Erros")
+    f1, f2 = st.columns(2)
+    with f1:
+        colunas = ["Todas"] + sorted(resumo['coluna'].astype(str).unique())
+        coluna = st.selectbox("Coluna", colunas, key=f'filtro_coluna_{pagina}')
+    with f2:
+        mensagens = resumo if coluna == "Todas" else resumo[resumo['coluna'] == coluna]
+        opcoes_erro = ["Todos"] + list(dict.fromkeys(mensagens['erro'].astype(str).head(LIMITE_RESUMO_EXIBIDO)))
+        erro = st.selectbox("Erro", opcoes_erro, key=f'filtro_erro_{pagina}')
+    f3, f4, f5, f6 = st.columns(4)
+    with f3:
+        linha_inicial = st.number_input("Da linha", min_value=2, value=2, step=1, key=f'filtro_linha_ini_{pagina}')
+    with f4:
+        linha_final = st.number_input("Até a linha", min_value=0, value=0, step=1, key=f'filtro_linha_fim_{pagina}',
+                                      help="0 = até o fim do arquivo")
+    with f5:
+        tamanho_pagina = st.selectbox("Erros por página", TAMANHOS_PAGINA, key=f'tamanho_pagina_{pagina}')
+    with f6:
+        so_bloqueantes = st.checkbox("Só bloqueantes", key=f'filtro_bloqueantes_{pagina}')
+
+    filtrados = erros.filtrar(coluna=None if coluna == "Todas" else coluna,
+                              erro=None if erro == "Todos" else erro,
+                              linha_inicial=int(linha_inicial) if linha_inicial > 2 else None,
+                              linha_final=int(linha_final) or None,
+                              so_bloqueantes=so_bloqueantes)
+    total_paginas = max(1, -(-len(filtrados) // tamanho_pagina))
+    numero = st.number_input(f"Página (de {total_paginas})", min_value=1, max_value=total_paginas, value=1, step=1,
+                             key=f'numero_pagina_{pagina}_{total_paginas}')
+    st.caption(f"{len(filtrados):,} erro(s) no filtro".replace(',', '.'))
+    st.dataframe(
+        filtrados.pagina(int(numero), tamanho_pagina),
+        use_container_width=True,
+        hide_index=True,
+        column_config=COLUNAS_TABELA_ERROS
+    )
+
+# --- PAINEL DE DESEMPENHO ---
+# O manifesto da última validação da tela (ver instrumentacao.py): tempo e memória por
+# etapa, custo de cada regra e a geração dos downloads pedidos. Resultados vindos do
+# cache não têm manifesto (não houve validação).
+def _numero(valor):
+    return f"{valor:,.0f}".replace(',', '.')
+
+def exibir_desempenho(salvo, pagina):
+    manifesto = salvo.get('manifesto')
+    if not manifesto: return
+    contadores, memoria = manifesto['contadores'], manifesto['memoria']
+    with st.expander("⏱️ Desempenho da validação"):
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Tempo total", f"{manifesto['segundos']:.2f} s")
+        m2.metric("Linhas/s", _numero(manifesto['linhas_por_segundo'] or 0))
+        m3.metric("Pico de memória (processo)", f"{_numero(memoria['pico_rss_mb'] or 0)} MB")
+        m4.metric("Arquivo lido", f"{contadores.get('bytes_lidos', 0) / 1024 ** 2:.1f} MB")
+        st.caption(f"{_numero(contadores.get('linhas_lidas', 0))} linhas lidas, "
+                   f"{_numero(contadores.get('linhas_validadas', 0))} validadas, "
+                   f"{_numero(contadores.get('linhas_reaproveitadas', 0))} reaproveitadas da validação anterior, "
+                   f"{_numero(contadores.get('linhas_saida', 0))} na planilha corrigida.")
+
+        st.markdown("**Etapas**")
+        st.dataframe(pd.DataFrame(manifesto['etapas']), use_container_width=True, hide_index=True,
+                     column_config={"etapa": "Etapa", "segundos": st.column_config.NumberColumn("Segundos", format="%.3f"),
+                                    "chamadas": "Chamadas", "rss_mb": "RSS ao fim (MB)", "pico_rss_mb": "Pico RSS (MB)"})
+        if manifesto['regras']:
+            st.markdown("**Regras** (mais caras primeiro)")
+            st.dataframe(pd.DataFrame(manifesto['regras']).sort_values('segundos', ascending=False),
+                         use_container_width=True, hide_index=True,
+                         column_config={"ordem": "Posição", "tipo": "Tipo", "coluna": "Coluna", "grupo": "Grupo",
+                                        "linhas": "Linhas", "ocorrencias": "Ocorrências",
+                                        "segundos": st.column_config.NumberColumn("Segundos", format="%.4f")})
+        if salvo['gravacoes']:
+            st.markdown("**Downloads gerados**")
+            st.dataframe(pd.DataFrame([{"arquivo": m['descricao'], "segundos": m['segundos'],
+                                        "MB": round(m['contadores'].get('bytes_gravados', 0) / 1024 ** 2, 2)}
+                                       for m in salvo['gravacoes']]), use_container_width=True, hide_index=True)
+        st.download_button("Baixar manifesto (JSON)", json.dumps(manifesto, ensure_ascii=False, indent=2, default=str),
+                           file_name=f"manifesto_{manifesto['id'][:8]}.json", mime="application/json",
+                           key=f'manifesto_{pagina}', type="secondary")
 
 # --- CABEÇALHO E LOGO ---
 col_logo, col_center, col_right_spacer = st.columns([1, 4, 1])
@@ -141,46 +365,46 @@ if st.session_state['pagina_atual'] == 'home':
 # 2. Tela Parceiros (ELIF)
 elif st.session_state['pagina_atual'] == 'parceiros':
     st.header("Validação de Parceiros")
-    st.subheader("Faça o upload do arquivo `parceiros.csv` abaixo:")
-    arquivo_upado = st.file_uploader(" ", type=["csv"], key="uploader_parceiros")
+    st.subheader("Faça o upload do arquivo `parceiros.csv` (ou planilha .xlsx/.ods) abaixo:")
+    arquivo_upado = st.file_uploader(" ", type=TIPOS_UPLOAD, key="uploader_parceiros")
+    fonte, aba = escolher_aba(arquivo_upado, 'parceiros')
+    carga = campo_carga('parceiros')
     
     if arquivo_upado and st.button("Iniciar Validação", type="secondary", key="btn_parceiros"):
-        with open(TEMP_PARCEIRO, "wb") as f:
-            f.write(arquivo_upado.getbuffer())
-        
-        with st.spinner("Analisando regras de negócio..."):
-            resultados = validar_parceiros(TEMP_PARCEIRO)
-        
-        if resultados is None:
-            erros, df_corrigido = None, None
-        else:
-            erros, df_corrigido = resultados 
+        # O resultado depende também dos outros arquivos da carga: o estado dela entra na chave
+        chave = ('parceiros', hash_conteudo(arquivo_upado.getbuffer()), aba, VERSAO_REGRAS_PARCEIRO,
+                 assinatura_carga(carga, 'parceiros', excluir=arquivo_upado.name))
 
-        exibir_relatorio_erros(erros, df_corrigido, "parceiros_corrigido.csv") 
-        
-        if os.path.exists(TEMP_PARCEIRO): os.remove(TEMP_PARCEIRO)
+        # O upload é validado direto da memória da sessão (sem arquivo temporário)
+        validar = partial(validar_parceiros, fonte, processos=PROCESSOS_POR_VALIDACAO,
+                          incremental=historico_incremental('parceiros', arquivo_upado, aba),
+                          carga=carga, arquivo=arquivo_upado.name)
+        iniciar_validacao('parceiros', arquivo_upado, chave, validar, "Analisando regras de negócio.")
+
+    acompanhar_tarefa('parceiros')
+    exibir_resultado_salvo('parceiros', arquivo_upado, "parceiros_corrigido.csv")
 
 # 3. Tela Produtos (ELIF)
 elif st.session_state['pagina_atual'] == 'produtos':
     st.header("Validação de Produtos")
-    st.subheader("Faça o upload do arquivo `produtos.csv` abaixo:")
-    arquivo_upado = st.file_uploader(" ", type=["csv"], key="uploader_produtos")
+    if aviso_tabela_ncm(): st.warning(f"⚠️ {aviso_tabela_ncm()}")
+    st.subheader("Faça o upload do arquivo `produtos.csv` (ou planilha .xlsx/.ods) abaixo:")
+    arquivo_upado = st.file_uploader(" ", type=TIPOS_UPLOAD, key="uploader_produtos")
+    fonte, aba = escolher_aba(arquivo_upado, 'produtos')
+    carga = campo_carga('produtos')
     
     if arquivo_upado and st.button("Iniciar Validação", type="secondary", key="btn_produtos"):
-        with open(TEMP_PRODUTO, "wb") as f:
-            f.write(arquivo_upado.getbuffer())
-            
-        with st.spinner("Analisando NCMs, unidades e regras..."):
-            resultados = validar_produtos(TEMP_PRODUTO)
-
-        if resultados is None:
-            erros, df_corrigido = None, None
-        else:
-            erros, df_corrigido = resultados 
-            
-        exibir_relatorio_erros(erros, df_corrigido, "produtos_corrigido.csv") 
-        
-        if os.path.exists(TEMP_PRODUTO): os.remove(TEMP_PRODUTO)
+        # O resultado depende também dos outros arquivos da carga: o estado dela entra na chave
+        chave = ('produtos', hash_conteudo(arquivo_upado.getbuffer()), aba, VERSAO_REGRAS_PRODUTO,
+                 assinatura_carga(carga, 'produtos', excluir=arquivo_upado.name))
+
+        validar = partial(validar_produtos, fonte, processos=PROCESSOS_POR_VALIDACAO,
+                          incremental=historico_incremental('produtos', arquivo_upado, aba),
+                          carga=carga, arquivo=arquivo_upado.name)
+        iniciar_validacao('produtos', arquivo_upado, chave, validar, "Analisando NCMs, unidades e regras.")
+
+    acompanhar_tarefa('produtos')
+    exibir_resultado_salvo('produtos', arquivo_upado, "produtos_corrigido.csv")
 
 # 4. Tela Estoque (ELIF)
 elif st.session_state['pagina_atual'] == 'estoque':
@@ -190,24 +414,28 @@ elif st.session_state['pagina_atual'] == 'estoque':
     col_a, col_b = st.columns(2)
     with col_a:
         st.subheader("1. Planilha de Estoque (`estoque.csv`)")
-        arquivo_estoque = st.file_uploader(" ", type=["csv"], key="uploader_estoque")
+        arquivo_estoque = st.file_uploader(" ", type=TIPOS_UPLOAD, key="uploader_estoque")
+        fonte_estoque, aba = escolher_aba(arquivo_estoque, 'estoque')
     with col_b:
         st.subheader("2. Mestre de Produtos (`mestre_produtos.csv`)")
-        arquivo_mestre = st.file_uploader(" ", type=["csv"], key="uploader_mestre_prod")
+        arquivo_mestre = st.file_uploader(" ", type=TIPOS_UPLOAD, key="uploader_mestre_prod")
 
     if arquivo_estoque and arquivo_mestre and st.button("Iniciar Validação Cruzada", type="secondary", key="btn_estoque"):
-        with open(TEMP_ESTOQUE, "wb") as f: f.write(arquivo_estoque.getbuffer())
-        with open(TEMP_MESTRE_PRODUTO, "wb") as f: f.write(arquivo_mestre.getbuffer())
-        
-        with st.spinner("Cruzando dados com o mestre..."):
-            resultados = validar_estoque(TEMP_ESTOQUE)
+        chave_mestre = ('mestre_produtos', hash_conteudo(arquivo_mestre.getbuffer()))
+        chave = ('estoque', hash_conteudo(arquivo_estoque.getbuffer()), aba, chave_mestre[1], VERSAO_REGRAS_ESTOQUE)
 
-        if resultados is None:
-            erros, df_corrigido = None, None
-        else:
-            erros, df_corrigido = resultados 
-            
-        exibir_relatorio_erros(erros, df_corrigido, "estoque_corrigido.csv") 
-        
-        if os.path.exists(TEMP_ESTOQUE): os.remove(TEMP_ESTOQUE)
-        if os.path.exists(TEMP_MESTRE_PRODUTO): os.remove(TEMP_MESTRE_PRODUTO)
\ No newline at end of file
+        def _validar(progresso):
+            # O mestre também fica em cache: vários estoques contra o mesmo mestre só o carregam uma vez
+            produtos_validos = CACHE.obter(chave_mestre)
+            if produtos_validos is None:
+                produtos_validos = carregar_mestre(arquivo_mestre, 'CODPROD')
+                if produtos_validos is not None: CACHE.guardar(chave_mestre, produtos_validos)
+            # Mestre inválido: passa o próprio upload, para o erro crítico citar o nome dele
+            return validar_estoque(fonte_estoque, arquivo_mestre if produtos_validos is None else produtos_validos,
+                                   progresso=progresso, processos=PROCESSOS_POR_VALIDACAO,
+                                   incremental=historico_incremental('estoque', arquivo_estoque, aba, chave_mestre[1]))
+
+        iniciar_validacao('estoque', arquivo_estoque, chave, _validar, "Cruzando dados com o mestre.")
+
+    acompanhar_tarefa('estoque')
+    exibir_resultado_salvo('estoque', arquivo_estoque, "estoque_corrigido.csv")
\ No newline at end of file
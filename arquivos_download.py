@@ -0,0 +1,143 @@
+import gzip
+import hashlib
+import os
+import threading
+import zipfile
+
+from instrumentacao import contar, etapa
+from tabela_erros import TabelaErros
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet é opcional: sem pyarrow, a opção só não aparece
+    pa = pq = None
+
+# --- Arquivos de Download (sob demanda) ---
+# A planilha corrigida e o relatório de erros só são serializados quando o usuário pede
+# um download, direto para um arquivo em disco, em fatias (a memória não dobra com o
+# arquivo). O arquivo gerado é identificado pela chave do resultado (hash do upload +
+# versão das regras e dos mestres), pelo formato e pela versão do código do projeto
+# (VERSAO_CODIGO): pedir de novo o mesmo download não serializa nada, e uma atualização
+# do validador não reaproveita arquivos gerados pelo código anterior.
+# Quando a pasta passa de `LIMITE_DOWNLOADS_BYTES`, saem primeiro os usados há mais tempo.
+
+PASTA_DOWNLOADS_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache_downloads')
+LIMITE_DOWNLOADS_BYTES = 2 * 1024 ** 3
+LINHAS_POR_FATIA = 100_000
+
+def _versao_codigo(pasta=os.path.dirname(os.path.abspath(__file__))):
+    """Hash do código-fonte dos módulos do projeto (arquivos .py da pasta do validador)."""
+    total = hashlib.sha256()
+    for nome in sorted(os.listdir(pasta)):
+        if not nome.endswith('.py'): continue
+        with open(os.path.join(pasta, nome), 'rb') as arquivo:
+            total.update(nome.encode('utf-8') + b'\0' + hashlib.sha256(arquivo.read()).digest())
+    return total.hexdigest()[:16]
+
+VERSAO_CODIGO = _versao_codigo()
+
+# formato -> (rótulo, extensão, mime)
+FORMATOS = {
+    'csv.gz': ("CSV compactado (gzip)", '.csv.gz', 'application/gzip'),
+    'zip': ("CSV compactado (zip)", '.zip', 'application/zip'),
+    'csv': ("CSV", '.csv', 'text/csv'),
+    'parquet': ("Parquet", '.parquet', 'application/vnd.apache.parquet'),
+}
+
+def formatos_disponiveis():
+    return [f for f in FORMATOS if f != 'parquet' or pq is not None]
+
+def nome_download(nome_arquivo, formato):
+    """'parceiros_corrigido.csv' -> nome com a extensão do formato."""
+    return os.path.splitext(nome_arquivo)[0] + FORMATOS[formato][1]
+
+def caminho_artefato(chave, tipo, formato, pasta=PASTA_DOWNLOADS_PADRAO):
+    digest = hashlib.sha256(repr((VERSAO_CODIGO, chave, tipo)).encode('utf-8')).hexdigest()[:32]
+    return os.path.join(pasta, f'{tipo}-{digest}{FORMATOS[formato][1]}')
+
+def _fatias(fonte, tamanho):
+    if isinstance(fonte, TabelaErros):
+        yield from fonte.fatias(tamanho)
+    else:
+        for inicio in range(0, len(fonte), tamanho):
+            yield fonte.iloc[inicio:inicio + tamanho]
+
+def _vazio(fonte):
+    return (fonte.para_dataframe() if isinstance(fonte, TabelaErros) else fonte).head(0)
+
+def _gravar_csv(fonte, arquivo, tamanho):
+    escreveu = False
+    for fatia in _fatias(fonte, tamanho):
+        fatia.to_csv(arquivo, sep=';', index=False, header=not escreveu, encoding='utf-8')
+        escreveu = True
+    if not escreveu:
+        _vazio(fonte).to_csv(arquivo, sep=';', index=False, encoding='utf-8')
+
+def _tabela_arrow(fatia, esquema=None):
+    # Colunas de texto do pandas podem misturar tipos; no Parquet vão como string
+    textos = {c: str for c in fatia.columns if fatia[c].dtype == object}
+    return pa.Table.from_pandas(fatia.astype(textos) if textos else fatia, schema=esquema, preserve_index=False)
+
+def _gravar_parquet(fonte, caminho, tamanho):
+    escritor = None
+    try:
+        for fatia in _fatias(fonte, tamanho):
+            tabela = _tabela_arrow(fatia, escritor.schema if escritor else None)
+            if escritor is None: escritor = pq.ParquetWriter(caminho, tabela.schema, compression='snappy')
+            escritor.write_table(tabela)
+        if escritor is None:
+            pq.write_table(_tabela_arrow(_vazio(fonte)), caminho)
+    finally:
+        if escritor is not None: escritor.close()
+
+def _gravar(fonte, temporario, formato, nome_arquivo, tamanho_fatia):
+    if formato == 'csv':
+        with open(temporario, 'wb') as arquivo:
+            _gravar_csv(fonte, arquivo, tamanho_fatia)
+    elif formato == 'csv.gz':
+        with gzip.open(temporario, 'wb', compresslevel=6) as arquivo:
+            _gravar_csv(fonte, arquivo, tamanho_fatia)
+    elif formato == 'zip':
+        with zipfile.ZipFile(temporario, 'w', zipfile.ZIP_DEFLATED) as pacote, \
+             pacote.open(os.path.splitext(nome_arquivo)[0] + '.csv', 'w', force_zip64=True) as arquivo:
+            _gravar_csv(fonte, arquivo, tamanho_fatia)
+    elif formato == 'parquet' and pq is not None:
+        _gravar_parquet(fonte, temporario, tamanho_fatia)
+    else:
+        raise ValueError(f"Formato de download indisponível: '{formato}'.")
+
+def gerar_artefato(fonte, chave, tipo, formato, nome_arquivo, pasta=PASTA_DOWNLOADS_PADRAO,
+                   tamanho_fatia=LINHAS_POR_FATIA, limite_bytes=LIMITE_DOWNLOADS_BYTES):
+    """
+    Caminho do arquivo de download de `fonte` (DataFrame ou TabelaErros) no `formato`,
+    gerando-o só se ainda não existe para essa chave. `nome_arquivo` é o nome do CSV
+    dentro do .zip.
+    """
+    caminho = caminho_artefato(chave, tipo, formato, pasta)
+    if os.path.exists(caminho):
+        os.utime(caminho)  # usado agora: último a sair na limpeza
+        return caminho
+
+    os.makedirs(pasta, exist_ok=True)
+    temporario = f'{caminho}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with etapa('gravacao'):
+            _gravar(fonte, temporario, formato, nome_arquivo, tamanho_fatia)
+        contar('bytes_gravados', os.path.getsize(temporario))
+        os.replace(temporario, caminho)
+    finally:
+        if os.path.exists(temporario): os.remove(temporario)
+    limpar_downloads(pasta, limite_bytes, manter=caminho)
+    return caminho
+
+def limpar_downloads(pasta=PASTA_DOWNLOADS_PADRAO, limite_bytes=LIMITE_DOWNLOADS_BYTES, manter=None):
+    """Apaga os downloads usados há mais tempo até a pasta caber em `limite_bytes`."""
+    arquivos = [os.path.join(pasta, a) for a in os.listdir(pasta) if not a.endswith('.tmp')]
+    arquivos.sort(key=os.path.getmtime)
+    total = sum(os.path.getsize(a) for a in arquivos)
+    for antigo in arquivos:
+        if total <= limite_bytes: break
+        if antigo == manter: continue
+        total -= os.path.getsize(antigo)
+        os.remove(antigo)
@@ -0,0 +1,208 @@
+import argparse
+import datetime
+import importlib
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from gerador_dados import caminho_gerado, gerar_arquivo, linhas_mestre
+from instrumentacao import Medicao
+from processamento_em_lotes import TAMANHO_LOTE_PADRAO
+from processamento_paralelo import contexto_processos
+from validador_de_estoque import carregar_mestre
+
+# --- Benchmark dos Validadores ---
+# Mede validar_parceiros, validar_produtos e validar_estoque (ou as versões em lotes)
+# sobre arquivos sintéticos de gerador_dados.py, nos tamanhos pedidos. Cada medição roda
+# num processo novo, então o pico de RSS é só dela, e o import do validador (que carrega
+# os mestres de cidade/UF) fica fora da medição. Tempos e memória vêm do manifesto da
+# Medicao (ver instrumentacao.py): por etapa (leitura, validacao/regras, gravacao...) e por regra.
+#
+# O resultado (tempo, linhas/s, pico de RSS, erros, por validador/tamanho e por fase) vai
+# para um JSON com o commit e as versões das bibliotecas; `--comparar` confronta dois
+# JSONs e sai com código 1 se algum caso ficou mais lento que a tolerância.
+#
+# Uso:
+#   python benchmark.py                                   # 10k e 100k, os três validadores
+#   python benchmark.py -n 1M -n 10M --modo lotes --validador parceiros
+#   python benchmark.py --comparar resultados_benchmark/antes.json resultados_benchmark/depois.json
+
+VALIDADORES = {
+    'parceiros': ('validador_de_parceiro', 'validar_parceiros', 'validar_parceiros_em_lotes'),
+    'produtos': ('validador_de_produto', 'validar_produtos', 'validar_produtos_em_lotes'),
+    'estoque': ('validador_de_estoque', 'validar_estoque', 'validar_estoque_em_lotes'),
+}
+TAMANHOS_PADRAO = ('10k', '100k')
+MODOS = ('completo', 'lotes')
+PASTA = os.path.dirname(os.path.abspath(__file__))
+PASTA_DADOS_PADRAO = os.path.join(PASTA, '.cache_benchmark')
+PASTA_RESULTADOS_PADRAO = os.path.join(PASTA, 'resultados_benchmark')
+SEMENTE_PADRAO = 42
+TOLERANCIA_PADRAO = 0.10
+VERSAO_FORMATO = 1
+
+def ler_tamanho(texto):
+    """'10k' -> 10000, '1M' -> 1000000, '250000' -> 250000."""
+    texto = str(texto).strip().lower().replace('_', '')
+    multiplicador = {'k': 1_000, 'm': 1_000_000}.get(texto[-1:], 1)
+    try:
+        valor = int(float(texto[:-1] if multiplicador > 1 else texto) * multiplicador)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"tamanho inválido: '{texto}' (ex.: 10k, 1M, 250000)")
+    if valor < 1: raise argparse.ArgumentTypeError("o tamanho precisa ser pelo menos 1 linha")
+    return valor
+
+def medir(validador, caminho, caminho_mestre=None, modo='completo', processos=None, tamanho_lote=TAMANHO_LOTE_PADRAO):
+    """Uma medição (roda no processo filho). Retorna o dicionário do resultado, sem os dados do caso."""
+    modulo, nome_completo, nome_lotes = VALIDADORES[validador]
+    modulo = importlib.import_module(modulo)
+    extra = (caminho_mestre,) if validador == 'estoque' else ()
+
+    with tempfile.TemporaryDirectory() as pasta, Medicao(os.path.basename(caminho), publicar=False) as medicao:
+        if modo == 'lotes':
+            resultado = getattr(modulo, nome_lotes)(caminho, *extra, os.path.join(pasta, 'corrigido.csv'),
+                                                    os.path.join(pasta, 'erros.csv'), tamanho_lote, processos=processos)
+        else:
+            resultado = getattr(modulo, nome_completo)(caminho, *extra, processos=processos)
+        medicao.registrar_resultado(resultado)
+
+    manifesto = medicao.manifesto
+    return {'segundos': manifesto['segundos'], 'pico_rss_mb': manifesto['memoria']['pico_rss_mb'],
+            'erros': manifesto['contadores'].get('erros', 0), 'bloqueantes': manifesto['contadores'].get('bloqueantes', 0),
+            'fases': {m['etapa']: {'segundos': m['segundos'], 'pico_rss_mb': m['pico_rss_mb']} for m in manifesto['etapas']},
+            'regras': manifesto['regras'], 'falha': manifesto['falha']}
+
+def _medir_em_processo_novo(*argumentos):
+    with ProcessPoolExecutor(max_workers=1, mp_context=contexto_processos()) as pool:
+        return pool.submit(medir, *argumentos).result()
+
+def _git(*argumentos):
+    try:
+        return subprocess.run(['git', *argumentos], cwd=PASTA, capture_output=True, text=True, timeout=30).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ''
+
+def ambiente():
+    """Commit e versões: sem isso, dois JSONs não são comparáveis."""
+    versoes = {}
+    for nome in ('pandas', 'numpy', 'pyarrow'):
+        try:
+            versoes[nome] = importlib.import_module(nome).__version__
+        except ImportError:
+            versoes[nome] = None
+    from texto_arrow import motor_csv
+    return {'commit': _git('rev-parse', 'HEAD') or None, 'alteracoes_locais': bool(_git('status', '--porcelain', '--untracked-files=no')),
+            'data': datetime.datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+            'plataforma': platform.platform(), 'nucleos': os.cpu_count(), 'motor_csv': motor_csv(), 'versoes': versoes}
+
+def executar(validadores, tamanhos, modo='completo', repeticoes=1, semente=SEMENTE_PADRAO, pasta_dados=PASTA_DADOS_PADRAO,
+             processos=None, tamanho_lote=TAMANHO_LOTE_PADRAO):
+    """Roda todos os casos (tamanho x validador) e devolve o relatório completo (dict pronto para JSON)."""
+    relatorio = {'formato': VERSAO_FORMATO, 'ambiente': ambiente(), 'semente': semente, 'modo': modo,
+                 'processos': processos, 'repeticoes': repeticoes, 'resultados': []}
+    for linhas in tamanhos:
+        for validador in validadores:
+            if not os.path.exists(caminho_gerado(validador, linhas, semente, pasta_dados)):
+                print(f"Gerando {validador} com {linhas:,} linhas...", flush=True)
+            caminho = gerar_arquivo(validador, linhas, semente, pasta_dados)
+            mestre = caminho_gerado('mestre', linhas_mestre(linhas), semente, pasta_dados) if validador == 'estoque' else None
+            if mestre and modo == 'lotes':
+                # Como na linha de comando: o snapshot do mestre é compilado antes, fora da medição
+                carregar_mestre(mestre, 'CODPROD')
+
+            medicoes = [_medir_em_processo_novo(validador, caminho, mestre, modo, processos, tamanho_lote) for _ in range(repeticoes)]
+            melhor = min(medicoes, key=lambda m: m['segundos'])  # melhor de N: o menos afetado por ruído
+            resultado = {'validador': validador, 'linhas': linhas, 'modo': modo, 'bytes': os.path.getsize(caminho), **melhor,
+                         'linhas_por_segundo': round(linhas / max(melhor['segundos'], 1e-9), 1),
+                         'tempos': [m['segundos'] for m in medicoes]}
+            relatorio['resultados'].append(resultado)
+            _imprimir(resultado)
+    return relatorio
+
+def _imprimir(r):
+    if r['falha']:
+        print(f"[FALHA] {r['validador']} {r['linhas']:,} linhas: {r['falha']}")
+        return
+    fases = ', '.join(f"{nome} {m['segundos']:.2f}s" for nome, m in r['fases'].items() if '/' not in nome)
+    print(f"{r['validador']:>9} {r['linhas']:>11,} linhas: {r['segundos']:7.2f}s  {r['linhas_por_segundo']:>10,.0f} linhas/s  "
+          f"pico {r['pico_rss_mb'] or 0:,.0f} MB  ({fases})", flush=True)
+
+def salvar(relatorio, destino=None):
+    """Grava o relatório em `destino` (arquivo .json ou pasta; padrão: resultados_benchmark/)."""
+    destino = destino or PASTA_RESULTADOS_PADRAO
+    if not destino.endswith('.json'):
+        commit = (relatorio['ambiente']['commit'] or 'sem-commit')[:10]
+        carimbo = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        destino = os.path.join(destino, f"benchmark_{commit}_{carimbo}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+    with open(destino, 'w', encoding='utf-8') as arquivo:
+        json.dump(relatorio, arquivo, ensure_ascii=False, indent=2)
+    return destino
+
+# --- Comparação entre commits ---
+def comparar(caminho_base, caminho_novo, tolerancia=TOLERANCIA_PADRAO):
+    """Imprime novo x base por caso; devolve a lista de casos que ficaram mais lentos que `tolerancia`."""
+    with open(caminho_base, encoding='utf-8') as a, open(caminho_novo, encoding='utf-8') as b:
+        base, novo = json.load(a), json.load(b)
+    chave = lambda r: (r['validador'], r['linhas'], r['modo'])
+    anteriores = {chave(r): r for r in base['resultados'] if not r['falha']}
+    print(f"Base: {(base['ambiente']['commit'] or '?')[:10]}  Novo: {(novo['ambiente']['commit'] or '?')[:10]}  "
+          f"(tolerância {tolerancia:.0%})")
+    regressoes = []
+    for r in novo['resultados']:
+        antes = anteriores.get(chave(r))
+        if antes is None or r['falha']: continue
+        razao = r['segundos'] / max(antes['segundos'], 1e-9)
+        situacao = "REGRESSÃO" if razao > 1 + tolerancia else "melhora" if razao < 1 - tolerancia else "igual"
+        if situacao == "REGRESSÃO": regressoes.append(chave(r))
+        rss = f"{antes['pico_rss_mb'] or 0:,.0f} -> {r['pico_rss_mb'] or 0:,.0f} MB"
+        print(f"{r['validador']:>9} {r['linhas']:>11,} {r['modo']:>8}: {antes['segundos']:7.2f}s -> {r['segundos']:7.2f}s "
+              f"({razao:5.2f}x)  {rss:>20}  {situacao}")
+    return regressoes
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description="Benchmark dos validadores com dados sintéticos de ERP.")
+    parser.add_argument('-n', '--linhas', action='append', type=ler_tamanho, metavar='TAMANHO',
+                        help="Linhas por arquivo (10k, 100k, 1M, 10M...; pode repetir). Padrão: 10k e 100k.")
+    parser.add_argument('--validador', action='append', choices=list(VALIDADORES), help="Só estes validadores (pode repetir).")
+    parser.add_argument('--modo', choices=MODOS, default='completo',
+                        help="completo (DataFrame inteiro) ou lotes (streaming, para 10M+).")
+    parser.add_argument('-r', '--repeticoes', type=int, default=1, help="Medições por caso (vale a melhor).")
+    parser.add_argument('-p', '--processos', type=int, default=None, help="Processos por validação (padrão: 1).")
+    parser.add_argument('--tamanho-lote', type=int, default=TAMANHO_LOTE_PADRAO, help="Linhas por lote no modo lotes.")
+    parser.add_argument('--semente', type=int, default=SEMENTE_PADRAO, help="Semente dos dados gerados.")
+    parser.add_argument('--dados', default=PASTA_DADOS_PADRAO, help="Pasta dos arquivos gerados (reaproveitados entre execuções).")
+    parser.add_argument('--saida', help="Arquivo .json ou pasta do resultado (padrão: resultados_benchmark/).")
+    parser.add_argument('--so-gerar', action='store_true', help="Só gera os arquivos, sem medir.")
+    parser.add_argument('--comparar', nargs=2, metavar=('BASE', 'NOVO'), help="Compara dois resultados JSON.")
+    parser.add_argument('--tolerancia', type=float, default=TOLERANCIA_PADRAO,
+                        help="Aumento de tempo aceito antes de apontar regressão (padrão: 0.10 = 10%%).")
+    return parser
+
+def main(argv=None):
+    parser = criar_parser()
+    args = parser.parse_args(argv)
+    if args.comparar:
+        return 1 if comparar(*args.comparar, tolerancia=args.tolerancia) else 0
+    if args.repeticoes < 1:
+        parser.error("--repeticoes precisa ser pelo menos 1.")
+
+    validadores = args.validador or list(VALIDADORES)
+    tamanhos = args.linhas or [ler_tamanho(t) for t in TAMANHOS_PADRAO]
+    if args.so_gerar:
+        for linhas in tamanhos:
+            for validador in validadores:
+                print(gerar_arquivo(validador, linhas, args.semente, args.dados))
+        return 0
+
+    relatorio = executar(validadores, tamanhos, args.modo, args.repeticoes, args.semente, args.dados,
+                         args.processos, args.tamanho_lote)
+    print(f"\nResultado gravado em {salvar(relatorio, args.saida)}")
+    return 1 if any(r['falha'] for r in relatorio['resultados']) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,91 @@
+import hashlib
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from tabela_erros import TabelaErros
+
+# --- Cache de Resultados (LRU por bytes) ---
+# O Streamlit reexecuta o app.py inteiro a cada clique. Resultados de validação,
+# mestres carregados e resumos de relatório ficam aqui, indexados por
+# (validador, hash do upload, versão das regras, ...): reexibir ou rebaixar um
+# relatório não custa nada, e validar de novo o mesmo arquivo é instantâneo.
+# Quando o total passa de `limite_bytes`, saem primeiro os itens usados há mais tempo.
+
+LIMITE_CACHE_BYTES = 512 * 1024 * 1024
+# Medir texto Python (deep) custa uma passada pelo DataFrame: acima disso, mede uma amostra
+LINHAS_AMOSTRA_MEMORIA = 20_000
+
+def hash_conteudo(dados):
+    """SHA-256 do conteúdo enviado (bytes, memoryview ou o buffer do upload)."""
+    return hashlib.sha256(dados).hexdigest()
+
+def tamanho_aproximado(valor):
+    """Estimativa, em bytes, da memória ocupada por um item do cache."""
+    if valor is None: return 0
+    if isinstance(valor, pd.DataFrame):
+        if len(valor) <= LINHAS_AMOSTRA_MEMORIA: return int(valor.memory_usage(index=True, deep=True).sum())
+        amostra = valor.take(np.linspace(0, len(valor) - 1, LINHAS_AMOSTRA_MEMORIA).astype(np.int64))
+        return int(amostra.memory_usage(index=True, deep=True).sum() * len(valor) / LINHAS_AMOSTRA_MEMORIA)
+    if isinstance(valor, TabelaErros): return valor.memoria()
+    if isinstance(valor, np.memmap): return 0  # vive no disco (snapshot)
+    if isinstance(valor, np.ndarray): return valor.nbytes
+    if isinstance(valor, (bytes, str)): return sys.getsizeof(valor)
+    if isinstance(valor, tuple): return sum(tamanho_aproximado(v) for v in valor)
+    if isinstance(valor, dict): return sum(tamanho_aproximado(v) for v in valor.values())
+    if isinstance(valor, list):
+        # Lista de erros: mede uma amostra e extrapola
+        amostra = valor[:100]
+        if not amostra: return sys.getsizeof(valor)
+        por_item = sum(sys.getsizeof(d) + sum(sys.getsizeof(v) for v in d.values()) if isinstance(d, dict)
+                       else sys.getsizeof(d) for d in amostra) / len(amostra)
+        return int(sys.getsizeof(valor) + por_item * len(valor))
+    return sys.getsizeof(valor)
+
+class CacheLRU:
+    """Cache em memória limitado por bytes; seguro para as várias sessões (threads) do Streamlit."""
+
+    def __init__(self, limite_bytes=LIMITE_CACHE_BYTES):
+        self.limite_bytes = limite_bytes
+        self.uso_bytes = 0
+        self._itens = OrderedDict()  # chave -> (valor, tamanho)
+        self._trava = threading.Lock()
+
+    def __contains__(self, chave):
+        with self._trava:
+            return chave in self._itens
+
+    def obter(self, chave, padrao=None):
+        with self._trava:
+            if chave not in self._itens: return padrao
+            self._itens.move_to_end(chave)
+            return self._itens[chave][0]
+
+    def guardar(self, chave, valor, tamanho=None):
+        tamanho = tamanho_aproximado(valor) if tamanho is None else tamanho
+        with self._trava:
+            if chave in self._itens:
+                self.uso_bytes -= self._itens.pop(chave)[1]
+            if tamanho > self.limite_bytes: return valor  # maior que o cache inteiro: não guarda
+            self._itens[chave] = (valor, tamanho)
+            self.uso_bytes += tamanho
+            while self.uso_bytes > self.limite_bytes:
+                _, (_, liberado) = self._itens.popitem(last=False)
+                self.uso_bytes -= liberado
+        return valor
+
+    def obter_ou_calcular(self, chave, calcular):
+        """Devolve o item da chave, calculando (e guardando) só quando não está no cache."""
+        valor = self.obter(chave, _AUSENTE)
+        if valor is _AUSENTE: valor = self.guardar(chave, calcular())
+        return valor
+
+    def limpar(self):
+        with self._trava:
+            self._itens.clear()
+            self.uso_bytes = 0
+
+_AUSENTE = object()
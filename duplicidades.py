@@ -0,0 +1,326 @@
+import datetime
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+from instrumentacao import contar, etapa
+from tabela_erros import TabelaErros
+from texto_arrow import como_texto
+
+# --- Chaves Duplicadas (no arquivo e na carga de migração) ---
+# AD_IDEXTERNO e CGC_CPF precisam ser únicos no ERP; repetidos só estouram na importação,
+# horas depois de começar a carga. Ao contrário das regras (motor_regras.py), duplicidade
+# não é da linha: depende do arquivo inteiro. Por isso ela é conferida DEPOIS da validação,
+# sobre a saída corrigida (CGC_CPF já sem máscara), e não entra nos blocos/lotes/processos
+# nem no histórico da revalidação incremental (que continuam só com regras por linha).
+#
+# Memória limitada: as chaves são distribuídas em PARTICOES pelo hash; cada partição guarda
+# só (chave em bytes UTF-8, linha). Passando de `limite` chaves em memória, os pedaços vão
+# para arquivos temporários. No fim, cada partição é resolvida sozinha (np.unique exato,
+# sem risco de colisão de hash), então o pico é o de uma partição, não o do arquivo.
+#
+# Carga de migração: arquivos enviados para a mesma carga (ex.: parceiros_sp.csv e
+# parceiros_rj.csv) não podem repetir chaves entre si. Cada arquivo validado grava seu
+# índice em <pasta>/<carga>/<entidade>/<arquivo>/: por coluna, as chaves distintas
+# ordenadas dentro de cada partição ('chaves'), a primeira linha de cada uma ('linhas') e
+# o começo de cada partição ('inicio', formato CSR), mais todas as linhas de cada chave
+# ('ocorrencias', a partir de 'posicoes', também CSR). A consulta é um np.searchsorted na
+# partição certa de cada outro arquivo, aberto por mmap, e sai só dos índices gravados.
+# Reenviar um arquivo (mesmo nome) substitui o índice dele. O índice é gravado ANTES da
+# consulta: dois arquivos validados ao mesmo tempo não se perdem (pelo menos o segundo a
+# gravar enxerga o primeiro). Quem valida vários arquivos de uma vez (linha_de_comando.py)
+# grava todos sem consultar (`consultar_carga=False`) e depois chama erros_na_carga para
+# cada um, para que todo arquivo liste as chaves que repetem nos outros.
+#
+# Todas as ocorrências viram erro: a primeira ("primeira de N ocorrências") e cada
+# repetição ("repete a linha X"). No modo em lotes, esses erros vão ao fim do relatório.
+
+GRUPO_DUPLICIDADES = 'duplicidades'
+PARTICOES = 64
+LIMITE_CHAVES_MEMORIA = 2_000_000
+VERSAO_INDICE = 2
+PASTA_CARGAS_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache_cargas')
+
+def nome_seguro(nome):
+    """Nome de carga/arquivo utilizável como pasta."""
+    return re.sub(r'[^\w.-]+', '_', str(nome)).strip('._') or '_'
+
+def _sufixo_temporario():
+    return f'{os.getpid()}.{threading.get_ident()}.tmp'
+
+def pasta_carga(carga, entidade, pasta=PASTA_CARGAS_PADRAO):
+    return os.path.join(pasta, nome_seguro(carga), entidade)
+
+def arquivos_da_carga(carga, entidade, pasta=PASTA_CARGAS_PADRAO):
+    """Metadados ({'arquivo', 'gravado_em', 'chaves', ...}) dos arquivos já indexados na carga."""
+    base = pasta_carga(carga, entidade, pasta)
+    try:
+        nomes = sorted(os.listdir(base))
+    except OSError:
+        return []
+    arquivos = []
+    for nome in nomes:
+        if nome.endswith('.tmp'): continue
+        try:
+            with open(os.path.join(base, nome, 'arquivo.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if meta.get('versao') == VERSAO_INDICE and meta.get('particoes') == PARTICOES:
+            arquivos.append(dict(meta, pasta=os.path.join(base, nome)))
+    return arquivos
+
+def assinatura_carga(carga, entidade, excluir=None, pasta=PASTA_CARGAS_PADRAO):
+    """O que identifica o estado da carga para o cache de resultados (arquivos + data da gravação)."""
+    if not carga: return None
+    return (carga, *((a['arquivo'], a['gravado_em']) for a in arquivos_da_carga(carga, entidade, pasta)
+                     if a['arquivo'] != excluir))
+
+def remover_da_carga(carga, entidade, arquivo, pasta=PASTA_CARGAS_PADRAO):
+    """Tira um arquivo da carga (ex.: enviado por engano): as chaves dele deixam de contar."""
+    shutil.rmtree(os.path.join(pasta_carga(carga, entidade, pasta), nome_seguro(arquivo)), ignore_errors=True)
+
+class DetectorDuplicidades:
+    """
+    Junta as chaves de um arquivo (bloco a bloco, via `observar`) e devolve, em `erros`,
+    as ocorrências repetidas no arquivo e, com `carga`, as que já existem em outro arquivo
+    da carga (gravando o índice deste). Com `consultar_carga=False` o índice é gravado mas a
+    consulta aos outros arquivos fica para erros_na_carga.
+    Use como `with DetectorDuplicidades(...) as detector:`.
+    """
+
+    def __init__(self, colunas, entidade, carga=None, arquivo=None, pasta=PASTA_CARGAS_PADRAO,
+                 limite=LIMITE_CHAVES_MEMORIA, consultar_carga=True):
+        self.colunas, self.entidade, self.carga, self.pasta, self.limite = list(colunas), entidade, carga, pasta, limite
+        self.consultar_carga = consultar_carga
+        self.arquivo = arquivo or 'arquivo'
+        self._pedacos = {c: [[] for _ in range(PARTICOES)] for c in self.colunas}
+        self._em_memoria, self._despejo = 0, None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.fechar()
+        return False
+
+    def fechar(self):
+        if self._despejo: shutil.rmtree(self._despejo, ignore_errors=True)
+        self._despejo = None
+
+    def observar(self, df):
+        """Registra as chaves de um DataFrame corrigido (a linha vem do índice: índice + 2)."""
+        linhas = (df.index.to_numpy() + 2).astype(np.int32)
+        for coluna in self.colunas:
+            if coluna not in df.columns: continue
+            valores = como_texto(df[coluna]).str.strip().to_numpy(dtype=object)
+            preenchidos = np.flatnonzero(valores != '')
+            if not len(preenchidos): continue
+            valores = valores[preenchidos]
+            particao = pd.util.hash_array(valores) % PARTICOES
+            ordem = np.argsort(particao, kind='stable')  # estável: a linha segue crescente em cada partição
+            cortes = np.searchsorted(particao[ordem], np.arange(PARTICOES + 1))
+            chaves = np.char.encode(valores[ordem].astype(str), 'utf-8')
+            linhas_chaves = linhas[preenchidos][ordem]
+            for k in np.flatnonzero(np.diff(cortes)):
+                self._pedacos[coluna][k].append((chaves[cortes[k]:cortes[k + 1]], linhas_chaves[cortes[k]:cortes[k + 1]]))
+            self._em_memoria += len(valores)
+        if self._em_memoria > self.limite: self._despejar()
+
+    def _despejar(self):
+        if self._despejo is None: self._despejo = tempfile.mkdtemp(prefix='duplicidades_')
+        for coluna, particoes in self._pedacos.items():
+            for k, pedacos in enumerate(particoes):
+                if not pedacos: continue
+                with open(os.path.join(self._despejo, f'{nome_seguro(coluna)}.{k}.bin'), 'ab') as f:
+                    for chaves, linhas in pedacos:
+                        np.save(f, chaves, allow_pickle=False)
+                        np.save(f, linhas, allow_pickle=False)
+                pedacos.clear()
+        self._em_memoria = 0
+
+    def _particao(self, coluna, k):
+        """(chaves, linhas) da partição k, na ordem do arquivo."""
+        pedacos = []
+        if self._despejo:
+            caminho = os.path.join(self._despejo, f'{nome_seguro(coluna)}.{k}.bin')
+            if os.path.exists(caminho):
+                with open(caminho, 'rb') as f:
+                    while f.peek(1):
+                        pedacos.append((np.load(f), np.load(f)))
+        pedacos += self._pedacos[coluna][k]
+        if not pedacos: return np.array([], dtype='S1'), np.array([], dtype=np.int32)
+        return np.concatenate([c for c, _ in pedacos]), np.concatenate([l for _, l in pedacos])
+
+    def erros(self, colunas_erro):
+        """TabelaErros (ordenada por linha) com todas as ocorrências de chave duplicada."""
+        with etapa('duplicidades'):
+            achados = []
+            gravacao = self._iniciar_gravacao() if self.carga else None
+            for posicao, coluna in enumerate(self.colunas):
+                for k in range(PARTICOES):
+                    chaves, linhas = self._particao(coluna, k)
+                    if not len(chaves):
+                        if gravacao: gravacao.adicionar(coluna, k, chaves, linhas, linhas, linhas)
+                        continue
+                    unicas, primeira, inversa, contagem = np.unique(chaves, return_index=True, return_inverse=True,
+                                                                    return_counts=True)
+                    if gravacao:
+                        # estável: as ocorrências de cada chave ficam na ordem do arquivo
+                        gravacao.adicionar(coluna, k, unicas, linhas[primeira], linhas[np.argsort(inversa, kind='stable')], contagem)
+                    repetidas = np.flatnonzero(contagem[inversa] > 1)
+                    if not len(repetidas): continue
+                    grupo = inversa[repetidas]
+                    primeira_linha, total = linhas[primeira[grupo]], contagem[grupo]
+                    e_primeira = linhas[repetidas] == primeira_linha
+                    mensagens = [f"Duplicado no arquivo: primeira de {n} ocorrências." if p else
+                                 f"Duplicado no arquivo: repete a linha {l}."
+                                 for p, n, l in zip(e_primeira.tolist(), total.tolist(), primeira_linha.tolist())]
+                    achados.append((linhas[repetidas], posicao, coluna, chaves[repetidas], mensagens))
+            if gravacao:
+                gravacao.publicar()
+                if self.consultar_carga: achados += _achados_na_carga(self.carga, self.entidade, self.arquivo, self.colunas, self.pasta)
+            erros = _montar_erros(achados, colunas_erro)
+        contar('chaves_duplicadas', len(erros))
+        return erros
+
+    def _iniciar_gravacao(self):
+        return _GravacaoIndice(pasta_carga(self.carga, self.entidade, self.pasta), self.arquivo,
+                               {'versao': VERSAO_INDICE, 'particoes': PARTICOES, 'entidade': self.entidade,
+                                'carga': self.carga, 'arquivo': self.arquivo})
+
+def erros_na_carga(carga, entidade, arquivo, colunas, colunas_erro, pasta=PASTA_CARGAS_PADRAO):
+    """
+    TabelaErros com as ocorrências de `arquivo` (já gravado na carga) cujas chaves existem em
+    outro arquivo da carga. Complementa um DetectorDuplicidades criado com `consultar_carga=False`.
+    """
+    with etapa('duplicidades'):
+        erros = _montar_erros(_achados_na_carga(carga, entidade, arquivo, list(colunas), pasta), colunas_erro)
+    contar('chaves_duplicadas', len(erros))
+    return erros
+
+def _achados_na_carga(carga, entidade, arquivo, colunas, pasta):
+    """Ocorrências do arquivo cujas chaves já existem em outro arquivo da carga (pelos índices gravados)."""
+    achados = []
+    outros = [a for a in arquivos_da_carga(carga, entidade, pasta) if a['arquivo'] != arquivo]
+    if not outros: return achados
+    proprio = os.path.join(pasta_carga(carga, entidade, pasta), nome_seguro(arquivo))
+    for posicao, coluna in enumerate(colunas):
+        indice = _abrir_indice(proprio, coluna)
+        if indice is None: continue
+        for outro in outros:
+            indice_outro = _abrir_indice(outro['pasta'], coluna)
+            if indice_outro is None: continue
+            for k in range(PARTICOES):
+                inicio = indice['inicio'][k]
+                unicas = indice['chaves'][inicio:indice['inicio'][k + 1]]
+                existentes = indice_outro['chaves'][indice_outro['inicio'][k]:indice_outro['inicio'][k + 1]]
+                if not len(unicas) or not len(existentes): continue
+                pos = np.minimum(np.searchsorted(existentes, unicas), len(existentes) - 1)
+                achou = np.flatnonzero(existentes[pos] == unicas)
+                if not len(achou): continue
+                # Todas as ocorrências das chaves em comum (faixas de 'ocorrencias')
+                comeco, fim = indice['posicoes'][inicio + achou], indice['posicoes'][inicio + achou + 1]
+                quantas = fim - comeco
+                sel = np.repeat(comeco - np.cumsum(quantas) + quantas, quantas) + np.arange(quantas.sum())
+                linha_outro = np.asarray(indice_outro['linhas'][indice_outro['inicio'][k]:][pos[achou]])
+                mensagens = [f"Duplicado na carga '{carga}': já existe em {outro['arquivo']} (linha {l})."
+                             for l in np.repeat(linha_outro, quantas).tolist()]
+                achados.append((np.asarray(indice['ocorrencias'][sel]), posicao, coluna,
+                                np.repeat(np.asarray(unicas[achou]), quantas), mensagens))
+    return achados
+
+def _montar_erros(achados, colunas_erro):
+    """TabelaErros a partir de (linhas, posição da coluna, coluna, chaves, mensagens), ordenada por linha."""
+    if not achados: return TabelaErros.vazia(colunas_erro)
+    linhas = np.concatenate([a[0] for a in achados])
+    # Mesma linha: na ordem das colunas e, dentro da coluna, arquivo antes de carga
+    ordem = np.lexsort((np.repeat(np.arange(len(achados)), [len(a[0]) for a in achados]), linhas))
+    valores = np.concatenate([np.char.decode(a[3], 'utf-8').astype(object) for a in achados])
+    total = len(linhas)
+    return TabelaErros.de_colunas({
+        "linha": linhas[ordem],
+        "coluna": np.concatenate([np.full(len(a[0]), a[2], dtype=object) for a in achados])[ordem],
+        "valor_encontrado": valores[ordem],
+        "valor_corrigido": np.full(total, '', dtype=object),
+        "erro": np.concatenate([np.array(a[4], dtype=object) for a in achados])[ordem],
+        "corrigido": np.zeros(total, dtype=bool),
+    }, colunas_erro)
+
+class _GravacaoIndice:
+    """Grava o índice de um arquivo partição a partição e publica tudo de uma vez (os.replace)."""
+
+    def __init__(self, base, arquivo, meta):
+        self.destino, self.meta = os.path.join(base, nome_seguro(arquivo)), meta
+        self.temporaria = f'{self.destino}.{_sufixo_temporario()}'
+        os.makedirs(self.temporaria, exist_ok=True)
+        self.tamanhos = {}
+
+    def adicionar(self, coluna, k, unicas, linhas, ocorrencias, contagem):
+        """Partição k: chaves distintas, a primeira linha de cada uma e todas as linhas, agrupadas por chave."""
+        prefixo = os.path.join(self.temporaria, f'{nome_seguro(coluna)}.{k}')
+        np.save(f'{prefixo}.chaves.npy', unicas, allow_pickle=False)
+        np.save(f'{prefixo}.linhas.npy', linhas.astype(np.int32), allow_pickle=False)
+        np.save(f'{prefixo}.ocorrencias.npy', ocorrencias.astype(np.int32), allow_pickle=False)
+        np.save(f'{prefixo}.contagem.npy', contagem.astype(np.int64), allow_pickle=False)
+        self.tamanhos.setdefault(coluna, []).append((len(unicas), unicas.dtype.itemsize, len(ocorrencias)))
+
+    def publicar(self):
+        # Junta as partições num array por coluna (largura = a maior chave), uma por vez
+        for coluna, tamanhos in self.tamanhos.items():
+            nome = nome_seguro(coluna)
+            inicio = np.concatenate([[0], np.cumsum([n for n, _, _ in tamanhos])]).astype(np.int64)
+            inicio_ocorrencias = np.concatenate([[0], np.cumsum([n for _, _, n in tamanhos])]).astype(np.int64)
+            largura = max(max(w for _, w, _ in tamanhos), 1)
+            novo = lambda campo, dtype, tamanho: np.lib.format.open_memmap(
+                os.path.join(self.temporaria, f'{nome}.{campo}.npy'), mode='w+', dtype=dtype, shape=(int(tamanho),))
+            chaves, linhas = novo('chaves', f'S{largura}', inicio[-1]), novo('linhas', np.int32, inicio[-1])
+            ocorrencias, posicoes = novo('ocorrencias', np.int32, inicio_ocorrencias[-1]), novo('posicoes', np.int64, inicio[-1] + 1)
+            posicoes[0] = 0
+            for k in range(len(tamanhos)):
+                prefixo = os.path.join(self.temporaria, f'{nome}.{k}')
+                chaves[inicio[k]:inicio[k + 1]] = np.load(f'{prefixo}.chaves.npy')
+                linhas[inicio[k]:inicio[k + 1]] = np.load(f'{prefixo}.linhas.npy')
+                ocorrencias[inicio_ocorrencias[k]:inicio_ocorrencias[k + 1]] = np.load(f'{prefixo}.ocorrencias.npy')
+                posicoes[inicio[k] + 1:inicio[k + 1] + 1] = inicio_ocorrencias[k] + np.cumsum(np.load(f'{prefixo}.contagem.npy'))
+                for campo in ('chaves', 'linhas', 'ocorrencias', 'contagem'): os.remove(f'{prefixo}.{campo}.npy')
+            for array in (chaves, linhas, ocorrencias, posicoes): array.flush()
+            del chaves, linhas, ocorrencias, posicoes
+            np.save(os.path.join(self.temporaria, f'{nome}.inicio.npy'), inicio, allow_pickle=False)
+        self.meta.update(gravado_em=datetime.datetime.now().isoformat(timespec='microseconds'),
+                         chaves={coluna: int(sum(n for n, _, _ in t)) for coluna, t in self.tamanhos.items()})
+        with open(os.path.join(self.temporaria, 'arquivo.json'), 'w', encoding='utf-8') as f:
+            json.dump(self.meta, f, ensure_ascii=False)
+        shutil.rmtree(self.destino, ignore_errors=True)
+        os.replace(self.temporaria, self.destino)
+
+def _abrir_indice(pasta, coluna):
+    nome = nome_seguro(coluna)
+    try:
+        return {campo: np.load(os.path.join(pasta, f'{nome}.{campo}.npy'), mmap_mode='r')
+                for campo in ('chaves', 'linhas', 'inicio', 'ocorrencias', 'posicoes')}
+    except (OSError, ValueError):
+        return None
+
+def adicionar_duplicidades(resultado, colunas, entidade, carga=None, arquivo=None, grupos_desativados=(),
+                           progresso=None, pasta=PASTA_CARGAS_PADRAO):
+    """
+    Junta aos erros de um validador (erros, df_corrigido) os de chave duplicada em `colunas`,
+    na ordem das linhas. Erro crítico ou grupo 'duplicidades' desativado: devolve como veio.
+    """
+    erros, df_corrigido = resultado
+    if df_corrigido is None or GRUPO_DUPLICIDADES in grupos_desativados: return resultado
+    if progresso: progresso('duplicidades')
+    with DetectorDuplicidades(colunas, entidade, carga, arquivo, pasta) as detector:
+        detector.observar(df_corrigido)
+        duplicados = detector.erros(erros.colunas)
+    if not len(duplicados): return resultado
+    juntos = TabelaErros.concatenar([erros, duplicados])
+    ordem = np.argsort(juntos.df['linha'].to_numpy(), kind='stable')
+    return TabelaErros(juntos.df.iloc[ordem], juntos.colunas), df_corrigido
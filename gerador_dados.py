@@ -0,0 +1,265 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from validador_de_parceiro import PESOS_CNPJ, PESOS_CPF
+from validador_de_produto import DOMINIO_UNIDADE, DOMINIO_USOPROD, MAP_UNIDADES
+
+# --- Gerador de Dados Sintéticos (ERP) ---
+# Arquivos de parceiros, produtos, estoque e mestre de produtos com a sujeira que as
+# exportações reais trazem: CPF/CNPJ válidos, formatados, com dígito errado ou tamanho
+# errado; cidades sorteadas de cidades1.csv/cidades2.csv com grafias variadas (caixa,
+# espaços, erro de digitação); S/N escritos de todo jeito; NCM em vários formatos;
+# unidades por extenso (MAP_UNIDADES); preços com R$ e milhar; códigos fora do mestre.
+#
+# Tudo é sorteado com numpy em blocos de LINHAS_POR_BLOCO, cada bloco com a semente
+# (semente, nº do bloco): o mesmo (entidade, linhas, semente) gera o mesmo arquivo em
+# qualquer máquina. Encodings como nos ERPs: parceiros em UTF-8 com BOM, produtos em
+# latin-1, estoque/mestre em UTF-8.
+
+PASTA = os.path.dirname(os.path.abspath(__file__))
+VERSAO_GERADOR = 1  # mude ao alterar os sorteios: o nome do arquivo gerado muda junto
+LINHAS_POR_BLOCO = 250_000
+ENCODINGS = {'parceiros': 'utf-8-sig', 'produtos': 'latin-1', 'estoque': 'utf-8', 'mestre': 'utf-8'}
+
+VARIACOES_SIM_NAO = (['S', 'N', 'SIM', 'NÃO', 'NAO', 'YES', 'NO', '1', '0', 's', 'n', 'Sim', 'Não', 'nao', ' S ', 'x', ''],
+                     [30, 30, 4, 2, 3, 2, 2, 3, 3, 4, 4, 3, 2, 2, 2, 1, 2])
+PALAVRAS_NOME = ['SILVA', 'SOUZA', 'OLIVEIRA', 'SANTOS', 'PEREIRA', 'LIMA', 'COSTA', 'RIBEIRO', 'ALMEIDA', 'CARVALHO',
+                 'GOMES', 'MARTINS', 'ARAÚJO', 'BARBOSA', 'ROCHA', 'DIAS', 'NASCIMENTO', 'MOREIRA', 'CONCEIÇÃO', 'MENDES']
+PALAVRAS_ATIVIDADE = ['COMERCIO', 'DISTRIBUIDORA', 'TRANSPORTES', 'CONSTRUÇÕES', 'ALIMENTOS', 'MATERIAIS', 'SERVIÇOS',
+                      'AGROPECUARIA', 'INDUSTRIA', 'CONFECÇÕES', 'AUTO PEÇAS', 'FARMACIA', 'MERCADO', 'TECNOLOGIA']
+SUFIXOS_EMPRESA = ['LTDA', 'LTDA ME', 'EIRELI', 'S/A', 'ME', 'EPP', '']
+PRODUTOS = ['Parafuso', 'Porca', 'Arruela', 'Cabo', 'Tubo', 'Conexão', 'Luva', 'Registro', 'Torneira', 'Fita',
+            'Lâmpada', 'Tomada', 'Disjuntor', 'Tinta', 'Pincel', 'Lixa', 'Cimento', 'Argamassa', 'Peça', 'Caixa']
+MEDIDAS = ['10mm', '1/2"', '3/4"', '20m', '5kg', '18L', '220V', '2,5mm²', 'nº 8', 'Grande', 'Média', 'Pequena']
+MARCAS = ['TIGRE', 'AMANCO', 'FAME', 'PIAL', 'SUVINIL', 'VOTORAN', 'GERDAU', 'TRAMONTINA', 'VONDER', 'GENÉRICA']
+
+def _normalizar(pesos):
+    pesos = np.asarray(pesos, dtype=float)
+    return pesos / pesos.sum()
+
+def _sortear(rng, opcoes, pesos, n):
+    """n textos de `opcoes` sorteados com `pesos` (array de objetos)."""
+    return np.asarray(opcoes, dtype=object)[rng.choice(len(opcoes), size=n, p=_normalizar(pesos))]
+
+def _tipos(rng, pesos, n):
+    """Sorteia, por linha, o índice da variação (0..len(pesos)-1)."""
+    return rng.choice(len(pesos), size=n, p=_normalizar(pesos))
+
+def _texto(matriz):
+    """Matriz de códigos ASCII (uma linha por valor) -> array de textos."""
+    matriz = np.ascontiguousarray(matriz, dtype=np.uint8)
+    return matriz.view(f'S{matriz.shape[1]}').ravel().astype(str).astype(object)
+
+def _digitos(rng, n, tamanho):
+    return rng.integers(0, 10, (n, tamanho), dtype=np.int64)
+
+def _com_verificadores(base, pesos):
+    """Acrescenta os dígitos verificadores (módulo 11) de CPF/CNPJ a uma matriz de dígitos."""
+    for p in pesos:
+        resto = (base[:, :len(p)] @ p) % 11
+        base = np.column_stack([base, np.where(resto < 2, 0, 11 - resto)])
+    return base
+
+def _codigos(digitos):
+    return digitos + 48
+
+def _mascarar(digitos, posicoes, separadores):
+    return np.insert(digitos + 48, posicoes, [ord(s) for s in separadores], axis=1)
+
+def _numeros_br(valores, milhar=True):
+    """1234.5 -> '1.234,50' (ou '1234,50')."""
+    formato = '{:,.2f}' if milhar else '{:.2f}'
+    return np.array([formato.format(v).replace(',', '_').replace('.', ',').replace('_', '.') for v in valores], dtype=object)
+
+def _escolher(tipos, variacoes):
+    """
+    Valor da variação sorteada em cada linha. Cada variação é um texto fixo, um array de
+    textos, uma matriz de códigos ASCII ou uma função das posições sorteadas; matrizes e
+    funções só viram texto nas linhas que as sortearam.
+    """
+    saida = np.empty(len(tipos), dtype=object)
+    for i, valores in enumerate(variacoes):
+        sel = np.flatnonzero(tipos == i)
+        if callable(valores): saida[sel] = valores(sel)
+        elif isinstance(valores, np.ndarray): saida[sel] = _texto(valores[sel]) if valores.ndim == 2 else valores[sel]
+        else: saida[sel] = valores
+    return saida
+
+def _reais(valores):
+    return lambda sel: 'R$ ' + _numeros_br(valores[sel])
+
+def _inteiros(valores, prefixo=''):
+    return lambda sel: prefixo + np.floor(valores[sel]).astype(np.int64).astype(str).astype(object)
+
+# --- Mestres de cidades/UF (para sortear endereços reais) ---
+def _cidades():
+    leitura = dict(sep=';', dtype=str, encoding='utf-8-sig', keep_default_na=False)
+    estados = pd.read_csv(os.path.join(PASTA, 'estados.csv'), usecols=['CODUF', 'UF', 'DESCRICAO'], **leitura)
+    estados = estados[estados['UF'].str.fullmatch(r'[A-Z]{2}') & (estados['UF'] != 'EX')]
+    cidades = pd.concat([pd.read_csv(os.path.join(PASTA, nome), usecols=['UF', 'NOMECID'], **leitura)
+                         for nome in ('cidades1.csv', 'cidades2.csv')])
+    cidades = cidades.merge(estados, left_on='UF', right_on='CODUF', suffixes=('_cod', ''))
+    cidades = cidades[cidades['NOMECID'].str.len() > 3].drop_duplicates(['NOMECID', 'UF'])
+    return cidades['NOMECID'].to_numpy(dtype=object), cidades['UF'].to_numpy(dtype=object), cidades['DESCRICAO'].to_numpy(dtype=object)
+
+def _com_erro_digitacao(nome, posicao):
+    i = 1 + posicao % (len(nome) - 2)
+    return nome[:i] + nome[i + 1:]
+
+# --- Parceiros ---
+def gerar_parceiros(rng, inicio, n, cidades):
+    nomes_cidade, ufs, nomes_uf = cidades
+    pessoa_fisica = rng.random(n) < 0.6
+
+    cpf, cnpj = _com_verificadores(_digitos(rng, n, 9), PESOS_CPF), _com_verificadores(_digitos(rng, n, 12), PESOS_CNPJ)
+    cpf_errado, cnpj_errado = cpf.copy(), cnpj.copy()
+    cpf_errado[:, -1] = (cpf_errado[:, -1] + rng.integers(1, 10, n)) % 10
+    cnpj_errado[:, -1] = (cnpj_errado[:, -1] + rng.integers(1, 10, n)) % 10
+    repetido = np.repeat(rng.integers(0, 10, (n, 1)), 14, axis=1)
+
+    def _documento(fisica):
+        digitos, errado, mascara = (cpf, cpf_errado, ([3, 6, 9], '..-')) if fisica else (cnpj, cnpj_errado, ([2, 5, 8, 12], '../-'))
+        outro = cnpj if fisica else cpf
+        tamanho = digitos.shape[1]
+        return [_codigos(digitos), _mascarar(digitos, *mascara), _codigos(errado), _codigos(repetido[:, :tamanho]),
+                _codigos(digitos[:, :-1]), '', _codigos(outro)]
+
+    # válido, válido formatado, dígito errado, repetido, tamanho errado, vazio, documento do outro tipo
+    pesos_documento = [55, 20, 8, 3, 5, 4, 5]
+    tipo_documento = _tipos(rng, pesos_documento, n)
+    documento = np.where(pessoa_fisica, _escolher(np.where(pessoa_fisica, tipo_documento, -1), _documento(True)),
+                         _escolher(np.where(pessoa_fisica, -1, tipo_documento), _documento(False)))
+    tipo_pessoa = np.where(pessoa_fisica, _sortear(rng, ['F', 'f', ' F ', 'FISICA', '', 'X'], [85, 6, 3, 2, 2, 2], n),
+                           _sortear(rng, ['J', 'j', ' J', 'JURIDICA', '', 'X'], [85, 6, 3, 2, 2, 2], n))
+
+    ids = np.array([f'P{i:09d}' for i in range(inicio, inicio + n)], dtype=object)
+    repetir = rng.random(n) < 0.005  # alguns IDs duplicados, como em exportações reais
+    ids[repetir] = ids[rng.integers(0, n, int(repetir.sum()))]
+    ids[rng.random(n) < 0.01] = ''
+
+    sobrenome, atividade = _sortear(rng, PALAVRAS_NOME, np.ones(len(PALAVRAS_NOME)), n), _sortear(rng, PALAVRAS_ATIVIDADE, np.ones(len(PALAVRAS_ATIVIDADE)), n)
+    razao = atividade + ' ' + sobrenome + ' ' + _sortear(rng, SUFIXOS_EMPRESA, [30, 10, 10, 10, 15, 10, 15], n)
+    nome = np.where(rng.random(n) < 0.03, '', atividade + ' ' + sobrenome)
+
+    cidade = rng.integers(0, len(nomes_cidade), n)
+    grafias = [nomes_cidade, np.array([c.title() for c in nomes_cidade], dtype=object),
+               np.array([c.lower() for c in nomes_cidade], dtype=object),
+               np.array([f'  {c} ' for c in nomes_cidade], dtype=object),
+               np.array([_com_erro_digitacao(c, i) for i, c in enumerate(nomes_cidade)], dtype=object)]
+    tipo_cidade = _tipos(rng, [62, 10, 6, 5, 8, 3, 6], n)
+    nome_cidade = _escolher(tipo_cidade, [g[cidade] for g in grafias] + ['CIDADE INEXISTENTE', ''])
+    uf = _escolher(_tipos(rng, [76, 8, 4, 4, 3, 5], n),
+                   [ufs[cidade], np.array([u.lower() for u in ufs], dtype=object)[cidade],
+                    np.array([f' {u} ' for u in ufs], dtype=object)[cidade], nomes_uf[cidade], 'XX', ''])
+
+    cep = _digitos(rng, n, 8)
+    cep = _escolher(_tipos(rng, [50, 30, 5, 5, 7, 3], n),
+                    [_mascarar(cep, [5], '-'), _codigos(cep), _mascarar(cep, [2, 5], '.-'), _codigos(cep[:, :7]), '', 'SEM CEP'])
+
+    limite = np.round(rng.gamma(2.0, 5_000.0, n), 2)
+    limite = _escolher(_tipos(rng, [35, 25, 15, 10, 10, 5], n),
+                       [_reais(limite), lambda sel: _numeros_br(limite[sel]), lambda sel: limite[sel].astype(str).astype(object),
+                        _inteiros(limite), '', 'A COMBINAR'])
+
+    return pd.DataFrame({
+        'CGC_CPF': documento, 'AD_IDEXTERNO': ids, 'RAZAO_SOCIAL': razao, 'NOMEPARC': nome, 'TIPPESSOA': tipo_pessoa,
+        'ATIVO': _sortear(rng, *VARIACOES_SIM_NAO, n), 'CLIENTE': _sortear(rng, *VARIACOES_SIM_NAO, n),
+        'FORNECEDOR': _sortear(rng, *VARIACOES_SIM_NAO, n), 'CEP': cep, 'CIDADE': nome_cidade, 'UF': uf, 'LIMITECREDITO': limite,
+    })
+
+# --- Produtos ---
+def _precos(rng, n):
+    preco = np.round(rng.lognormal(3.5, 1.2, n), 2)
+    return _escolher(_tipos(rng, [35, 25, 15, 8, 2, 10, 5], n),
+                     [_reais(preco), lambda sel: _numeros_br(preco[sel]), lambda sel: _numeros_br(preco[sel], milhar=False),
+                      lambda sel: preco[sel].astype(str).astype(object), lambda sel: '-' + _numeros_br(preco[sel]), '', 'CONSULTAR'])
+
+def gerar_produtos(rng, inicio, n):
+    ncm = _digitos(rng, n, 8)
+    ncm = _escolher(_tipos(rng, [40, 35, 5, 5, 5, 3, 5, 2], n),
+                    [_mascarar(ncm, [4, 6], '..'), _codigos(ncm), _mascarar(ncm, [4], '.'), _mascarar(ncm, [0, 4, 6, 8], ' -- '),
+                     _codigos(ncm[:, :6]), _mascarar(ncm, [4, 6], '//'), '', 'ABCD1234'])
+
+    dominio, extenso = sorted(DOMINIO_UNIDADE), sorted(MAP_UNIDADES)
+    unidade = _escolher(_tipos(rng, [60, 20, 5, 8, 4, 3], n),
+                        [_sortear(rng, dominio, np.ones(len(dominio)), n), _sortear(rng, extenso, np.ones(len(extenso)), n),
+                         _sortear(rng, [e.title() for e in extenso], np.ones(len(extenso)), n),
+                         _sortear(rng, [d.lower() for d in dominio], np.ones(len(dominio)), n), 'PACOTE', ''])
+    uso = sorted(DOMINIO_USOPROD)
+    usoprod = _escolher(_tipos(rng, [80, 10, 5, 5], n),
+                        [_sortear(rng, uso, np.ones(len(uso)), n), _sortear(rng, [u.lower() for u in uso], np.ones(len(uso)), n), 'Z', ''])
+
+    ids = np.array([f'PR{i:08d}' for i in range(inicio, inicio + n)], dtype=object)
+    ids[rng.random(n) < 0.01] = ''
+    descricao = (_sortear(rng, PRODUTOS, np.ones(len(PRODUTOS)), n) + ' ' + _sortear(rng, MEDIDAS, np.ones(len(MEDIDAS)), n)
+                 + ' ' + _sortear(rng, MARCAS, np.ones(len(MARCAS)), n))
+    descricao[rng.random(n) < 0.02] = ''
+
+    return pd.DataFrame({
+        'AD_IDEXTERNO': ids, 'DESCRPROD': descricao, 'NCM': ncm, 'MARCA': _sortear(rng, MARCAS, np.ones(len(MARCAS)), n),
+        'REFERENCIA': np.array([f'REF-{v}' for v in rng.integers(0, 100_000, n)], dtype=object), 'UNIDADE': unidade,
+        'PRECO_VENDA': _precos(rng, n), 'PRECO_CUSTO': _precos(rng, n), 'USOPROD': usoprod,
+        **{col: _sortear(rng, *VARIACOES_SIM_NAO, n) for col in ('ATIVO', 'TEMIPICOMPRA', 'TEMIPIVENDA', 'USACODBARRASQTD')},
+    })
+
+# --- Estoque e mestre de produtos ---
+def linhas_mestre(linhas_estoque):
+    return max(1_000, linhas_estoque // 2)
+
+def _codigo_produto(valores):
+    return np.array([f'{v:07d}' for v in valores], dtype=object)
+
+def gerar_mestre(rng, inicio, n):
+    return pd.DataFrame({'CODPROD': _codigo_produto(np.arange(inicio, inicio + n)),
+                         'DESCRPROD': _sortear(rng, PRODUTOS, np.ones(len(PRODUTOS)), n)})
+
+def _quantidades(rng, n):
+    valor = np.round(rng.gamma(1.5, 800.0, n), 1)
+    return _escolher(_tipos(rng, [45, 25, 10, 5, 3, 7, 5], n),
+                     [_inteiros(valor), lambda sel: _numeros_br(valor[sel]), lambda sel: valor[sel].astype(str).astype(object),
+                      _inteiros(valor, ' '), _inteiros(valor, '-'), '', 'abc'])
+
+def gerar_estoque(rng, inicio, n, tamanho_mestre):
+    codigo = _codigo_produto(rng.integers(0, tamanho_mestre, n))
+    codigo = _escolher(_tipos(rng, [88, 4, 5, 3], n),
+                       [codigo, lambda sel: ' ' + codigo[sel],
+                        _codigo_produto(rng.integers(tamanho_mestre, 10 * tamanho_mestre + 10, n)), ''])
+    return pd.DataFrame({
+        'CODPROD': codigo, 'ESTOQUE': _quantidades(rng, n), 'ESTMIN': _quantidades(rng, n), 'ESTMAX': _quantidades(rng, n),
+        'ATIVO': _sortear(rng, ['S', 'N', 'SIM', 'Ativo', 'inativo', 'NÃO', '1', 'x', ''], [40, 15, 10, 8, 7, 5, 5, 5, 5], n),
+        'TIPO': _sortear(rng, ['P', 'T', 'PROPRIO', 'Próprio', 'Terceiros', 'p', 'Z', ''], [45, 20, 8, 7, 7, 5, 4, 4], n),
+    })
+
+# --- Arquivos ---
+def caminho_gerado(entidade, linhas, semente, pasta):
+    return os.path.join(pasta, f'{entidade}_{linhas}_s{semente}_g{VERSAO_GERADOR}.csv')
+
+def gerar_arquivo(entidade, linhas, semente, pasta):
+    """
+    Caminho do CSV sintético de `entidade` ('parceiros', 'produtos', 'estoque' ou 'mestre')
+    com `linhas` linhas, gerando-o só se ainda não existe. Para 'estoque', o mestre
+    correspondente é gerado junto (ver caminho_gerado('mestre', linhas_mestre(linhas), ...)).
+    """
+    caminho = caminho_gerado(entidade, linhas, semente, pasta)
+    if entidade == 'estoque': gerar_arquivo('mestre', linhas_mestre(linhas), semente, pasta)
+    if os.path.exists(caminho): return caminho
+
+    os.makedirs(pasta, exist_ok=True)
+    cidades = _cidades() if entidade == 'parceiros' else None
+    temporario = f'{caminho}.{os.getpid()}.tmp'
+    try:
+        with open(temporario, 'w', encoding=ENCODINGS[entidade], errors='replace', newline='') as arquivo:
+            for bloco, inicio in enumerate(range(0, linhas, LINHAS_POR_BLOCO)):
+                rng = np.random.default_rng([semente, bloco])
+                n = min(LINHAS_POR_BLOCO, linhas - inicio)
+                if entidade == 'parceiros': df = gerar_parceiros(rng, inicio, n, cidades)
+                elif entidade == 'produtos': df = gerar_produtos(rng, inicio, n)
+                elif entidade == 'estoque': df = gerar_estoque(rng, inicio, n, linhas_mestre(linhas))
+                else: df = gerar_mestre(rng, inicio, n)
+                df.to_csv(arquivo, sep=';', index=False, header=bloco == 0)
+        os.replace(temporario, caminho)
+    finally:
+        if os.path.exists(temporario): os.remove(temporario)
+    return caminho
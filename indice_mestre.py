@@ -0,0 +1,297 @@
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import pandas as pd
+
+# --- Índices de Mestres (arrays ordenados + snapshot em disco) ---
+# Um índice é um dict {'chaves': array ordenado, 'codigos': array alinhado}. A busca é
+# um np.searchsorted sobre os valores distintos da coluna — sem dict Python por chave,
+# então mestres grandes (ex.: tabela completa de municípios + distritos do IBGE) não
+# pesam na inicialização.
+#
+# O snapshot grava os arrays como .npy (lidos com mmap, sem parse) numa pasta de cache.
+# O manifesto guarda mtime/tamanho e o hash SHA-256 de cada arquivo-fonte: se o mtime
+# mudar mas o conteúdo não, só o manifesto é atualizado; se o conteúdo mudar, o snapshot
+# é recompilado. Sem permissão de escrita, o índice é montado direto dos CSVs, em memória.
+# Fontes em memória (bytes ou buffer de upload) não têm mtime: vão direto para o hash.
+# O código que monta o índice também entra na chave (impressao_codigo das funções de
+# `codigo`): mudar a limpeza dos nomes ou o formato dos arrays recompila o snapshot.
+
+VERSAO_SNAPSHOT = 1
+PASTA_CACHE_PADRAO = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache_mestre')
+# Digest do conteúdo de cada snapshot carregado neste processo (nome -> digest): versão dos mestres
+_DIGESTS_CARREGADOS = {}
+
+def montar_indice(chaves, codigos):
+    """Monta o índice a partir de duas Series alinhadas. Chave repetida: vale a última (como no to_dict)."""
+    serie = pd.Series(codigos.fillna('').astype(str).to_numpy(), index=chaves.astype(str).to_numpy())
+    serie = serie[~serie.index.duplicated(keep='last')].sort_index()
+    return {'chaves': np.array(serie.index.tolist(), dtype=str), 'codigos': np.array(serie.tolist(), dtype=str)}
+
+def montar_conjunto(valores):
+    """Conjunto de códigos como array ordenado de bytes UTF-8 (1 byte por caractere, contra 4
+    do dtype str; mestres com milhões de códigos ficam compactos e abrem por mmap)."""
+    unicos = pd.unique(valores.dropna().astype(str))
+    return {'chaves': np.sort(np.char.encode(np.array(unicos, dtype=str), 'utf-8')) if len(unicos) else np.array([], dtype='S1')}
+
+def contem_em_indice(serie, chaves):
+    """Teste de pertinência em lote: True onde o valor está no array ordenado `chaves`."""
+    unicos = pd.unique(serie.astype(str))
+    if not len(chaves) or not len(unicos):
+        return pd.Series(False, index=serie.index)
+    alvo = np.array(unicos, dtype=str)
+    if chaves.dtype.kind == 'S': alvo = np.char.encode(alvo, 'utf-8')
+    pos = np.minimum(np.searchsorted(chaves, alvo), len(chaves) - 1)
+    return serie.astype(str).map(dict(zip(unicos, (chaves[pos] == alvo).tolist())))
+
+# --- Índice de Códigos Hierárquicos (prefixos) ---
+# Códigos numéricos de largura fixa em que cada prefixo é um nível (NCM: capítulo = 2
+# dígitos, posição = 4, código = 8). Guardados como inteiros num array ordenado, um
+# prefixo vira uma faixa [p * 10^k, (p + 1) * 10^k): "existe algum código com esse
+# prefixo" são dois np.searchsorted, feitos só sobre os valores distintos da coluna.
+
+def montar_indice_codigos(valores, digitos):
+    """Array ordenado (int64) dos valores com exatamente `digitos` dígitos; o resto é ignorado."""
+    serie = valores.dropna().astype(str).str.strip()
+    serie = serie[serie.str.fullmatch(rf'\d{{{digitos}}}')]
+    return {'codigos': np.unique(serie.astype(np.int64).to_numpy())}
+
+def niveis_prefixo(serie, codigos, digitos, niveis):
+    """
+    Para cada valor da Series, quantos níveis seguidos de `niveis` (tamanhos de prefixo,
+    ex.: (2, 4, 8)) existem em `codigos`: 0 = nem o primeiro; len(niveis) = o código inteiro.
+    Valores que não têm exatamente `digitos` dígitos devolvem -1. Retorna um array alinhado.
+    """
+    posicoes, unicos = pd.factorize(serie.astype(str))
+    unicos = pd.Series(unicos, dtype=object).astype(str)
+    numericos = unicos.str.fullmatch(rf'\d{{{digitos}}}').to_numpy(dtype=bool)
+    valores = np.zeros(len(unicos), dtype=np.int64)
+    valores[numericos] = unicos[numericos].astype(np.int64).to_numpy()
+    nivel = np.where(numericos, 0, -1)
+    for i, tamanho in enumerate(niveis):
+        passo = 10 ** (digitos - tamanho)
+        inicio = valores // passo * passo
+        existe = np.searchsorted(codigos, inicio + passo) > np.searchsorted(codigos, inicio)
+        nivel = np.where((nivel == i) & existe, i + 1, nivel)
+    return nivel[posicoes]
+
+def indice_vazio():
+    return {'chaves': np.array([], dtype=str), 'codigos': np.array([], dtype=str)}
+
+def buscar_em_indice(serie, indice, padrao=''):
+    """Troca cada valor da Series pelo código do índice (`padrao` quando não existe)."""
+    chaves, codigos = indice['chaves'], indice['codigos']
+    unicos = pd.unique(serie.astype(str))
+    if not len(chaves) or not len(unicos):
+        return pd.Series(padrao, index=serie.index, dtype=object)
+    alvo = np.array(unicos, dtype=str)
+    pos = np.minimum(np.searchsorted(chaves, alvo), len(chaves) - 1)
+    resultado = np.where(chaves[pos] == alvo, codigos[pos], padrao)
+    return serie.astype(str).map(dict(zip(unicos, resultado.tolist())))
+
+# --- Busca Aproximada (trigramas) ---
+# Para nomes sem correspondência exata. Cada nome vira o conjunto de trigramas de
+# " NOME " e o índice guarda, para cada trigrama, as posições dos nomes que o contêm
+# ('trigramas' ordenados + 'inicio' + 'ids', no formato CSR). Uma edição destrói no
+# máximo 3 trigramas, então um nome a até k edições divide pelo menos
+# len(trigramas) - 3k deles com a consulta: o filtro não perde candidatos, e a
+# distância de edição só é calculada para os poucos que sobram.
+
+def trigramas(texto):
+    texto = f' {texto} '
+    return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+def montar_indice_trigramas(nomes):
+    """Índice invertido trigrama -> posições em `nomes` (arrays prontos para o snapshot)."""
+    pares = sorted((t, i) for i, nome in enumerate(nomes) for t in trigramas(nome))
+    tris = np.array([t for t, _ in pares], dtype=str)
+    unicos, inicio = np.unique(tris, return_index=True)
+    return {'trigramas': unicos, 'inicio': np.append(inicio, len(pares)).astype(np.int32),
+            'ids': np.array([i for _, i in pares], dtype=np.int32),
+            'tamanhos': np.array([len(nome) for nome in nomes], dtype=np.int32)}
+
+def distancia_edicao(a, b, limite):
+    """Levenshtein com corte: acima de `limite`, devolve limite + 1 sem terminar a conta."""
+    if abs(len(a) - len(b)) > limite: return limite + 1
+    anterior = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        atual = [i]
+        for j, cb in enumerate(b, 1):
+            atual.append(min(anterior[j] + 1, atual[j - 1] + 1, anterior[j - 1] + (ca != cb)))
+        if min(atual) > limite: return limite + 1
+        anterior = atual
+    return min(anterior[-1], limite + 1)
+
+def buscar_aproximado(nome, indice, nomes, limite, permitidos=None, max_candidatos=50):
+    """
+    Posição (em `nomes`) do nome mais próximo de `nome`, a até `limite` edições, ou -1.
+    `permitidos` é uma máscara booleana opcional sobre `nomes` (ex.: só cidades da UF).
+    Empate no melhor resultado conta como ambíguo (-1): melhor não corrigir do que chutar.
+    """
+    consulta = np.array(sorted(trigramas(nome)), dtype=str)
+    tris = indice['trigramas']
+    if not len(tris): return -1
+    pos = np.minimum(np.searchsorted(tris, consulta), len(tris) - 1)
+    achados = pos[tris[pos] == consulta]
+    if not len(achados): return -1
+    inicio, ids = indice['inicio'], indice['ids']
+    contagem = np.bincount(np.concatenate([ids[inicio[p]:inicio[p + 1]] for p in achados]), minlength=len(nomes))
+    ok = (contagem > 0) & (contagem >= len(consulta) - 3 * limite) & (np.abs(indice['tamanhos'] - len(nome)) <= limite)
+    if permitidos is not None: ok &= permitidos
+    candidatos = np.flatnonzero(ok)
+    if len(candidatos) > max_candidatos:
+        candidatos = candidatos[np.argsort(-contagem[candidatos], kind='stable')[:max_candidatos]]
+
+    melhor, posicao = limite + 1, -1
+    for c in candidatos:
+        d = distancia_edicao(nome, str(nomes[c]), limite)
+        if d < melhor: melhor, posicao = d, c
+        elif d == melhor and d <= limite: posicao = -1
+    return int(posicao) if melhor <= limite else -1
+
+def impressao_codigo(*objetos):
+    """Hash (16 hex) do código-fonte de funções/módulos; sem fonte disponível, vale o nome qualificado."""
+    h = hashlib.sha256()
+    for objeto in objetos:
+        try:
+            texto = inspect.getsource(objeto)
+        except (OSError, TypeError):
+            texto = f"{getattr(objeto, '__module__', '')}.{getattr(objeto, '__qualname__', repr(objeto))}"
+        h.update(texto.encode('utf-8'))
+    return h.hexdigest()[:16]
+
+def _eh_caminho(fonte):
+    return isinstance(fonte, (str, os.PathLike))
+
+def _sufixo_temporario():
+    # pid + thread: várias sessões do mesmo processo podem compilar o mesmo snapshot
+    return f'{os.getpid()}.{threading.get_ident()}.tmp'
+
+def _assinatura_rapida(fontes):
+    if not all(_eh_caminho(f) for f in fontes): return None
+    assinatura = []
+    for caminho in fontes:
+        try:
+            st = os.stat(caminho)
+            assinatura.append([caminho, st.st_mtime_ns, st.st_size])
+        except OSError:
+            assinatura.append([caminho, None, None])
+    return assinatura
+
+def _hash_fontes(fontes, codigo=''):
+    total = hashlib.sha256(f"v{VERSAO_SNAPSHOT}|{codigo}".encode())
+    for fonte in fontes:
+        h = hashlib.sha256()
+        if isinstance(fonte, (bytes, bytearray, memoryview)):
+            h.update(fonte)
+        elif hasattr(fonte, 'getbuffer'):
+            with fonte.getbuffer() as buffer: h.update(buffer)
+        elif hasattr(fonte, 'read'):
+            fonte.seek(0)
+            for bloco in iter(lambda: fonte.read(1 << 20), b''): h.update(bloco)
+            fonte.seek(0)
+        else:
+            try:
+                with open(fonte, 'rb') as f:
+                    for bloco in iter(lambda: f.read(1 << 20), b''):
+                        h.update(bloco)
+            except OSError:
+                h.update(b'<ausente>')
+            # Só o conteúdo de fontes em memória conta; de arquivos, o nome também
+            total.update(os.path.basename(fonte).encode())
+        total.update(h.digest())
+    return total.hexdigest()
+
+def _ler_snapshot(pasta):
+    arrays = {}
+    for nome in os.listdir(pasta):
+        if nome.endswith('.npy'):
+            arrays[nome[:-4]] = np.load(os.path.join(pasta, nome), mmap_mode='r')
+    return arrays
+
+def _gravar_json(caminho, dados):
+    temporario = f'{caminho}.{_sufixo_temporario()}'
+    with open(temporario, 'w', encoding='utf-8') as f:
+        json.dump(dados, f)
+    os.replace(temporario, caminho)
+
+def _limpar_antigos(pasta_cache, nome, versoes_mantidas):
+    """Apaga os snapshots de `nome` além dos `versoes_mantidas` usados mais recentemente."""
+    pastas = [os.path.join(pasta_cache, p) for p in os.listdir(pasta_cache)
+              if p.startswith(f'{nome}-') and not p.endswith('.tmp') and os.path.isdir(os.path.join(pasta_cache, p))]
+    pastas.sort(key=os.path.getmtime, reverse=True)
+    for antiga in pastas[versoes_mantidas:]:
+        shutil.rmtree(antiga, ignore_errors=True)
+
+def digest_carregado(nome):
+    """Digest (fontes + código) do último snapshot `nome` carregado neste processo; None se não carregou."""
+    return _DIGESTS_CARREGADOS.get(nome)
+
+def carregar_snapshot(nome, fontes, construir, pasta_cache=PASTA_CACHE_PADRAO, versoes_mantidas=1, codigo=()):
+    """
+    Devolve os arrays do snapshot `nome`, recompilando com `construir()` quando as fontes mudam.
+    `construir` retorna um dict nome -> np.ndarray (sem dtype object) ou levanta ValueError.
+    `codigo`: funções usadas na montagem (além de `construir`); mudou o código, recompila.
+    `versoes_mantidas` > 1 guarda os snapshots dos últimos conteúdos vistos (pasta = hash),
+    para alternar entre mestres diferentes sem recompilar.
+    Retorna: (arrays, origem) com origem 'snapshot', 'compilado' ou 'csv' (sem cache em disco).
+    """
+    caminho_manifesto = os.path.join(pasta_cache, f'{nome}.json')
+    assinatura = _assinatura_rapida(fontes)
+    versao_codigo = impressao_codigo(construir, *codigo)
+    try:
+        with open(caminho_manifesto, encoding='utf-8') as f:
+            manifesto = json.load(f)
+    except (OSError, ValueError):
+        manifesto = {}
+
+    def _usar(pasta):
+        try:
+            return _ler_snapshot(os.path.join(pasta_cache, pasta))
+        except (OSError, ValueError):
+            return None
+
+    # 1. Nada mudou (mtime + tamanho): usa o snapshot sem nem ler as fontes
+    if assinatura is not None and manifesto.get('versao') == VERSAO_SNAPSHOT and manifesto.get('assinatura') == assinatura \
+            and manifesto.get('codigo') == versao_codigo:
+        arrays = _usar(manifesto['pasta'])
+        if arrays is not None:
+            _DIGESTS_CARREGADOS[nome] = manifesto.get('digest')
+            return arrays, 'snapshot'
+
+    # 2. mtime mudou: confere o conteúdo pelo hash (a pasta do snapshot é nomeada pelo hash)
+    digest = _hash_fontes(fontes, versao_codigo)
+    pasta = f'{nome}-{digest[:16]}'
+    if os.path.isdir(os.path.join(pasta_cache, pasta)):
+        arrays = _usar(pasta)
+        if arrays is not None:
+            try:
+                os.utime(os.path.join(pasta_cache, pasta))
+                _gravar_json(caminho_manifesto, {'versao': VERSAO_SNAPSHOT, 'digest': digest, 'pasta': pasta, 'assinatura': assinatura,
+                                                  'codigo': versao_codigo})
+            except OSError: pass
+            _DIGESTS_CARREGADOS[nome] = digest
+            return arrays, 'snapshot'
+
+    # 3. Conteúdo novo: recompila e grava (ou fica só em memória se não der para gravar)
+    arrays = construir()
+    _DIGESTS_CARREGADOS[nome] = digest
+    try:
+        os.makedirs(pasta_cache, exist_ok=True)
+        temporaria = os.path.join(pasta_cache, f'{pasta}.{_sufixo_temporario()}')
+        os.makedirs(temporaria, exist_ok=True)
+        for chave, array in arrays.items():
+            np.save(os.path.join(temporaria, f'{chave}.npy'), array, allow_pickle=False)
+        shutil.rmtree(os.path.join(pasta_cache, pasta), ignore_errors=True)
+        os.replace(temporaria, os.path.join(pasta_cache, pasta))
+        _gravar_json(caminho_manifesto, {'versao': VERSAO_SNAPSHOT, 'digest': digest, 'pasta': pasta, 'assinatura': assinatura,
+                                          'codigo': versao_codigo})
+        _limpar_antigos(pasta_cache, nome, versoes_mantidas)
+        return arrays, 'compilado'
+    except OSError:
+        return arrays, 'csv'
@@ -0,0 +1,232 @@
+import contextlib
+import contextvars
+import datetime
+import importlib
+import json
+import os
+import platform
+import sys
+import time
+import uuid
+
+try:
+    import resource
+except ImportError:  # Windows: sem pico de memória do processo
+    resource = None
+
+# --- Instrumentação (manifesto de execução) ---
+# Quem dispara uma validação (tarefa do app, linha de comando, benchmark) abre uma
+# `Medicao`; enquanto ela está ativa, leitor, motor de regras e processamento em
+# blocos/lotes/paralelo registram nela, pelas funções deste módulo, o tempo de cada etapa
+# (com a memória ao final), os contadores (linhas lidas/validadas/de saída, bytes, erros)
+# e, por regra, as ocorrências e o tempo gasto. Sem Medicao ativa essas chamadas não fazem nada.
+#
+# A Medicao ativa é do contexto (contextvars): cada thread de tarefa tem a sua. Nos
+# processos do pool (ver processamento_paralelo.py) cada faixa é medida por uma Medicao
+# local, devolvida junto com o resultado e somada à do processo principal; por isso, em
+# paralelo, o tempo das etapas de validação é a soma dos núcleos (passa do tempo total).
+#
+# As etapas são caminhos: 'validacao/regras' é a parte de 'validacao' gasta nas checagens.
+# O pico de RSS é o do processo inteiro desde que ele começou (no app, inclui as
+# validações anteriores); o RSS atual ao fim de cada etapa mostra onde a memória cresce.
+#
+# Ao terminar, a Medicao monta o manifesto (dict pronto para JSON) e o publica:
+#   - nas funções registradas com `registrar_gancho(funcao)` (recebem o manifesto);
+#   - na função indicada em VALIDADOR_GANCHO_METRICAS="modulo:funcao" (carregada no 1º uso;
+#     vale também nos processos da linha de comando, que não herdam os ganchos registrados);
+#   - como arquivo JSON na pasta de VALIDADOR_MANIFESTOS, se definida.
+# Um gancho que falha só gera um aviso: nunca derruba a validação.
+
+VERSAO_MANIFESTO = 1
+VARIAVEL_PASTA = 'VALIDADOR_MANIFESTOS'
+VARIAVEL_GANCHO = 'VALIDADOR_GANCHO_METRICAS'
+
+_ATUAL = contextvars.ContextVar('medicao_atual', default=None)
+GANCHOS = []
+_GANCHO_AMBIENTE = {}
+
+def memoria_mb():
+    """(RSS atual, pico de RSS do processo) em MB; None onde o sistema não informa."""
+    atual = pico = None
+    try:
+        with open('/proc/self/statm') as arquivo:
+            atual = round(int(arquivo.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2, 1)
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KB no Linux, bytes no macOS
+        pico = round(maximo / (1024 ** 2 if sys.platform == 'darwin' else 1024), 1)
+    return atual, pico
+
+def medicao_atual():
+    return _ATUAL.get()
+
+class Medicao:
+    """Métricas de uma validação. Use como `with Medicao("parceiros.csv") as medicao: ...`."""
+
+    def __init__(self, descricao='', publicar=True, **dados):
+        self.descricao, self.dados, self.publicar = descricao, dados, publicar
+        self.etapas, self.regras, self.contadores = {}, {}, {}
+        self.situacao, self.falha, self.manifesto = 'concluida', None, None
+        self._pilha, self._token = [], None
+
+    def __enter__(self):
+        self._data = datetime.datetime.now().isoformat(timespec='seconds')
+        self._inicio = time.perf_counter()
+        self._token = _ATUAL.set(self)
+        return self
+
+    def __exit__(self, tipo, excecao, rastro):
+        _ATUAL.reset(self._token)
+        if excecao is not None:
+            self.situacao, self.falha = 'interrompida', f"{tipo.__name__}: {excecao}"
+        self.manifesto = self._montar(time.perf_counter() - self._inicio)
+        if self.publicar: publicar(self.manifesto)
+        return False
+
+    @contextlib.contextmanager
+    def etapa(self, nome):
+        self._pilha.append(nome)
+        caminho, inicio = '/'.join(self._pilha), time.perf_counter()
+        self.etapas.setdefault(caminho, {'segundos': 0.0, 'chamadas': 0})  # ordem do manifesto: a de início
+        try:
+            yield
+        finally:
+            self._pilha.pop()
+            self.acumular(caminho, time.perf_counter() - inicio)
+
+    def acumular(self, caminho, segundos, chamadas=1):
+        medida = self.etapas.setdefault(caminho, {'segundos': 0.0, 'chamadas': 0})
+        medida['segundos'] += segundos
+        medida['chamadas'] += chamadas
+        medida['rss_mb'], medida['pico_rss_mb'] = memoria_mb()
+
+    def contar(self, nome, quantidade):
+        self.contadores[nome] = self.contadores.get(nome, 0) + quantidade
+
+    def registrar_regra(self, regra, linhas, ocorrencias, segundos):
+        """Soma uma aplicação de regra compilada (ver motor_regras.py) sobre `linhas` linhas."""
+        medida = self.regras.get(regra['ordem'])
+        if medida is None:
+            medida = self.regras[regra['ordem']] = {'ordem': regra['ordem'], 'tipo': regra['tipo'], 'coluna': regra['coluna'],
+                                                    'grupo': regra['grupo'], 'linhas': 0, 'ocorrencias': 0, 'segundos': 0.0}
+        medida['linhas'] += linhas
+        medida['ocorrencias'] += ocorrencias
+        medida['segundos'] += segundos
+
+    def registrar_resultado(self, resultado):
+        """Linhas de saída e erros a partir do retorno do validador: (erros, df) ou, em lotes, (críticos, resumo)."""
+        erros, saida = resultado if resultado is not None else (None, None)
+        if saida is None:
+            self.situacao = 'erro_critico'
+            self.falha = erros[0].get('erro') if erros else None
+        elif isinstance(saida, dict):
+            self.contadores.update(linhas_saida=saida['linhas'], erros=saida['erros'], bloqueantes=saida['bloqueantes'])
+        else:
+            self.contadores.update(linhas_saida=len(saida), erros=len(erros), bloqueantes=erros.bloqueantes())
+
+    def parcial(self):
+        """O que um processo do pool devolve ao principal (ver juntar)."""
+        return {'etapas': self.etapas, 'regras': self.regras, 'contadores': self.contadores}
+
+    def juntar(self, parcial):
+        for caminho, medida in parcial['etapas'].items():
+            self.acumular(caminho, medida['segundos'], medida['chamadas'])
+        for ordem, medida in parcial['regras'].items():
+            if ordem not in self.regras:
+                self.regras[ordem] = dict(medida)
+                continue
+            for campo in ('linhas', 'ocorrencias', 'segundos'):
+                self.regras[ordem][campo] += medida[campo]
+        for nome, quantidade in parcial['contadores'].items():
+            self.contar(nome, quantidade)
+
+    def _montar(self, segundos):
+        from texto_arrow import motor_csv
+        rss, pico = memoria_mb()
+        linhas = self.contadores.get('linhas_lidas', 0)
+        return {
+            'versao': VERSAO_MANIFESTO, 'id': uuid.uuid4().hex, 'descricao': self.descricao, 'dados': self.dados,
+            'inicio': self._data, 'segundos': round(segundos, 4), 'situacao': self.situacao, 'falha': self.falha,
+            'linhas_por_segundo': round(linhas / segundos, 1) if linhas and segundos > 0 else None,
+            'memoria': {'rss_mb': rss, 'pico_rss_mb': pico},
+            'contadores': dict(self.contadores),
+            'etapas': [{'etapa': caminho, **medida, 'segundos': round(medida['segundos'], 4)}
+                       for caminho, medida in self.etapas.items()],
+            'regras': [{**medida, 'segundos': round(medida['segundos'], 4)}
+                       for _, medida in sorted(self.regras.items())],
+            'ambiente': {'python': platform.python_version(), 'pandas': sys.modules['pandas'].__version__ if 'pandas' in sys.modules else None,
+                         'motor_csv': motor_csv(), 'pid': os.getpid()},
+        }
+
+# --- Pontos de medição (não fazem nada sem Medicao ativa) ---
+@contextlib.contextmanager
+def etapa(nome):
+    medicao = _ATUAL.get()
+    if medicao is None:
+        yield
+        return
+    with medicao.etapa(nome):
+        yield
+
+def contar(nome, quantidade):
+    medicao = _ATUAL.get()
+    if medicao is not None: medicao.contar(nome, quantidade)
+
+def medir_blocos(blocos, nome='leitura'):
+    """Repassa os blocos de uma leitura em lotes medindo a produção de cada um e contando as linhas."""
+    iterador = iter(blocos)
+    while True:
+        with etapa(nome):
+            bloco = next(iterador, None)
+        if bloco is None: return
+        contar('linhas_lidas', len(bloco))
+        yield bloco
+
+def medir_validacao(validar_bloco, bloco):
+    """`validar_bloco(bloco)` dentro da etapa 'validacao', contando as linhas validadas."""
+    with etapa('validacao'):
+        resultado = validar_bloco(bloco)
+    contar('linhas_validadas', len(bloco))
+    return resultado
+
+# --- Publicação ---
+def registrar_gancho(funcao):
+    """Chama `funcao(manifesto)` ao fim de cada medição (ex.: enviar ao monitoramento). Devolve a função."""
+    GANCHOS.append(funcao)
+    return funcao
+
+def remover_gancho(funcao):
+    if funcao in GANCHOS: GANCHOS.remove(funcao)
+
+def _gancho_ambiente():
+    alvo = os.environ.get(VARIAVEL_GANCHO, '').strip()
+    if not alvo: return None
+    if alvo not in _GANCHO_AMBIENTE:
+        modulo, _, nome = alvo.partition(':')
+        try:
+            _GANCHO_AMBIENTE[alvo] = getattr(importlib.import_module(modulo), nome or 'publicar')
+        except (ImportError, AttributeError) as e:
+            print(f"Aviso: gancho de métricas '{alvo}' não pôde ser carregado: {e}", file=sys.stderr)
+            _GANCHO_AMBIENTE[alvo] = None
+    return _GANCHO_AMBIENTE[alvo]
+
+def gravar_manifesto(manifesto, pasta):
+    """Grava o manifesto como JSON na pasta e devolve o caminho."""
+    os.makedirs(pasta, exist_ok=True)
+    carimbo = manifesto['inicio'].replace(':', '').replace('-', '')
+    caminho = os.path.join(pasta, f"manifesto_{carimbo}_{manifesto['id'][:8]}.json")
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        json.dump(manifesto, arquivo, ensure_ascii=False, indent=2, default=str)
+    return caminho
+
+def publicar(manifesto):
+    ganchos = list(GANCHOS) + [g for g in (_gancho_ambiente(),) if g is not None]
+    pasta = os.environ.get(VARIAVEL_PASTA, '').strip()
+    if pasta: ganchos.append(lambda m: gravar_manifesto(m, pasta))
+    for gancho in ganchos:
+        try:
+            gancho(manifesto)
+        except Exception as e:
+            print(f"Aviso: gancho de métricas {getattr(gancho, '__name__', gancho)} falhou: {type(e).__name__}: {e}",
+                  file=sys.stderr)
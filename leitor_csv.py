@@ -0,0 +1,250 @@
+import codecs
+import csv
+import io
+import os
+from collections import Counter
+
+import pandas as pd
+
+from instrumentacao import contar, etapa, medir_blocos
+from leitor_planilha import Planilha, descrever_planilha, formato_planilha, ler_planilha, nomes_colunas
+from texto_arrow import pa, pa_csv, tipo_texto
+
+# --- Leitor CSV Compartilhado ---
+# Detecta encoding, separador e linha de cabeçalho a partir dos primeiros KB do arquivo
+# e faz o parse completo UMA única vez (engine C do pandas), em vez de tentar várias
+# combinações (sep, encoding) com o arquivo inteiro.
+#
+# Encoding: BOM (UTF-8/UTF-16) > amostra válida em UTF-8 > latin-1.
+# Separador: entre SEPARADORES, o que gera o maior número de linhas com a mesma
+# quantidade de campos (>1); empate -> mais campos -> ordem da lista.
+# Cabeçalho: primeira linha da amostra com a quantidade "normal" de campos (pula
+# títulos/linhas de preâmbulo que alguns ERPs exportam antes do cabeçalho). O índice
+# do DataFrame é deslocado junto, para que "índice + 2" continue sendo a linha do arquivo.
+#
+# O arquivo pode ser um caminho, bytes/memoryview ou um objeto binário com read/seek
+# (ex.: o UploadedFile do Streamlit): uploads são validados direto da memória, sem
+# arquivo temporário. bytes viram BytesIO sem cópia; memoryview é copiado pelo BytesIO,
+# então prefira passar o próprio objeto do upload.
+#
+# Planilhas XLSX/ODS (reconhecidas pelo conteúdo, não pela extensão) e Planilha(fonte, aba)
+# seguem para leitor_planilha.py, com o mesmo contrato de retorno.
+#
+# Motor Arrow (ver texto_arrow.py): com pyarrow, a leitura completa usa o parser
+# multithread do Arrow (todas as colunas como string, nomes do cabeçalho detectado) e
+# entrega colunas de string Arrow. Se o Arrow recusar o arquivo (ex.: linha com menos
+# campos, que o pandas completa com vazio), a leitura é refeita pelo pandas. No modo em
+# blocos o parse continua no pandas (em blocos), mas os blocos já saem em string Arrow.
+
+TAMANHO_AMOSTRA = 64 * 1024
+SEPARADORES = [';', ',', '\t', '|']
+BOMS = [(codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16')]
+NOMES_SEPARADOR = {';': 'ponto e vírgula', ',': 'vírgula', '\t': 'tabulação', '|': 'barra vertical'}
+# Os mesmos textos que o pd.read_csv trata como ausentes
+VALORES_AUSENTES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+                    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+
+def _detectar_encoding(amostra):
+    for bom, encoding in BOMS:
+        if amostra.startswith(bom):
+            return encoding, True
+    try:
+        # final=False: a amostra pode cortar um caractere multibyte no meio
+        codecs.getincrementaldecoder('utf-8')().decode(amostra, final=False)
+        return 'utf-8', False
+    except UnicodeDecodeError:
+        return 'latin-1', False
+
+def nome_fonte(fonte, padrao=None):
+    """Nome da fonte: o do arquivo em disco ou o do upload (quando o buffer tem `.name`); senão `padrao`."""
+    if isinstance(fonte, (str, os.PathLike)): return os.path.basename(fonte)
+    return getattr(fonte, 'name', None) or padrao
+
+def tamanho_fonte(fonte):
+    """Tamanho em bytes da fonte (caminho, bytes, buffer ou Planilha), sem lê-la; None se não dá para saber."""
+    if isinstance(fonte, Planilha): fonte = fonte.fonte
+    if isinstance(fonte, (bytes, bytearray, memoryview)): return memoryview(fonte).nbytes
+    if isinstance(fonte, (str, os.PathLike)): return os.path.getsize(fonte) if os.path.exists(fonte) else None
+    if hasattr(fonte, 'seek') and hasattr(fonte, 'tell'):
+        posicao = fonte.tell()
+        tamanho = fonte.seek(0, os.SEEK_END)
+        fonte.seek(posicao)
+        return tamanho
+    return None
+
+def _ler_amostra(fonte, tamanho):
+    if isinstance(fonte, (bytes, bytearray, memoryview)): return bytes(fonte[:tamanho])
+    if hasattr(fonte, 'read'):
+        fonte.seek(0)
+        amostra = fonte.read(tamanho)
+        fonte.seek(0)
+        return amostra
+    with open(fonte, 'rb') as f:
+        return f.read(tamanho)
+
+def _entrada_pandas(fonte):
+    """O que entregar ao pd.read_csv: caminho como está, bytes num BytesIO, arquivo aberto rebobinado."""
+    if isinstance(fonte, (bytes, bytearray, memoryview)): return io.BytesIO(fonte)
+    if hasattr(fonte, 'read'): fonte.seek(0)
+    return fonte
+
+def _contar_campos(texto, sep):
+    """Lista (linha física onde o registro começa, quantidade de campos, campos sem os vazios
+    do fim) de cada registro não vazio. Os vazios do fim vêm do separador no fim da linha."""
+    leitor = csv.reader(io.StringIO(texto), delimiter=sep)
+    contagens, inicio = [], 0
+    try:
+        for registro in leitor:
+            if registro:
+                preenchidos = len(registro)
+                while preenchidos and not registro[preenchidos - 1].strip(): preenchidos -= 1
+                contagens.append((inicio, len(registro), preenchidos))
+            inicio = leitor.line_num
+    except csv.Error:
+        pass
+    return contagens
+
+def detectar_dialeto(caminho_arquivo, tamanho_amostra=TAMANHO_AMOSTRA):
+    """
+    Detecta o formato do CSV (caminho, bytes ou buffer) lendo só o começo do arquivo.
+    Retorna: (dialeto, "Sucesso") ou (None, mensagem_de_erro).
+    """
+    if isinstance(caminho_arquivo, (str, os.PathLike)) and not os.path.exists(caminho_arquivo):
+        return None, "Arquivo não encontrado no servidor."
+    amostra = _ler_amostra(caminho_arquivo, tamanho_amostra)
+    arquivo_inteiro = len(amostra) < tamanho_amostra
+    if not amostra.strip(): return None, "Arquivo vazio."
+
+    encoding, tem_bom = _detectar_encoding(amostra)
+    texto = amostra.decode(encoding, errors='ignore')
+    if not arquivo_inteiro:
+        # Descarta a última linha, provavelmente cortada pela amostra
+        texto = texto[:texto.rfind('\n') + 1] or texto
+
+    melhor = None
+    for posicao, sep in enumerate(SEPARADORES):
+        contagens = _contar_campos(texto, sep)
+        if not contagens: continue
+        campos, linhas = Counter(n for _, n, _ in contagens).most_common(1)[0]
+        if campos < 2: continue
+        pontuacao = (linhas, campos, -posicao)
+        if melhor is None or pontuacao > melhor[0]:
+            melhor = (pontuacao, sep, campos, contagens)
+    if melhor is None:
+        return None, "Falha na leitura: Nenhum separador reconhecido (; , TAB |) na amostra do arquivo."
+
+    # Cabeçalho: primeira linha com ao menos a quantidade usual de campos preenchidos (ignora
+    # título/preâmbulo antes dele e o separador no fim das linhas de dados, ex. '1;ANA;123;')
+    _, sep, campos, contagens = melhor
+    preenchidos = Counter(p for _, _, p in contagens).most_common(1)[0][0]
+    linha_cabecalho, colunas = next((linha, n) for linha, n, p in contagens if p >= preenchidos)
+    return {
+        "sep": sep, "encoding": encoding, "bom": tem_bom,
+        "linha_cabecalho": linha_cabecalho, "colunas": colunas, "separador_final": campos > colunas
+    }, "Sucesso"
+
+def descrever_dialeto(dialeto):
+    if 'formato' in dialeto: return descrever_planilha(dialeto)
+    texto = f"separador {NOMES_SEPARADOR.get(dialeto['sep'], repr(dialeto['sep']))}, encoding {dialeto['encoding']}"
+    if dialeto['bom']: texto += " (com BOM)"
+    if dialeto['linha_cabecalho']: texto += f", cabeçalho na linha {dialeto['linha_cabecalho'] + 1}"
+    return texto + f", {dialeto['colunas']} colunas"
+
+def _deslocar_indice(df, deslocamento):
+    if deslocamento: df.index = df.index + deslocamento
+    return df
+
+def _cabecalho(caminho_arquivo, dialeto):
+    """Nomes das colunas (como o pandas os daria) lidos da linha de cabeçalho na amostra."""
+    amostra = _ler_amostra(caminho_arquivo, TAMANHO_AMOSTRA)
+    texto = amostra.decode(dialeto['encoding'], errors='replace')
+    leitor = csv.reader(io.StringIO(texto), delimiter=dialeto['sep'])
+    for registro in leitor:
+        if leitor.line_num > dialeto['linha_cabecalho'] and registro:
+            return nomes_colunas(registro)
+    raise ValueError("cabeçalho fora da amostra")
+
+def _linha_invalida(pular_longas):
+    # Como o pandas: linha com campos a mais é pulada só com on_bad_lines='skip'; com campos
+    # a menos o pandas completa com vazio, o que o Arrow não faz -> erro (e releitura pelo pandas)
+    return lambda linha: 'skip' if pular_longas and linha.actual_columns > linha.expected_columns else 'error'
+
+def _ler_arrow(caminho_arquivo, dialeto, pular_longas=False):
+    """Leitura completa pelo parser do Arrow, tudo como string, no mesmo formato do pd.read_csv."""
+    colunas = _cabecalho(caminho_arquivo, dialeto)
+    # Nomes internos únicos: o Arrow não distingue colunas repetidas pelo nome
+    internos = [f'c{i}' for i in range(len(colunas))]
+    entrada = _entrada_pandas(caminho_arquivo)
+    if isinstance(entrada, (str, os.PathLike)): entrada = pa.memory_map(os.fspath(entrada), 'r')
+    try:
+        tabela = pa_csv.read_csv(
+            entrada,
+            read_options=pa_csv.ReadOptions(column_names=internos, skip_rows=dialeto['linha_cabecalho'] + 1,
+                                            encoding='utf8' if dialeto['encoding'] == 'utf-8-sig' else dialeto['encoding']),
+            parse_options=pa_csv.ParseOptions(delimiter=dialeto['sep'], newlines_in_values=True,
+                                              invalid_row_handler=_linha_invalida(pular_longas)),
+            convert_options=pa_csv.ConvertOptions(column_types={c: pa.string() for c in internos},
+                                                  null_values=VALORES_AUSENTES, strings_can_be_null=True,
+                                                  quoted_strings_can_be_null=True))
+    finally:
+        if isinstance(entrada, pa.MemoryMappedFile): entrada.close()
+    df = tabela.to_pandas(types_mapper={pa.string(): tipo_texto()}.get, self_destruct=True)
+    df.columns = colunas
+    return df
+
+def ler_csv(caminho_arquivo, tamanho_lote=None, **kwargs_leitura):
+    """
+    Lê o CSV inteiro (ou em blocos, com `tamanho_lote`) com o dialeto detectado, tudo como texto.
+    Retorna: (df_ou_iterador_de_blocos, dialeto) ou (None, mensagem_de_erro).
+
+    Se a amostra parecia UTF-8 mas o resto do arquivo não é, a leitura completa é refeita
+    uma vez em latin-1 (o dialeto devolvido reflete isso). No modo em blocos não há como
+    recomeçar, então bytes inválidos depois da amostra são substituídos.
+    Com uma Medicao ativa (ver instrumentacao.py), registra a etapa 'leitura', as linhas e os bytes lidos.
+    """
+    with etapa('leitura'):
+        df, dialeto = _ler_csv(caminho_arquivo, tamanho_lote, **kwargs_leitura)
+    if df is None: return df, dialeto
+    contar('bytes_lidos', tamanho_fonte(caminho_arquivo) or 0)
+    if tamanho_lote: return medir_blocos(df), dialeto
+    contar('linhas_lidas', len(df))
+    return df, dialeto
+
+def _ler_csv(caminho_arquivo, tamanho_lote=None, **kwargs_leitura):
+    if isinstance(caminho_arquivo, Planilha) or formato_planilha(caminho_arquivo):
+        return ler_planilha(caminho_arquivo, tamanho_lote)
+    dialeto, msg = detectar_dialeto(caminho_arquivo)
+    if dialeto is None: return None, msg
+
+    tipo = tipo_texto()
+    # encoding_errors só muda arquivos com bytes inválidos, que o Arrow recusa (e o pandas relê)
+    arrow = tipo is not None and set(kwargs_leitura) <= {'encoding_errors', 'on_bad_lines'} \
+        and kwargs_leitura.get('on_bad_lines', 'error') in ('error', 'skip') and not dialeto['separador_final']
+
+    def _parametros(encoding):
+        # index_col=False: campo a mais no fim (separador final) não vira índice
+        parametros = dict(sep=dialeto['sep'], encoding=encoding, dtype=tipo or str, skiprows=dialeto['linha_cabecalho'] or None,
+                          index_col=False)
+        parametros.update(kwargs_leitura)
+        return parametros
+
+    deslocamento = dialeto['linha_cabecalho']
+    try:
+        if tamanho_lote:
+            parametros = _parametros(dialeto['encoding'])
+            if dialeto['encoding'] == 'utf-8': parametros.setdefault('encoding_errors', 'replace')
+            leitor = pd.read_csv(_entrada_pandas(caminho_arquivo), chunksize=tamanho_lote, **parametros)
+            return (_deslocar_indice(bloco, deslocamento) for bloco in leitor), dialeto
+        if arrow:
+            try:
+                return _deslocar_indice(_ler_arrow(caminho_arquivo, dialeto, kwargs_leitura.get('on_bad_lines') == 'skip'), deslocamento), dialeto
+            except ValueError:  # inclui pa.ArrowInvalid
+                pass  # arquivo fora do que o Arrow aceita: o pandas decide (e explica o erro)
+        try:
+            df = pd.read_csv(_entrada_pandas(caminho_arquivo), **_parametros(dialeto['encoding']))
+        except UnicodeDecodeError:
+            dialeto = dict(dialeto, encoding='latin-1')
+            df = pd.read_csv(_entrada_pandas(caminho_arquivo), **_parametros('latin-1'))
+        return _deslocar_indice(df, deslocamento), dialeto
+    except Exception as e:
+        return None, f"Falha na leitura ({descrever_dialeto(dialeto)}): {e}"
@@ -0,0 +1,390 @@
+import io
+import math
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from xml.parsers import expat
+
+import numpy as np
+import pandas as pd
+
+from texto_arrow import para_texto
+
+# --- Leitor de Planilhas (XLSX / ODS) ---
+# Muitos clientes mandam a exportação do ERP como planilha. Em vez de read_excel (que
+# monta a pasta inteira em memória, célula a célula, com tipos), o XML da aba é lido
+# em streaming direto do zip (expat no XLSX, iterparse no ODS): cada linha vira uma
+# lista de textos e é descartada em seguida, e os blocos saem no mesmo contrato do
+# leitor_csv — inclusive em lotes. Nada é convertido para número: CPF/CNPJ/NCM/CODPROD chegam como texto e,
+# quando o número foi salvo com formato de zeros à esquerda ("00000000000"), os zeros
+# são recolocados; números com casas decimais chegam no formato pt-BR ("706,8"), como
+# num CSV exportado pelo ERP. O índice do DataFrame é "linha da planilha - 2", então "índice + 2"
+# continua sendo a linha que o usuário vê (linhas em branco não deslocam a numeração).
+#
+# Cabeçalho: entre as primeiras linhas, a primeira só com textos e com pelo menos
+# FRACAO_CABECALHO das células preenchidas da linha mais larga (pula títulos/preâmbulo).
+
+LINHAS_AMOSTRA_CABECALHO = 30
+FRACAO_CABECALHO = 0.6
+ASSINATURA_ZIP = b'PK\x03\x04'
+ASSINATURA_XLS = b'\xd0\xcf\x11\xe0'
+NOMES_FORMATO = {'xlsx': 'XLSX', 'ods': 'ODS'}
+TAMANHO_PEDACO_XML = 64 * 1024
+
+NS_TABELA = 'urn:oasis:names:tc:opendocument:xmlns:table:1.0'
+NS_TEXTO = 'urn:oasis:names:tc:opendocument:xmlns:text:1.0'
+NS_OFFICE = 'urn:oasis:names:tc:opendocument:xmlns:office:1.0'
+NS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+
+class Planilha:
+    """Escolha de aba: a fonte (caminho, bytes ou buffer) + o nome da planilha (None = primeira)."""
+
+    def __init__(self, fonte, nome=None):
+        self.fonte = fonte
+        self.nome = nome
+
+    @property
+    def name(self):
+        fonte = self.fonte
+        if isinstance(fonte, (str, os.PathLike)): return os.path.basename(fonte)
+        return getattr(fonte, 'name', None)
+
+def _local(tag):
+    return tag.rsplit('}', 1)[-1]
+
+def _inicio(fonte, tamanho=4):
+    if isinstance(fonte, (bytes, bytearray, memoryview)): return bytes(fonte[:tamanho])
+    if hasattr(fonte, 'read'):
+        fonte.seek(0)
+        inicio = fonte.read(tamanho)
+        fonte.seek(0)
+        return inicio
+    try:
+        with open(fonte, 'rb') as f:
+            return f.read(tamanho)
+    except OSError:
+        return b''
+
+def _abrir_zip(fonte):
+    if isinstance(fonte, (bytes, bytearray, memoryview)): return zipfile.ZipFile(io.BytesIO(fonte))
+    if hasattr(fonte, 'seek'): fonte.seek(0)
+    return zipfile.ZipFile(fonte)
+
+def formato_planilha(fonte):
+    """'xlsx', 'ods', 'xls' (formato antigo, não suportado) ou None quando não é planilha."""
+    if isinstance(fonte, Planilha): fonte = fonte.fonte
+    inicio = _inicio(fonte)
+    if inicio.startswith(ASSINATURA_XLS): return 'xls'
+    if not inicio.startswith(ASSINATURA_ZIP): return None
+    try:
+        with _abrir_zip(fonte) as pacote:
+            nomes = set(pacote.namelist())
+            if 'xl/workbook.xml' in nomes: return 'xlsx'
+            if 'content.xml' in nomes and 'mimetype' in nomes and b'spreadsheet' in pacote.read('mimetype'):
+                return 'ods'
+    except (zipfile.BadZipFile, KeyError):
+        return None
+    return None
+
+# --- XLSX ---
+def _abas_xlsx(pacote):
+    """Lista (nome, caminho do XML) das abas, na ordem da pasta de trabalho."""
+    alvos = {}
+    for rel in ET.fromstring(pacote.read('xl/_rels/workbook.xml.rels')):
+        alvo = rel.get('Target', '')
+        alvos[rel.get('Id')] = alvo.lstrip('/') if alvo.startswith('/') else 'xl/' + alvo
+    abas = []
+    for elemento in ET.fromstring(pacote.read('xl/workbook.xml')).iter():
+        if _local(elemento.tag) == 'sheet':
+            abas.append((elemento.get('name'), alvos.get(elemento.get(f'{{{NS_REL}}}id'))))
+    return abas
+
+def _percorrer_xml(arquivo, inicio, fim, texto):
+    """Alimenta um parser expat em pedaços, gerando depois de cada pedaço (sem montar árvore)."""
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = lambda nome, atributos: inicio(nome.rpartition(':')[2], atributos)
+    parser.EndElementHandler = lambda nome: fim(nome.rpartition(':')[2])
+    parser.CharacterDataHandler = texto
+    while True:
+        pedaco = arquivo.read(TAMANHO_PEDACO_XML)
+        parser.Parse(pedaco, not pedaco)
+        yield
+        if not pedaco: return
+
+def _textos_compartilhados(pacote):
+    if 'xl/sharedStrings.xml' not in pacote.namelist(): return []
+    textos, partes, estado = [], [], {'t': False, 'fonetico': 0}
+
+    def inicio(nome, atributos):
+        if nome == 'si': partes.clear()
+        elif nome == 't': estado['t'] = not estado['fonetico']
+        elif nome == 'rPh': estado['fonetico'] += 1  # guia fonética (japonês) não faz parte do texto
+
+    def fim(nome):
+        if nome == 'si': textos.append(''.join(partes))
+        elif nome == 't': estado['t'] = False
+        elif nome == 'rPh': estado['fonetico'] -= 1
+
+    def texto(dados):
+        if estado['t']: partes.append(dados)
+
+    with pacote.open('xl/sharedStrings.xml') as arquivo:
+        for _ in _percorrer_xml(arquivo, inicio, fim, texto): pass
+    return textos
+
+def _zeros_por_estilo(pacote):
+    """Estilo -> largura, para os formatos numéricos só de zeros (ex.: '00000000000')."""
+    if 'xl/styles.xml' not in pacote.namelist(): return {}
+    raiz = ET.fromstring(pacote.read('xl/styles.xml'))
+    larguras = {}
+    for elemento in raiz.iter():
+        if _local(elemento.tag) == 'numFmt':
+            codigo = elemento.get('formatCode', '').replace('"', '').replace('\\', '')
+            if re.fullmatch(r'0{2,}', codigo): larguras[elemento.get('numFmtId')] = len(codigo)
+    zeros = {}
+    for secao in raiz:
+        if _local(secao.tag) != 'cellXfs': continue
+        for indice, xf in enumerate(secao):
+            if xf.get('numFmtId') in larguras: zeros[str(indice)] = larguras[xf.get('numFmtId')]
+    return zeros
+
+def _coluna_da_referencia(referencia, cache={}):
+    letras = referencia.rstrip('0123456789')
+    if letras not in cache:
+        numero = 0
+        for letra in letras.upper(): numero = numero * 26 + (ord(letra) - 64)
+        cache[letras] = numero - 1
+    return cache[letras]
+
+def _texto_numero(valor, largura=None):
+    """
+    Texto de uma célula numérica do XLSX no formato que os validadores esperam (pt-BR).
+    O XML guarda o double cru ('706.80000000000007', '4.2E3'): inteiros passam como estão
+    (CPF/CNPJ/códigos longos não perdem dígitos); o resto é arredondado a 15 algarismos,
+    como o Excel mostra, e sai sem notação científica e com vírgula decimal ('706,8', '4200').
+    """
+    if not re.fullmatch(r'-?\d+', valor):
+        try: numero = float(valor)
+        except ValueError: return valor
+        if not math.isfinite(numero): return valor
+        valor = np.format_float_positional(float(f'{numero:.15g}'), trim='-').replace('.', ',')
+    if largura and valor.isdigit(): valor = valor.zfill(largura)
+    return valor
+
+def _linhas_xlsx(pacote, caminho_aba):
+    """Gera (número da linha, [texto ou None por coluna]) da aba, em streaming."""
+    compartilhados = _textos_compartilhados(pacote)
+    zeros = _zeros_por_estilo(pacote)
+    prontas, partes = [], []
+    estado = {'numero': 0, 'celulas': None, 'celula': None, 'posicao': 0, 'capturar': False, 'tem_valor': False}
+
+    def inicio(nome, atributos):
+        if nome == 'c':
+            referencia = atributos.get('r')
+            estado['celula'] = (_coluna_da_referencia(referencia) if referencia else estado['posicao'],
+                                atributos.get('t', 'n'), atributos.get('s'))
+            estado['posicao'] += 1
+            estado['tem_valor'] = False
+            partes.clear()
+        elif nome == 'v' or (nome == 't' and estado['celula'] is not None):
+            estado['capturar'] = estado['tem_valor'] = True
+        elif nome == 'row':
+            estado['numero'] = int(atributos.get('r') or estado['numero'] + 1)
+            estado['celulas'], estado['posicao'] = {}, 0
+
+    def fim(nome):
+        if nome in ('v', 't'):
+            estado['capturar'] = False
+        elif nome == 'c':
+            coluna, tipo, estilo = estado['celula']
+            estado['celula'] = None
+            if not estado['tem_valor']: return
+            valor = ''.join(partes)
+            if tipo == 's': valor = compartilhados[int(valor)]
+            elif tipo == 'n': valor = _texto_numero(valor, zeros.get(estilo))
+            estado['celulas'][coluna] = valor
+        elif nome == 'row':
+            celulas = estado['celulas']
+            if celulas:
+                linha = [None] * (max(celulas) + 1)
+                for coluna, valor in celulas.items(): linha[coluna] = valor
+                prontas.append((estado['numero'], linha))
+
+    def texto(dados):
+        if estado['capturar']: partes.append(dados)
+
+    with pacote.open(caminho_aba) as arquivo:
+        for _ in _percorrer_xml(arquivo, inicio, fim, texto):
+            yield from prontas
+            prontas.clear()
+
+# --- ODS ---
+def _texto_ods(elemento):
+    partes = [elemento.text or '']
+    for filho in elemento:
+        nome = _local(filho.tag)
+        if nome == 's': partes.append(' ' * int(filho.get(f'{{{NS_TEXTO}}}c', 1)))
+        elif nome == 'tab': partes.append('\t')
+        elif nome == 'line-break': partes.append('\n')
+        else: partes.append(_texto_ods(filho))
+        partes.append(filho.tail or '')
+    return ''.join(partes)
+
+def _abas_ods(pacote, so_primeira=False):
+    # No ODS todas as abas estão no content.xml: listar exige percorrê-lo (a primeira sai logo)
+    abas = []
+    with pacote.open('content.xml') as arquivo:
+        for _, elemento in ET.iterparse(arquivo, events=('start',)):
+            if elemento.tag == f'{{{NS_TABELA}}}table':
+                abas.append((elemento.get(f'{{{NS_TABELA}}}name'), 'content.xml'))
+                if so_primeira: break
+    return abas
+
+def _linhas_ods(pacote, nome_aba):
+    numero, ativa = 0, False
+    with pacote.open('content.xml') as arquivo:
+        pilha = []
+        for evento, elemento in ET.iterparse(arquivo, events=('start', 'end')):
+            if evento == 'start':
+                pilha.append(elemento)
+                if elemento.tag == f'{{{NS_TABELA}}}table':
+                    ativa = elemento.get(f'{{{NS_TABELA}}}name') == nome_aba
+                continue
+            pilha.pop()
+            if elemento.tag == f'{{{NS_TABELA}}}table' and ativa: return
+            if elemento.tag != f'{{{NS_TABELA}}}table-row' or not ativa: continue
+            repeticoes = int(elemento.get(f'{{{NS_TABELA}}}number-rows-repeated', 1))
+            linha = []
+            for celula in elemento:
+                if _local(celula.tag) not in ('table-cell', 'covered-table-cell'): continue
+                paragrafos = [p for p in celula if p.tag == f'{{{NS_TEXTO}}}p']
+                valor = '\n'.join(_texto_ods(p) for p in paragrafos) if paragrafos else celula.get(f'{{{NS_OFFICE}}}value')
+                vezes = int(celula.get(f'{{{NS_TABELA}}}number-columns-repeated', 1))
+                # Células vazias repetidas no fim da linha (às vezes milhares) não são expandidas
+                linha.extend([valor] * (vezes if valor not in (None, '') else min(vezes, 1024)))
+            while linha and linha[-1] in (None, ''): linha.pop()
+            if linha:
+                for repeticao in range(repeticoes):
+                    yield numero + repeticao + 1, list(linha)
+            numero += repeticoes
+            if pilha: pilha[-1].remove(elemento)
+
+# --- Leitura ---
+def listar_planilhas(fonte):
+    """Nomes das abas da planilha (lista vazia se não for XLSX/ODS legível)."""
+    if isinstance(fonte, Planilha): fonte = fonte.fonte
+    formato = formato_planilha(fonte)
+    if formato not in NOMES_FORMATO: return []
+    try:
+        with _abrir_zip(fonte) as pacote:
+            abas = _abas_xlsx(pacote) if formato == 'xlsx' else _abas_ods(pacote)
+    except (zipfile.BadZipFile, KeyError, ET.ParseError):
+        return []
+    return [nome for nome, _ in abas]
+
+def _eh_texto(valor):
+    return not re.fullmatch(r'[-+]?[\d.,]+', valor.strip())
+
+def _detectar_cabecalho(amostra):
+    """Posição, na amostra, da linha de cabeçalho."""
+    preenchidas = [sum(1 for v in linha if v not in (None, '')) for _, linha in amostra]
+    minimo = max(1, math.ceil(max(preenchidas) * FRACAO_CABECALHO))
+    for posicao, ((_, linha), quantidade) in enumerate(zip(amostra, preenchidas)):
+        if quantidade >= minimo and all(_eh_texto(v) for v in linha if v not in (None, '')):
+            return posicao
+    return 0
+
+def nomes_colunas(linha):
+    """Nomes do cabeçalho como o pandas faria: vazios viram 'Unnamed: i', repetidos ganham '.n'."""
+    nomes, vistos = [], {}
+    for posicao, valor in enumerate(linha):
+        nome = str(valor).strip() if valor not in (None, '') else f'Unnamed: {posicao}'
+        if nome in vistos:
+            vistos[nome] += 1
+            nome = f'{nome}.{vistos[nome]}'
+        else:
+            vistos[nome] = 0
+        nomes.append(nome)
+    return nomes
+
+def _montar_bloco(linhas, colunas):
+    largura = len(colunas)
+    valores = [(linha + [None] * (largura - len(linha)))[:largura] for _, linha in linhas]
+    indice = pd.Index([numero - 2 for numero, _ in linhas], dtype='int64')
+    return para_texto(pd.DataFrame(valores, columns=colunas, index=indice, dtype=object))
+
+def _blocos(linhas, colunas, tamanho_lote):
+    bloco = []
+    for item in linhas:
+        bloco.append(item)
+        if len(bloco) >= tamanho_lote:
+            yield _montar_bloco(bloco, colunas)
+            bloco = []
+    if bloco:
+        yield _montar_bloco(bloco, colunas)
+
+def ler_planilha(fonte, tamanho_lote=None):
+    """
+    Lê uma aba de XLSX/ODS (fonte, bytes, buffer ou Planilha com o nome da aba), tudo como texto.
+    Retorna: (df_ou_iterador_de_blocos, dialeto) ou (None, mensagem_de_erro) — mesmo contrato de ler_csv.
+    """
+    nome_aba = None
+    if isinstance(fonte, Planilha): fonte, nome_aba = fonte.fonte, fonte.nome
+    formato = formato_planilha(fonte)
+    if formato == 'xls':
+        return None, "Formato .xls (Excel 97-2003) não suportado: salve a planilha como .xlsx ou CSV."
+    if formato not in NOMES_FORMATO:
+        return None, "Falha na leitura: o arquivo não é uma planilha XLSX/ODS válida."
+
+    pacote = None
+    try:
+        pacote = _abrir_zip(fonte)
+        if formato == 'xlsx':
+            abas = dict(_abas_xlsx(pacote))
+            if not abas: return None, "A planilha não tem nenhuma aba."
+            nome_aba = nome_aba if nome_aba is not None else next(iter(abas))
+            if nome_aba not in abas: return None, f"Aba '{nome_aba}' não encontrada na planilha."
+            linhas = _linhas_xlsx(pacote, abas[nome_aba])
+        else:
+            if nome_aba is None:
+                abas = _abas_ods(pacote, so_primeira=True)
+                if not abas: return None, "A planilha não tem nenhuma aba."
+                nome_aba = abas[0][0]
+            linhas = _linhas_ods(pacote, nome_aba)
+
+        amostra = []
+        for item in linhas:
+            amostra.append(item)
+            if len(amostra) >= LINHAS_AMOSTRA_CABECALHO: break
+        if not amostra: return None, f"Aba '{nome_aba}' vazia ou não encontrada na planilha."
+        posicao = _detectar_cabecalho(amostra)
+        numero_cabecalho, cabecalho = amostra[posicao]
+        colunas = nomes_colunas(cabecalho)
+        dialeto = {"formato": formato, "planilha": nome_aba, "linha_cabecalho": numero_cabecalho - 1, "colunas": len(colunas)}
+
+        def _restantes():
+            yield from amostra[posicao + 1:]
+            yield from linhas
+
+        if tamanho_lote:
+            blocos, pacote = _blocos_e_fechar(pacote, _restantes(), colunas, tamanho_lote), None
+            return blocos, dialeto
+        return _montar_bloco(list(_restantes()), colunas), dialeto
+    except (zipfile.BadZipFile, KeyError, ET.ParseError, expat.ExpatError, ValueError, IndexError) as e:
+        return None, f"Falha na leitura da planilha {NOMES_FORMATO[formato]}: {e}"
+    finally:
+        if pacote is not None: pacote.close()
+
+def _blocos_e_fechar(pacote, linhas, colunas, tamanho_lote):
+    # No modo em lotes o zip fica aberto enquanto os blocos são consumidos
+    try:
+        yield from _blocos(linhas, colunas, tamanho_lote)
+    finally:
+        pacote.close()
+
+def descrever_planilha(dialeto):
+    texto = f"planilha {NOMES_FORMATO[dialeto['formato']]}, aba '{dialeto['planilha']}'"
+    if dialeto['linha_cabecalho']: texto += f", cabeçalho na linha {dialeto['linha_cabecalho'] + 1}"
+    return texto + f", {dialeto['colunas']} colunas"
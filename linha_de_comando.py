@@ -0,0 +1,206 @@
+import argparse
+import glob
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from duplicidades import GRUPO_DUPLICIDADES, erros_na_carga
+from instrumentacao import Medicao, gravar_manifesto
+from motor_regras import COLUNAS_ERRO
+from processamento_em_lotes import TAMANHO_LOTE_PADRAO
+from processamento_paralelo import contexto_processos
+from validador_de_estoque import carregar_mestre, validar_estoque_em_lotes
+from validador_de_parceiro import CHAVES_UNICAS_PARCEIRO, COLUNAS_ERRO_PARCEIRO, validar_parceiros_em_lotes
+from validador_de_produto import CHAVES_UNICAS_PRODUTO, aviso_tabela_ncm, validar_produtos_em_lotes
+
+# --- Validação em Massa (sem interface) ---
+# Valida um diretório (ou glob) inteiro de exportações, vários arquivos ao mesmo tempo,
+# cada um num processo. Cada arquivo passa pelo modo em lotes (memória limitada) e gera
+# <nome>_corrigido.csv e <nome>_erros.csv na pasta de saída. Ao final imprime o resumo
+# de vazão (linhas/s, MB/s). Com --manifestos, cada arquivo gera também o manifesto JSON
+# da execução (tempo por etapa e por regra, memória; ver instrumentacao.py). Com --carga,
+# parceiros/produtos também são conferidos contra os outros arquivos da mesma carga de
+# migração (chaves únicas repetidas entre arquivos; ver duplicidades.py), em duas fases:
+# primeiro todos os arquivos são validados e gravam suas chaves na carga; só depois cada
+# um é conferido contra os demais (e contra os de execuções anteriores da mesma carga),
+# então o resultado não depende de qual arquivo terminou primeiro.
+#
+# Código de saída: 0 = só correções automáticas; 1 = há erros bloqueantes (não
+# corrigidos) ou algum arquivo não pôde ser validado; 2 = uso incorreto.
+#
+# Uso:
+#   python linha_de_comando.py parceiros exportacoes/ --saida resultados/
+#   python linha_de_comando.py estoque "exportacoes/estoque_*.csv" --mestre mestre_produtos.csv -t 4
+#   python linha_de_comando.py parceiros exportacoes/parceiros_*.csv --carga migracao_2024
+
+ENTIDADES = ('parceiros', 'produtos', 'estoque')
+CHAVES_CARGA = {'parceiros': (CHAVES_UNICAS_PARCEIRO, COLUNAS_ERRO_PARCEIRO), 'produtos': (CHAVES_UNICAS_PRODUTO, COLUNAS_ERRO)}
+EXTENSOES = ('.csv', '.xlsx', '.xlsm', '.ods')
+SAIDA_PADRAO = 'resultados_validacao'
+
+def listar_arquivos(entrada):
+    """Arquivos CSV/planilha de um diretório, de um glob ou um arquivo único (ordenados)."""
+    if os.path.isdir(entrada):
+        return sorted(os.path.join(entrada, nome) for nome in os.listdir(entrada)
+                      if nome.lower().endswith(EXTENSOES) and os.path.isfile(os.path.join(entrada, nome)))
+    if os.path.isfile(entrada):
+        return [entrada]
+    return sorted(c for c in glob.glob(entrada, recursive=True) if os.path.isfile(c))
+
+def _nomes_saida(arquivos):
+    """Nome base de saída de cada arquivo; nomes repetidos (pastas diferentes) ganham sufixo."""
+    usados, nomes = {}, []
+    for caminho in arquivos:
+        base = os.path.splitext(os.path.basename(caminho))[0]
+        usados[base] = usados.get(base, 0) + 1
+        nomes.append(base if usados[base] == 1 else f"{base}_{usados[base]}")
+    return nomes
+
+def configurar_mensagens(detalhado):
+    """Mensagens de andamento dos validadores (logging INFO) só aparecem com -v."""
+    logging.basicConfig(level=logging.INFO if detalhado else logging.WARNING, format='%(message)s', stream=sys.stdout)
+
+def validar_arquivo(entidade, caminho, base_saida, mestre=None, tamanho_lote=TAMANHO_LOTE_PADRAO,
+                    grupos_desativados=(), detalhado=False, pasta_manifestos=None, carga=None):
+    """
+    Valida um arquivo no modo em lotes e devolve o resumo (roda dentro do processo do pool).
+    Com `carga`, as chaves só são gravadas nela; a conferência entre arquivos é conferir_na_carga.
+    """
+    # Na carga, o arquivo é identificado pelo nome de saída (único mesmo com nomes repetidos em pastas diferentes)
+    nome_na_carga = os.path.basename(base_saida) + os.path.splitext(caminho)[1]
+    caminho_corrigido, caminho_erros = f"{base_saida}_corrigido.csv", f"{base_saida}_erros.csv"
+    inicio = time.perf_counter()
+    configurar_mensagens(detalhado)
+    medicao = Medicao(os.path.basename(caminho), entidade=entidade, arquivo=caminho)
+    try:
+        with medicao:
+            if entidade == 'parceiros':
+                criticos, resumo = validar_parceiros_em_lotes(caminho, caminho_corrigido, caminho_erros, tamanho_lote, grupos_desativados,
+                                                              carga=carga, arquivo=nome_na_carga, consultar_carga=False)
+            elif entidade == 'produtos':
+                criticos, resumo = validar_produtos_em_lotes(caminho, caminho_corrigido, caminho_erros, tamanho_lote, grupos_desativados,
+                                                             carga=carga, arquivo=nome_na_carga, consultar_carga=False)
+            else:
+                # O mestre já foi compilado em snapshot pelo processo principal: aqui é só mmap
+                criticos, resumo = validar_estoque_em_lotes(caminho, mestre, caminho_corrigido, caminho_erros, tamanho_lote, grupos_desativados)
+            medicao.registrar_resultado((criticos, resumo))
+    except Exception as e:
+        criticos, resumo = [{"linha": 0, "erro": f"{type(e).__name__}: {e}"}], None
+
+    resultado = {"arquivo": caminho, "bytes": os.path.getsize(caminho), "segundos": time.perf_counter() - inicio,
+                 "linhas": 0, "erros": 0, "bloqueantes": 0, "falha": None,
+                 "caminho_corrigido": caminho_corrigido, "caminho_erros": caminho_erros, "arquivo_na_carga": nome_na_carga,
+                 "manifesto": gravar_manifesto(medicao.manifesto, pasta_manifestos) if pasta_manifestos else None}
+    if resumo is None:
+        resultado["falha"] = criticos[0].get("erro", "Erro crítico") if criticos else "Erro crítico"
+        pd.DataFrame(criticos).to_csv(caminho_erros, sep=';', index=False)  # o relatório explica a falha
+    else:
+        resultado.update(linhas=resumo["linhas"], erros=resumo["erros"], bloqueantes=resumo["bloqueantes"])
+    return resultado
+
+def conferir_na_carga(resultado, entidade, carga):
+    """Segunda fase do --carga: anexa ao relatório do arquivo as chaves que já existem em outro arquivo da carga."""
+    if resultado["falha"]: return
+    chaves, colunas_erro = CHAVES_CARGA[entidade]
+    erros = erros_na_carga(carga, entidade, resultado["arquivo_na_carga"], chaves, colunas_erro)
+    if not len(erros): return
+    with open(resultado["caminho_erros"], 'a', encoding='utf-8', newline='') as f_erros:
+        erros.para_csv(f_erros, cabecalho=False)
+    resultado["erros"] += len(erros)
+    resultado["bloqueantes"] += erros.bloqueantes()
+
+def _vazao(linhas, tamanho_bytes, segundos):
+    segundos = max(segundos, 1e-9)
+    return f"{linhas / segundos:,.0f} linhas/s, {tamanho_bytes / segundos / 1024 ** 2:,.1f} MB/s"
+
+def _imprimir_resultado(r):
+    if r["falha"]:
+        print(f"[FALHA] {r['arquivo']}: {r['falha']}")
+        return
+    situacao = "ERROS" if r["bloqueantes"] else "OK"
+    print(f"[{situacao}] {r['arquivo']}: {r['linhas']:,} linhas, {r['erros']:,} erros "
+          f"({r['bloqueantes']:,} bloqueantes) em {r['segundos']:.1f}s — {_vazao(r['linhas'], r['bytes'], r['segundos'])}")
+
+def criar_parser():
+    parser = argparse.ArgumentParser(description="Valida em massa arquivos CSV exportados do ERP (sem interface).")
+    parser.add_argument('entidade', choices=ENTIDADES, help="Tipo de cadastro dos arquivos.")
+    parser.add_argument('entrada', help="Diretório (todos os .csv/.xlsx/.ods), glob (ex.: 'exportacoes/**/*.csv') ou arquivo.")
+    parser.add_argument('--mestre', help="Arquivo mestre de produtos (obrigatório para estoque).")
+    parser.add_argument('--saida', default=SAIDA_PADRAO, help=f"Pasta dos resultados (padrão: {SAIDA_PADRAO}).")
+    parser.add_argument('-t', '--trabalhadores', type=int, default=os.cpu_count() or 1,
+                        help="Arquivos validados ao mesmo tempo (padrão: nº de núcleos).")
+    parser.add_argument('--tamanho-lote', type=int, default=TAMANHO_LOTE_PADRAO, help="Linhas por lote de leitura.")
+    parser.add_argument('--desativar', action='append', default=[], metavar='GRUPO',
+                        help="Grupo de regras a desativar (pode repetir).")
+    parser.add_argument('--manifestos', metavar='PASTA',
+                        help="Grava nesta pasta o manifesto JSON de cada arquivo (tempos por etapa e por regra).")
+    parser.add_argument('--carga', metavar='NOME',
+                        help="Carga de migração: confere chaves únicas (AD_IDEXTERNO, CGC_CPF) também entre os arquivos dela.")
+    parser.add_argument('-v', '--detalhado', action='store_true', help="Mostra as mensagens dos validadores.")
+    return parser
+
+def main(argv=None):
+    parser = criar_parser()
+    args = parser.parse_args(argv)
+    if args.entidade == 'estoque' and not args.mestre:
+        parser.error("--mestre é obrigatório para validar estoque.")
+    if args.trabalhadores < 1:
+        parser.error("--trabalhadores precisa ser pelo menos 1.")
+    configurar_mensagens(args.detalhado)
+
+    arquivos = listar_arquivos(args.entrada)
+    if not arquivos:
+        print(f"Nenhum arquivo encontrado em '{args.entrada}'.", file=sys.stderr)
+        return 2
+
+    if args.entidade == 'estoque' and carregar_mestre(args.mestre, 'CODPROD') is None:
+        # Compila (ou confere) o snapshot uma vez aqui; os processos só o abrem por mmap
+        print(f"Não foi possível carregar o mestre de produtos '{args.mestre}'.", file=sys.stderr)
+        return 1
+
+    os.makedirs(args.saida, exist_ok=True)
+    trabalhadores = min(args.trabalhadores, len(arquivos))
+    tarefas = [(args.entidade, caminho, os.path.join(args.saida, nome), args.mestre, args.tamanho_lote,
+                tuple(args.desativar), args.detalhado, args.manifestos, args.carga) for caminho, nome in zip(arquivos, _nomes_saida(arquivos))]
+    print(f"Validando {len(arquivos)} arquivo(s) de {args.entidade} com {trabalhadores} trabalhador(es)...")
+    conferir_carga = bool(args.carga) and args.entidade in CHAVES_CARGA and GRUPO_DUPLICIDADES not in args.desativar
+    # Com a carga, cada resultado só sai depois da segunda fase (os erros entre arquivos mudam os totais)
+    imprimir = (lambda r: None) if conferir_carga else _imprimir_resultado
+
+    inicio = time.perf_counter()
+    if trabalhadores == 1:
+        resultados = []
+        for tarefa in tarefas:
+            resultados.append(validar_arquivo(*tarefa))
+            imprimir(resultados[-1])
+    else:
+        with ProcessPoolExecutor(max_workers=trabalhadores, mp_context=contexto_processos()) as pool:
+            futuros = [pool.submit(validar_arquivo, *tarefa) for tarefa in tarefas]
+            resultados = []
+            for futuro in as_completed(futuros):
+                resultados.append(futuro.result())
+                imprimir(resultados[-1])
+    if conferir_carga:
+        # Segunda fase: todos os arquivos já gravaram suas chaves na carga
+        for resultado in resultados:
+            conferir_na_carga(resultado, args.entidade, args.carga)
+            _imprimir_resultado(resultado)
+    decorrido = time.perf_counter() - inicio
+
+    # --- Resumo ---
+    linhas = sum(r["linhas"] for r in resultados)
+    tamanho = sum(r["bytes"] for r in resultados if not r["falha"])
+    falhas = sum(1 for r in resultados if r["falha"])
+    com_bloqueantes = sum(1 for r in resultados if r["bloqueantes"])
+    print(f"\nTotal: {len(resultados)} arquivo(s), {linhas:,} linhas, {sum(r['erros'] for r in resultados):,} erros "
+          f"({sum(r['bloqueantes'] for r in resultados):,} bloqueantes) em {decorrido:.1f}s — {_vazao(linhas, tamanho, decorrido)}")
+    print(f"Arquivos com erros bloqueantes: {com_bloqueantes}; falhas: {falhas}. Resultados em '{args.saida}'.")
+    if args.entidade == 'produtos' and aviso_tabela_ncm(): print(f"Aviso: {aviso_tabela_ncm()}")
+    return 1 if falhas or com_bloqueantes else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,263 @@
+import hashlib
+import json
+import operator
+import re
+import string
+import time
+
+import numpy as np
+import pandas as pd
+
+from indice_mestre import contem_em_indice, digest_carregado, impressao_codigo
+from instrumentacao import etapa, medicao_atual
+from tabela_erros import COLUNAS_ERRO, TabelaErros
+from texto_arrow import como_texto
+
+# --- Motor de Regras Declarativas ---
+# Cada validador descreve suas regras como uma lista de dicts (dados, não código).
+# `compilar_regras` valida e pré-processa a lista uma única vez (import do módulo);
+# `executar_regras` aplica todas as regras como operações de coluna, numa passada,
+# e devolve os erros (TabelaErros, ver tabela_erros.py) na mesma ordem da antiga
+# validação linha a linha: (linha, posição da regra na lista).
+#
+# Tipos de regra:
+#   normalizacao  -> corrige `coluna` (via `mapa` e/ou `funcao`), grava em `destino`;
+#                    `fonte` troca o valor pelo da coluna indicada onde ela estiver
+#                    preenchida (correção já calculada fora, ex.: nome do mestre);
+#                    com `mensagem`, registra a correção (valor original x corrigido)
+#   obrigatorio   -> `campo` vazio
+#   dominio       -> `campo` fora de `valores`
+#   tamanho       -> `campo` com tamanho diferente de `tamanho` (ou, com `maximo`, acima dele)
+#   regex         -> `campo` não casa com `padrao` (inteiro)
+#   referencia    -> `campo` ausente do conjunto `contexto[conjunto]` (cross-reference);
+#                    aceita set ou array ordenado (índice de mestre, ver indice_mestre.py)
+#   funcao        -> `funcao(serie)` devolve máscara de válidos; erro onde for False
+#   numerico      -> `campo` não é número
+#   minimo        -> número em `campo` menor que `minimo`
+#   comparacao    -> número em `campo` `operador` número em `outro` (ex.: ESTMIN > ESTMAX)
+#
+# Chaves comuns: `coluna` (nome reportado), `campo` (coluna testada, padrão = coluna),
+# `valor` (coluna exibida em valor_encontrado; None = vazio; padrão = campo),
+# `quando` (lista de condições que restringem as linhas), `grupo` (liga/desliga por cliente).
+# Condições: (col, '==', v), (col, '!=', v), (col, 'in', valores), (col, 'preenchido'),
+# (col, 'tamanho', n).
+# Placeholders de mensagem: {valor} (valor corrigido / número testado), {tamanho}, {outro}.
+
+TIPOS_CHECAGEM = {'obrigatorio', 'dominio', 'tamanho', 'regex', 'referencia', 'funcao', 'numerico', 'minimo', 'comparacao'}
+OPERADORES = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le, '==': operator.eq, '!=': operator.ne}
+CONDICOES = {'==', '!=', 'in', 'preenchido', 'tamanho'}
+
+def maiusculas(serie):
+    """Normalização padrão dos campos de domínio: texto, maiúsculo e sem espaços nas pontas."""
+    return como_texto(serie).str.upper().str.strip()
+
+def sem_espacos(serie):
+    return como_texto(serie).str.strip()
+
+def converter_valor_monetario(serie):
+    """
+    Remove R$, pontos de milhar e substitui vírgula por ponto decimal. O ponto só é
+    milhar quando há vírgula no valor ('1.234,56') ou no padrão '1.234.567'; senão é o
+    ponto decimal ('32.65', comum em exportações de outros sistemas).
+    """
+    serie = como_texto(serie).str.strip().str.upper()
+    serie = serie.str.replace('R$', '', regex=False)
+    serie = serie.str.replace('$', '', regex=False).str.strip()
+    milhar = serie.str.contains(',', regex=False) | serie.str.fullmatch(r'-?\d{1,3}(?:\.\d{3})+')
+    serie = serie.where(~milhar, serie.str.replace('.', '', regex=False))
+    serie = serie.str.replace(',', '.', regex=False)
+    return pd.to_numeric(serie, errors='coerce')
+
+def _compilar_mensagem(mensagem):
+    """Quebra a mensagem em (literal, placeholder) para montar o texto em bloco."""
+    if mensagem is None: return None
+    partes = [(literal, campo) for literal, campo, _, _ in string.Formatter().parse(mensagem)]
+    if all(campo is None for _, campo in partes): return mensagem
+    return partes
+
+def _compilar_condicao(condicao, ordem):
+    if len(condicao) < 2 or condicao[1] not in CONDICOES:
+        raise ValueError(f"Regra {ordem}: condição inválida {condicao!r}.")
+    if condicao[1] == 'in': return (condicao[0], 'in', list(condicao[2]))
+    return tuple(condicao)
+
+def compilar_regras(regras):
+    """Valida e pré-processa a lista de regras de uma entidade (feito uma vez, no import)."""
+    compiladas = []
+    for ordem, regra in enumerate(regras):
+        tipo = regra.get('tipo')
+        if tipo != 'normalizacao' and tipo not in TIPOS_CHECAGEM:
+            raise ValueError(f"Regra {ordem}: tipo desconhecido '{tipo}'.")
+        c = dict(regra, ordem=ordem, grupo=regra.get('grupo', 'geral'),
+                 quando=[_compilar_condicao(q, ordem) for q in regra.get('quando', [])],
+                 mensagem=_compilar_mensagem(regra.get('mensagem')))
+
+        if tipo == 'normalizacao':
+            if not {'mapa', 'funcao', 'fonte'} & set(regra):
+                raise ValueError(f"Regra {ordem}: normalização de '{regra['coluna']}' sem 'mapa', 'funcao' nem 'fonte'.")
+            c['destino'] = regra.get('destino', regra['coluna'])
+            c['backup'] = regra.get('backup', c['mensagem'] is not None)
+            if c['mensagem'] is not None and (not c['backup'] or c['destino'] != regra['coluna']):
+                raise ValueError(f"Regra {ordem}: correção registrada exige backup da própria coluna.")
+            c['necessarias'] = {regra['coluna']} | ({regra['fonte']} if 'fonte' in regra else set())
+            compiladas.append(c)
+            continue
+
+        if c['mensagem'] is None:
+            raise ValueError(f"Regra {ordem}: checagem sem 'mensagem'.")
+        c['campo'] = regra.get('campo', regra['coluna'])
+        c['valor'] = regra.get('valor', c['campo'])
+        if tipo == 'dominio': c['valores'] = list(regra['valores'])
+        if tipo == 'regex': c['padrao'] = re.compile(regra['padrao']).pattern
+        if tipo == 'comparacao': c['comparar'] = OPERADORES[regra['operador']]
+        if tipo == 'tamanho': int(regra['maximo'] if 'maximo' in regra else regra['tamanho'])
+        if tipo == 'minimo': float(regra['minimo'])
+        if tipo == 'funcao' and not callable(regra.get('funcao')):
+            raise ValueError(f"Regra {ordem}: 'funcao' precisa ser chamável.")
+        c['necessarias'] = {c['campo']} | {q[0] for q in c['quando']}
+        if c['valor'] is not None: c['necessarias'].add(c['valor'])
+        if tipo == 'comparacao': c['necessarias'].add(regra['outro'])
+        compiladas.append(c)
+    return compiladas
+
+def versao_regras(regras, mestres=()):
+    """Impressão digital da lista de regras: muda quando qualquer regra muda (entra na chave de caches).
+    Funções entram pelo código-fonte (alterar o corpo muda a versão); `mestres` são nomes de snapshots
+    (indice_mestre) consultados pelas regras, cujo digest carregado também entra na versão."""
+    def _normalizar(valor):
+        if callable(valor): return impressao_codigo(valor)
+        if isinstance(valor, (set, frozenset)): return sorted(map(_normalizar, valor), key=str)
+        if isinstance(valor, dict): return {str(k): _normalizar(v) for k, v in valor.items()}
+        if isinstance(valor, (list, tuple)): return [_normalizar(v) for v in valor]
+        return valor
+    versoes_mestres = {nome: digest_carregado(nome) for nome in mestres}
+    return hashlib.sha256(json.dumps([_normalizar(regras), versoes_mestres], sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+def _mascara_condicoes(df, quando):
+    mascara = pd.Series(True, index=df.index)
+    for condicao in quando:
+        serie = df[condicao[0]]
+        if condicao[1] == '==': mascara &= serie == condicao[2]
+        elif condicao[1] == '!=': mascara &= serie != condicao[2]
+        elif condicao[1] == 'in': mascara &= serie.isin(condicao[2])
+        elif condicao[1] == 'preenchido': mascara &= como_texto(serie).str.strip() != ''
+        elif condicao[1] == 'tamanho': mascara &= como_texto(serie).str.len() == condicao[2]
+    return mascara
+
+def _montar_mensagem(mensagem, valores, sel):
+    """Monta o texto do erro só para as linhas selecionadas."""
+    if isinstance(mensagem, str): return mensagem
+    texto = pd.Series('', index=range(int(sel.sum())), dtype=object)
+    for literal, campo in mensagem:
+        texto = texto + literal
+        if campo is not None:
+            texto = texto + valores[campo][sel].map(str).to_numpy()
+    return texto.to_numpy()
+
+def _erros_em_bloco(sel, regra, coluna, valor_encontrado, mensagem, valor_corrigido=None):
+    """Gera de uma vez os registros de erro das linhas selecionadas (`sel` é um array booleano)."""
+    def _valores(v):
+        return v[sel].astype(str).to_numpy() if isinstance(v, pd.Series) else v
+    return pd.DataFrame({
+        "linha": sel.nonzero()[0], "coluna": coluna,
+        "valor_encontrado": _valores(valor_encontrado) if valor_encontrado is not None else "",
+        "valor_corrigido": _valores(valor_corrigido) if valor_corrigido is not None else "",
+        "erro": mensagem, "corrigido": valor_corrigido is not None, "_ordem": regra['ordem']
+    })
+
+def _numero(df, campo, cache):
+    if campo not in cache:
+        cache[campo] = pd.to_numeric(df[campo], errors='coerce').astype(float)
+    return cache[campo]
+
+def _checar(df, regra, contexto, numeros, condicao):
+    """Traduz uma regra de checagem em (máscara de erro, valores para a mensagem)."""
+    tipo, serie = regra['tipo'], df[regra['campo']]
+    valores = {'valor': serie}
+    if tipo == 'obrigatorio': erro = serie == ''
+    elif tipo == 'dominio': erro = ~serie.isin(regra['valores'])
+    elif tipo == 'tamanho':
+        valores['tamanho'] = como_texto(serie).str.len()
+        erro = valores['tamanho'] > regra['maximo'] if 'maximo' in regra else valores['tamanho'] != regra['tamanho']
+    elif tipo == 'regex': erro = ~como_texto(serie).str.fullmatch(regra['padrao']).fillna(False).astype(bool)
+    elif tipo == 'referencia':
+        conjunto = contexto[regra['conjunto']]
+        erro = ~(contem_em_indice(serie, conjunto) if isinstance(conjunto, np.ndarray) else serie.isin(conjunto))
+    elif tipo == 'funcao':
+        # Funções costumam ser as regras caras: só roda nas linhas que passam no `quando`
+        alvo = np.ones(len(df), dtype=bool) if condicao is None else condicao.to_numpy(dtype=bool)
+        valido = np.ones(len(df), dtype=bool)
+        if alvo.any(): valido[alvo] = np.asarray(regra['funcao'](serie[alvo]), dtype=bool)
+        erro = pd.Series(~valido, index=df.index)
+    else:
+        valores['valor'] = _numero(df, regra['campo'], numeros)
+        if tipo == 'numerico': erro = valores['valor'].isna()
+        elif tipo == 'minimo': erro = valores['valor'] < regra['minimo']
+        else:
+            valores['outro'] = _numero(df, regra['outro'], numeros)
+            erro = regra['comparar'](valores['valor'], valores['outro'])
+    return erro, valores
+
+def executar_regras(compiladas, df, contexto=None, grupos_desativados=(), colunas=COLUNAS_ERRO):
+    """Aplica as regras compiladas sobre o DataFrame (normalizações alteram o df no lugar).
+
+    Retorna a TabelaErros (campos na ordem de `colunas`), ordenada por linha e pela
+    posição da regra, sem duplicados. Com uma Medicao ativa (ver instrumentacao.py),
+    registra as etapas 'normalizacao' e 'regras' e, por regra, o tempo e as ocorrências.
+    """
+    contexto = contexto or {}
+    ativas = [r for r in compiladas if r['grupo'] not in grupos_desativados]
+    df_index = df.index
+    medicao = medicao_atual()
+    relogio = time.perf_counter
+
+    with etapa('normalizacao'):
+        # 1. Backups (_original) antes de qualquer correção, mesmo de grupos desligados
+        for regra in compiladas:
+            if regra['tipo'] == 'normalizacao' and regra['backup'] and regra['coluna'] in df.columns:
+                df[f"{regra['coluna']}_original"] = df[regra['coluna']].copy()
+
+        # 2. Normalizações
+        for regra in ativas:
+            if regra['tipo'] != 'normalizacao' or not regra['necessarias'] <= set(df.columns): continue
+            inicio = relogio()
+            serie = df[regra['coluna']]
+            if 'mapa' in regra: serie = maiusculas(serie).replace(regra['mapa'], regex=False)
+            if 'funcao' in regra: serie = regra['funcao'](serie)
+            if 'fonte' in regra: serie = serie.where(df[regra['fonte']] == '', df[regra['fonte']])
+            df[regra['destino']] = serie
+            if medicao: medicao.registrar_regra(regra, len(df), 0, relogio() - inicio)
+
+    # 3. Checagens e registros de correção
+    with etapa('regras'):
+        blocos, numeros = [], {}
+        for regra in ativas:
+            if not regra['necessarias'] <= set(df.columns): continue
+            if regra['tipo'] == 'normalizacao' and regra['mensagem'] is None: continue
+            inicio = relogio()
+            condicao = _mascara_condicoes(df, regra['quando']) if regra['quando'] else None
+            if regra['tipo'] == 'normalizacao':
+                original, corrigido = df[f"{regra['coluna']}_original"], df[regra['coluna']]
+                erro, valores = corrigido != original, {'valor': corrigido}
+            else:
+                erro, valores = _checar(df, regra, contexto, numeros, condicao)
+            if condicao is not None: erro = erro & condicao
+            sel = erro.fillna(False).to_numpy(dtype=bool)
+            ocorrencias = int(sel.sum())
+            if ocorrencias:
+                mensagem = _montar_mensagem(regra['mensagem'], valores, sel)
+                if regra['tipo'] == 'normalizacao':
+                    blocos.append(_erros_em_bloco(sel, regra, regra['coluna'], original, mensagem, corrigido))
+                else:
+                    valor = df[regra['valor']] if regra['valor'] is not None else None
+                    blocos.append(_erros_em_bloco(sel, regra, regra['coluna'], valor, mensagem))
+            # Linhas de uma normalização já foram contadas na etapa anterior
+            if medicao: medicao.registrar_regra(regra, 0 if regra['tipo'] == 'normalizacao' else len(df), ocorrencias,
+                                                relogio() - inicio)
+
+        if not blocos: return TabelaErros.vazia(colunas)
+        df_erros = pd.concat(blocos, ignore_index=True)
+        # Posição -> número da linha no arquivo (cabeçalho = linha 1)
+        df_erros['linha'] = df_index.to_numpy()[df_erros['linha'].to_numpy()] + 2
+        df_erros = df_erros.sort_values(['linha', '_ordem'], kind='stable')
+        return TabelaErros.de_colunas(df_erros, colunas)
@@ -0,0 +1,92 @@
+import logging
+from functools import partial
+
+import pandas as pd
+
+from instrumentacao import etapa, medir_validacao
+from processamento_paralelo import LINHAS_MINIMAS_PARALELO, mapear_em_paralelo, validar_em_paralelo
+from tabela_erros import TabelaErros
+
+logger = logging.getLogger(__name__)
+
+# --- Validação em Lotes (Streaming) ---
+# Para arquivos de vários GB: o CSV é lido em blocos de tamanho fixo, cada bloco passa
+# pelo mesmo validador do modo normal e o resultado (planilha corrigida + relatório
+# de erros) é anexado em disco. A memória fica limitada ao tamanho do bloco.
+#
+# Os blocos do pandas (chunksize) mantêm o índice contínuo entre si, então o número
+# da linha (índice + 2) continua batendo com o arquivo original. Como a linha faz parte
+# de cada registro, o drop_duplicates por bloco equivale ao drop_duplicates global.
+# A conferência de chaves duplicadas (ver duplicidades.py) não é por linha: o detector
+# recebe a saída corrigida de cada lote e os erros dele vão ao fim do relatório.
+
+TAMANHO_LOTE_PADRAO = 100_000
+TAMANHO_BLOCO_PROGRESSO = 50_000
+
+def validar_em_lotes(lotes, validar_lote, caminho_corrigido, caminho_erros, colunas_erro, processos=None, duplicidades=None):
+    """
+    Valida um iterável de DataFrames e grava os resultados incrementalmente.
+    `validar_lote(df)` segue o contrato dos validadores: (erros, df_corrigido), com
+    df_corrigido None em caso de erro crítico (que interrompe o processamento).
+    Com `processos` > 1, os lotes são validados em paralelo (ver processamento_paralelo.py)
+    e gravados na ordem do arquivo. `duplicidades` (DetectorDuplicidades) opcional confere
+    as chaves únicas depois do último lote.
+    Retorna: (erros_criticos, resumo) — erros_criticos vazio em caso de sucesso.
+    """
+    resumo = {"linhas": 0, "erros": 0, "bloqueantes": 0, "lotes": 0,
+              "caminho_corrigido": caminho_corrigido, "caminho_erros": caminho_erros}
+
+    with open(caminho_corrigido, 'w', encoding='utf-8', newline='') as f_corrigido, \
+         open(caminho_erros, 'w', encoding='utf-8', newline='') as f_erros:
+        pd.DataFrame(columns=colunas_erro).to_csv(f_erros, sep=';', index=False)
+
+        resultados = mapear_em_paralelo(lotes, validar_lote, processos) if processos and processos > 1 \
+            else map(partial(medir_validacao, validar_lote), lotes)
+        for erros, df_corrigido in resultados:
+            if df_corrigido is None:
+                return erros, None
+
+            with etapa('gravacao'):
+                df_corrigido.to_csv(f_corrigido, sep=';', index=False, header=resumo["lotes"] == 0)
+                if len(erros):
+                    erros.para_csv(f_erros, cabecalho=False)
+
+            resumo["lotes"] += 1
+            resumo["linhas"] += len(df_corrigido)
+            resumo["erros"] += len(erros)
+            resumo["bloqueantes"] += erros.bloqueantes()
+            if duplicidades is not None: duplicidades.observar(df_corrigido)
+            logger.info("Lote %d: %d linhas validadas, %d erros até agora.", resumo['lotes'], resumo['linhas'], resumo['erros'])
+
+        if duplicidades is not None:
+            erros = duplicidades.erros(colunas_erro)
+            with etapa('gravacao'):
+                if len(erros): erros.para_csv(f_erros, cabecalho=False)
+            resumo["erros"] += len(erros)
+            resumo["bloqueantes"] += erros.bloqueantes()
+            logger.info("Chaves duplicadas: %d ocorrências.", len(erros))
+
+    return [], resumo
+
+def validar_em_blocos(df, validar_bloco, progresso=None, tamanho_bloco=TAMANHO_BLOCO_PROGRESSO, processos=None):
+    """
+    Valida um DataFrame já lido em fatias de `tamanho_bloco` linhas, chamando
+    `progresso('validacao', feitas, total)` entre elas (é onde uma tarefa pode ser cancelada).
+    Pelo mesmo motivo do modo em lotes, o resultado é igual ao de validar o df inteiro.
+    Sem `progresso`, valida tudo de uma vez. Com `processos` > 1 e arquivo grande
+    (LINHAS_MINIMAS_PARALELO), as fatias vão para um pool de processos.
+    """
+    if processos and processos > 1 and len(df) >= LINHAS_MINIMAS_PARALELO:
+        return validar_em_paralelo(df, validar_bloco, processos, progresso)
+    if progresso is None: return medir_validacao(validar_bloco, df)
+    total = len(df)
+    erros, partes = [], []
+    progresso('validacao', 0, total)
+    for inicio in range(0, max(total, 1), tamanho_bloco):
+        erros_bloco, df_bloco = medir_validacao(validar_bloco, df.iloc[inicio:inicio + tamanho_bloco])
+        if df_bloco is None:
+            return erros_bloco, None
+        erros.append(erros_bloco)
+        partes.append(df_bloco)
+        progresso('validacao', min(inicio + tamanho_bloco, total), total)
+    return TabelaErros.concatenar(erros), partes[0] if len(partes) == 1 else pd.concat(partes)
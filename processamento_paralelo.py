@@ -0,0 +1,129 @@
+import functools
+import math
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from instrumentacao import Medicao, medicao_atual, medir_validacao
+from tabela_erros import TabelaErros
+
+# --- Validação Paralela (vários núcleos) ---
+# O DataFrame (ou o fluxo de blocos do modo em lotes) é dividido em faixas de linhas e
+# cada faixa vai para um processo do pool. Como o índice de cada faixa continua sendo
+# o do arquivo, "índice + 2" segue dando a linha certa; juntando os resultados na ordem
+# das faixas, os erros ficam na mesma ordem (linha, regra) do modo normal, e o
+# drop_duplicates por faixa equivale ao global (a linha faz parte do registro).
+#
+# Mestres não viajam com as tarefas: a função de validação (um functools.partial de
+# função de módulo) é entregue uma vez por processo, no initializer. Arrays de snapshot
+# (np.memmap) vão só com o caminho do .npy e são reabertos por mmap no processo filho,
+# então todos os núcleos leem o mesmo mestre pelo cache de páginas do sistema. Os mapas
+# de cidade/UF já são carregados assim no import de validador_de_parceiro.
+
+LINHAS_MINIMAS_PARALELO = 100_000
+PARTICOES_POR_PROCESSO = 2
+
+class _ArrayMapeado:
+    """Marca de um np.memmap: viaja só o caminho; o processo filho reabre o arquivo."""
+    def __init__(self, caminho):
+        self.caminho = caminho
+
+def _compartilhar(valor):
+    if isinstance(valor, np.memmap) and getattr(valor, 'filename', None):
+        return _ArrayMapeado(valor.filename)
+    return valor
+
+def _restaurar(valor):
+    if isinstance(valor, _ArrayMapeado):
+        return np.load(valor.caminho, mmap_mode='r')
+    return valor
+
+def _preparar(funcao, restaurar=False):
+    """Troca (ou destroca) os memmaps dos argumentos de um functools.partial pelas marcas."""
+    if not isinstance(funcao, functools.partial): return funcao
+    trocar = _restaurar if restaurar else _compartilhar
+    return functools.partial(funcao.func, *map(trocar, funcao.args),
+                             **{k: trocar(v) for k, v in funcao.keywords.items()})
+
+_FUNCAO_DO_PROCESSO = None
+
+def _inicializar(funcao):
+    global _FUNCAO_DO_PROCESSO
+    _FUNCAO_DO_PROCESSO = _preparar(funcao, restaurar=True)
+
+def _validar_particao(df, medir=False):
+    if not medir: return _FUNCAO_DO_PROCESSO(df)
+    # Medicao local da faixa: volta junto com o resultado e é somada à do processo principal
+    with Medicao(publicar=False) as medicao:
+        resultado = medir_validacao(_FUNCAO_DO_PROCESSO, df)
+    return resultado, medicao.parcial()
+
+def contexto_processos():
+    """Contexto de multiprocessing dos pools do projeto (forkserver, ou spawn onde não existe)."""
+    metodo = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+    # forkserver: o app pode ter threads rodando (Streamlit, tarefas), e fork com threads é inseguro
+    return multiprocessing.get_context(metodo)
+
+def _criar_pool(validar_bloco, processos):
+    return ProcessPoolExecutor(max_workers=processos, mp_context=contexto_processos(),
+                               initializer=_inicializar, initargs=(_preparar(validar_bloco),))
+
+def mapear_em_paralelo(blocos, validar_bloco, processos, progresso=None, total=0):
+    """
+    Valida um iterável de DataFrames no pool e devolve os resultados NA ORDEM dos blocos
+    (gerador). No máximo `PARTICOES_POR_PROCESSO * processos` blocos ficam em voo, então o
+    modo em lotes continua com memória limitada. `validar_bloco` precisa ser "picklável"
+    (função de módulo ou functools.partial de uma).
+    """
+    feitas, medicao = 0, medicao_atual()
+    with _criar_pool(validar_bloco, processos) as pool:
+        pendentes, prontos, proximo = {}, {}, 0
+        try:
+            for posicao, bloco in enumerate(blocos):
+                pendentes[pool.submit(_validar_particao, bloco, medicao is not None)] = (posicao, len(bloco))
+                while len(pendentes) >= PARTICOES_POR_PROCESSO * processos:
+                    feitas += _recolher(pendentes, prontos, medicao)
+                    if progresso: progresso('validacao', feitas, total or feitas)
+                    while proximo in prontos:
+                        yield prontos.pop(proximo); proximo += 1
+            while pendentes:
+                feitas += _recolher(pendentes, prontos, medicao)
+                if progresso: progresso('validacao', feitas, total or feitas)
+                while proximo in prontos:
+                    yield prontos.pop(proximo); proximo += 1
+        except BaseException:
+            # Cancelamento (ou erro): não deixa o pool processando o resto
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+def _recolher(pendentes, prontos, medicao=None):
+    concluidos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+    linhas = 0
+    for futuro in concluidos:
+        posicao, tamanho = pendentes.pop(futuro)
+        resultado = futuro.result()
+        if medicao is not None:
+            resultado, parcial = resultado
+            medicao.juntar(parcial)
+        prontos[posicao] = resultado
+        linhas += tamanho
+    return linhas
+
+def validar_em_paralelo(df, validar_bloco, processos, progresso=None):
+    """
+    Versão multi-processo de processamento_em_lotes.validar_em_blocos para um DataFrame
+    já lido: mesmo contrato e mesmo resultado, com ~PARTICOES_POR_PROCESSO faixas por processo.
+    """
+    total = len(df)
+    tamanho = max(1, math.ceil(total / (processos * PARTICOES_POR_PROCESSO)))
+    particoes = (df.iloc[inicio:inicio + tamanho] for inicio in range(0, total, tamanho))
+    if progresso: progresso('validacao', 0, total)
+    erros, partes = [], []
+    for erros_particao, df_particao in mapear_em_paralelo(particoes, validar_bloco, processos, progresso, total):
+        if df_particao is None:
+            return erros_particao, None
+        erros.append(erros_particao)
+        partes.append(df_particao)
+    return TabelaErros.concatenar(erros), pd.concat(partes)
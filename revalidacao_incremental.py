@@ -0,0 +1,113 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+from instrumentacao import contar, etapa
+from processamento_em_lotes import validar_em_blocos
+from tabela_erros import TabelaErros
+
+logger = logging.getLogger(__name__)
+
+# --- Revalidação Incremental ---
+# O ciclo da migração é validar, corrigir algumas centenas de linhas na planilha e reenviar
+# o mesmo arquivo de 1M linhas. Todas as regras são por linha (o resultado de uma linha só
+# depende do conteúdo dela, das regras e dos mestres; é o que já permite validar em blocos),
+# então a validação anterior do mesmo arquivo lógico pode ser reaproveitada:
+#
+#   1. cada linha lida vira um hash de 128 bits do conteúdo (dois hashes de 64 bits);
+#   2. linhas cujo hash já existia na validação anterior reaproveitam os erros e a linha
+#      corrigida de lá, com o número da linha trocado pela posição atual (linhas inseridas
+#      ou removidas acima deslocam todo o resto);
+#   3. só as linhas novas ou alteradas passam pelo validador.
+#
+# O estado fica no `historico` (um CacheLRU, ver cache_resultados.py) sob uma chave que
+# identifica o arquivo lógico (tela + nome do arquivo + aba + mestre) e a versão das regras.
+# Como o reaproveitamento é pelo conteúdo, usar o estado de outro arquivo com o mesmo nome
+# não erra: só reaproveita menos. Mudou o cabeçalho ou as colunas da saída -> validação completa.
+
+CHAVE_HASH_2 = 'validador-erp-02'  # 16 caracteres (exigência do hash_pandas_object)
+
+def hash_linhas(df):
+    """Dois hashes de 64 bits por linha, do conteúdo de todas as colunas (sem o índice)."""
+    return (pd.util.hash_pandas_object(df, index=False).to_numpy(),
+            pd.util.hash_pandas_object(df, index=False, hash_key=CHAVE_HASH_2).to_numpy())
+
+def posicoes_anteriores(hashes_anteriores, hashes):
+    """Para cada linha atual, a posição de uma linha de mesmo conteúdo na validação anterior (ou -1)."""
+    (h1_ant, h2_ant), (h1, h2) = hashes_anteriores, hashes
+    if not len(h1_ant): return np.full(len(h1), -1, dtype=np.int64)
+    unicos, primeira = np.unique(h1_ant, return_index=True)
+    pos = np.minimum(np.searchsorted(unicos, h1), len(unicos) - 1)
+    anterior = primeira[pos]
+    achou = (unicos[pos] == h1) & (h2_ant[anterior] == h2)
+    return np.where(achou, anterior, -1)
+
+def _erros_reaproveitados(estado, anteriores, linhas_novas):
+    """Erros das linhas anteriores `anteriores`, renumerados para `linhas_novas` (mesma ordem)."""
+    erros = estado['erros']
+    linhas_erro = erros.df['linha'].to_numpy()
+    # Erros ordenados por linha: os de cada linha anterior formam um trecho contínuo
+    pos_erro = pd.Index(estado['linhas']).get_indexer(linhas_erro)
+    inicio = np.searchsorted(pos_erro, anteriores, 'left')
+    quantidades = np.searchsorted(pos_erro, anteriores, 'right') - inicio
+    total = int(quantidades.sum())
+    antes = np.repeat(np.cumsum(quantidades) - quantidades, quantidades)
+    selecao = np.repeat(inicio, quantidades) + (np.arange(total) - antes)
+    df = erros.df.iloc[selecao].copy()
+    df['linha'] = np.repeat(linhas_novas, quantidades).astype(np.int32)
+    return TabelaErros(df, erros.colunas)
+
+def _juntar_erros(tabelas):
+    erros = TabelaErros.concatenar(tabelas)
+    ordem = np.argsort(erros.df['linha'].to_numpy(), kind='stable')
+    return TabelaErros(erros.df.iloc[ordem], erros.colunas)
+
+def _guardar(historico, chave, df, hashes, resultado):
+    erros, df_corrigido = resultado
+    if df_corrigido is None or len(df_corrigido) != len(df): return
+    historico.guardar(chave, {'colunas': list(df.columns), 'hashes': hashes, 'linhas': df.index.to_numpy() + 2,
+                              'erros': erros, 'corrigido': df_corrigido})
+
+def validar_incremental(df, validar_bloco, historico, chave, progresso=None, processos=None):
+    """
+    Como validar_em_blocos, mas reaproveitando a validação anterior guardada em
+    historico[chave]: só as linhas novas ou alteradas vão para `validar_bloco`.
+    Guarda o novo estado no histórico. Retorna (erros, df_corrigido), como os validadores.
+    """
+    if progresso: progresso('comparacao')
+    with etapa('comparacao'):
+        hashes = hash_linhas(df)
+        estado = historico.obter(chave)
+        if estado is not None and estado['colunas'] == list(df.columns):
+            anteriores = posicoes_anteriores(estado['hashes'], hashes)
+    if estado is None or estado['colunas'] != list(df.columns):
+        resultado = validar_em_blocos(df, validar_bloco, progresso, processos=processos)
+        _guardar(historico, chave, df, hashes, resultado)
+        return resultado
+
+    reaproveitar = anteriores >= 0
+    alteradas = np.flatnonzero(~reaproveitar)
+    contar('linhas_reaproveitadas', int(reaproveitar.sum()))
+    logger.info("Revalidação incremental: %d de %d linhas sem alteração; validando %d.",
+                int(reaproveitar.sum()), len(df), len(alteradas))
+
+    erros_novos, corrigido_novo = TabelaErros.vazia(estado['erros'].colunas), estado['corrigido'].iloc[:0]
+    if len(alteradas):
+        erros_novos, corrigido_novo = validar_em_blocos(df.iloc[alteradas], validar_bloco, progresso, processos=processos)
+        if corrigido_novo is None: return erros_novos, None
+        if list(corrigido_novo.columns) != list(estado['corrigido'].columns):
+            # A saída mudou de formato (ex.: coluna opcional passou a existir): refaz tudo
+            historico.guardar(chave, None, 0)
+            return validar_incremental(df, validar_bloco, historico, chave, progresso, processos)
+
+    mantidas = np.flatnonzero(reaproveitar)
+    erros = _juntar_erros([_erros_reaproveitados(estado, anteriores[mantidas], df.index.to_numpy()[mantidas] + 2),
+                           erros_novos])
+    corrigido_mantido = estado['corrigido'].iloc[anteriores[mantidas]]
+    corrigido_mantido.index = df.index[mantidas]
+    ordem = np.argsort(np.concatenate([mantidas, alteradas]), kind='stable')
+    df_corrigido = pd.concat([corrigido_mantido, corrigido_novo]).iloc[ordem]
+
+    _guardar(historico, chave, df, hashes, (erros, df_corrigido))
+    return erros, df_corrigido
@@ -0,0 +1,387 @@
+import argparse
+import contextlib
+import gzip
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from instrumentacao import Medicao, etapa
+from processamento_paralelo import contexto_processos
+
+# --- Serviço HTTP de Validação ---
+# Expõe os mesmos validadores do app para outros sistemas, só com a biblioteca padrão.
+# O corpo da requisição (o CSV) é lido em pedaços e vai para um arquivo temporário; a
+# validação roda num pool de processos pré-criado, em que cada processo carrega os
+# mestres uma única vez (cidades/UF no import do validador de parceiros, produtos no
+# initializer). A resposta sai como JSON, NDJSON em streaming ou CSV (gzip quando o cliente
+# aceita: Accept-Encoding).
+#
+#   POST /validar/<parceiros|produtos|estoque>?formato=json|ndjson|csv[&conteudo=erros|corrigido][&desativar=GRUPO]
+#        [&carga=NOME&arquivo=NOME]  -> confere chaves únicas contra os outros arquivos da carga (duplicidades.py)
+#   GET  /metricas   -> fila, em execução, limites, requisições/s, linhas/s
+#   GET  /saude      -> 200, ou 503 quando a fila está cheia (para o balanceador); "avisos" lista
+#                       mestres opcionais ausentes (ex.: tabela NCM: NCM conferido só no formato)
+#
+# Limites: no máximo `max_simultaneas` validações rodando (uma por processo) e
+# `max_fila` esperando; além disso a requisição recebe 503 com Retry-After.
+
+ENTIDADES = ('parceiros', 'produtos', 'estoque')
+FORMATOS = ('json', 'ndjson', 'csv')
+TAMANHO_PEDACO = 1024 * 1024
+LINHAS_POR_PEDACO_CSV = 50_000
+MAX_FILA_PADRAO = 32
+MAX_CORPO_MB_PADRAO = 512
+
+# --- Processo de validação (pool) ---
+_MESTRE_PRODUTOS = None
+
+def _inicializar_processo(caminho_mestre):
+    """Carrega os validadores e os mestres uma vez por processo do pool."""
+    global _MESTRE_PRODUTOS
+    import validador_de_parceiro, validador_de_produto  # noqa: F401 (mestres de cidade/UF carregam no import)
+    from validador_de_estoque import carregar_mestre
+    if caminho_mestre:
+        _MESTRE_PRODUTOS = carregar_mestre(caminho_mestre, 'CODPROD')
+
+def _aquecer():
+    """Confirma que o processo subiu; devolve os avisos dos mestres carregados nele (para /saude)."""
+    from validador_de_produto import aviso_tabela_ncm
+    return [aviso for aviso in [aviso_tabela_ncm()] if aviso]
+
+def _validar_no_processo(entidade, caminho, grupos_desativados, caminho_corrigido=None, carga=None, arquivo=None):
+    """Valida o arquivo recebido; devolve (erros, linhas, falhou). O corrigido vai para disco, se pedido."""
+    # O manifesto da execução vai para os ganchos configurados por variável de ambiente (ver instrumentacao.py)
+    with Medicao(f"http {entidade}", entidade=entidade) as medicao:
+        erros, linhas, falhou = _validar_entidade(entidade, caminho, grupos_desativados, caminho_corrigido, carga, arquivo)
+        if falhou:
+            medicao.registrar_resultado((erros, None))
+        else:
+            medicao.contadores.update(linhas_saida=linhas, erros=len(erros), bloqueantes=erros.bloqueantes())
+    return erros, linhas, falhou
+
+def _validar_entidade(entidade, caminho, grupos_desativados, caminho_corrigido, carga=None, arquivo=None):
+    if entidade == 'parceiros':
+        from validador_de_parceiro import validar_parceiros
+        erros, df = validar_parceiros(caminho, grupos_desativados, carga=carga, arquivo=arquivo)
+    elif entidade == 'produtos':
+        from validador_de_produto import validar_produtos
+        erros, df = validar_produtos(caminho, grupos_desativados, carga=carga, arquivo=arquivo)
+    else:
+        from validador_de_estoque import validar_estoque
+        if _MESTRE_PRODUTOS is None:
+            return [{"linha": 0, "erro": "Serviço iniciado sem mestre de produtos (--mestre)."}], 0, True
+        erros, df = validar_estoque(caminho, _MESTRE_PRODUTOS, grupos_desativados)
+    if df is None:
+        return erros, 0, True
+    if caminho_corrigido:
+        with etapa('gravacao'):
+            df.to_csv(caminho_corrigido, sep=';', index=False)
+    return erros, len(df), False
+
+# --- Controle de concorrência e métricas ---
+class FilaCheia(Exception):
+    """Não há vaga nem na execução nem na fila de espera."""
+
+class CorpoGrande(ValueError):
+    """O CSV enviado passa de `max_corpo_bytes`."""
+
+class ControleCarga:
+    """Limita validações simultâneas/na fila e acumula as métricas do serviço (seguro entre threads)."""
+
+    def __init__(self, max_simultaneas, max_fila):
+        self.max_simultaneas = max_simultaneas
+        self.max_fila = max_fila
+        self._vagas = threading.Semaphore(max_simultaneas)
+        self._trava = threading.Lock()
+        self.inicio = time.time()
+        self.na_fila = self.em_execucao = 0
+        self.atendidas = self.rejeitadas = self.falhas = 0
+        self.linhas = 0
+        self.segundos_validando = 0.0
+
+    def entrar(self):
+        with self._trava:
+            if self.na_fila + self.em_execucao >= self.max_simultaneas + self.max_fila:
+                self.rejeitadas += 1
+                raise FilaCheia()
+            self.na_fila += 1
+        self._vagas.acquire()
+        with self._trava:
+            self.na_fila -= 1
+            self.em_execucao += 1
+
+    def sair(self, linhas, segundos, falhou):
+        with self._trava:
+            self.em_execucao -= 1
+            self.atendidas += 1
+            self.falhas += falhou
+            self.linhas += linhas
+            self.segundos_validando += segundos
+        self._vagas.release()
+
+    def saturado(self):
+        with self._trava:
+            return self.na_fila >= self.max_fila
+
+    def metricas(self):
+        with self._trava:
+            decorrido = max(time.time() - self.inicio, 1e-9)
+            return {"fila": self.na_fila, "em_execucao": self.em_execucao,
+                    "max_simultaneas": self.max_simultaneas, "max_fila": self.max_fila,
+                    "atendidas": self.atendidas, "rejeitadas": self.rejeitadas, "falhas": self.falhas,
+                    "linhas": self.linhas, "segundos_ativo": round(decorrido, 1),
+                    "requisicoes_por_segundo": round(self.atendidas / decorrido, 3),
+                    "linhas_por_segundo_validando": round(self.linhas / self.segundos_validando, 1) if self.segundos_validando else 0.0}
+
+# --- Respostas ---
+class _SaidaChunked:
+    """Arquivo só de escrita que envia cada write() como um pedaço HTTP/1.1 (Transfer-Encoding: chunked)."""
+
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, dados):
+        if isinstance(dados, str): dados = dados.encode('utf-8')
+        if dados:
+            self.wfile.write(f"{len(dados):X}\r\n".encode('ascii') + dados + b"\r\n")
+        return len(dados)
+
+    def flush(self):
+        self.wfile.flush()
+
+    def fechar(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+def _json(valor):
+    return json.dumps(valor, ensure_ascii=False, default=str)
+
+class ManipuladorValidacao(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'ValidadorERP/1.0'
+    # definidos por criar_servidor
+    pool = None
+    controle = None
+    max_corpo_bytes = MAX_CORPO_MB_PADRAO * 1024 * 1024
+    pasta_temporaria = None
+    avisos = ()
+
+    def log_message(self, formato, *args):
+        sys.stderr.write(f"[{self.log_date_time_string()}] {self.address_string()} {formato % args}\n")
+
+    def _responder_json(self, status, corpo, cabecalhos=()):
+        dados = _json(corpo).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(dados)))
+        for nome, valor in cabecalhos: self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def do_GET(self):
+        rota = urlparse(self.path).path.rstrip('/')
+        if rota == '/metricas':
+            self._responder_json(200, self.controle.metricas())
+        elif rota == '/saude':
+            saturado = self.controle.saturado()
+            saude = {"status": "saturado" if saturado else "ok"}
+            if self.avisos: saude["avisos"] = self.avisos
+            self._responder_json(503 if saturado else 200, saude)
+        else:
+            self._responder_json(404, {"erro": "Rota não encontrada."})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        partes = url.path.strip('/').split('/')
+        if len(partes) != 2 or partes[0] != 'validar' or partes[1] not in ENTIDADES:
+            self._descartar_corpo()
+            return self._responder_json(404, {"erro": f"Use POST /validar/<{'|'.join(ENTIDADES)}>."})
+        entidade = partes[1]
+        parametros = parse_qs(url.query)
+        formato = parametros.get('formato', ['json'])[0]
+        conteudo = parametros.get('conteudo', ['erros'])[0]
+        if formato not in FORMATOS or conteudo not in ('erros', 'corrigido') or (conteudo == 'corrigido' and formato != 'csv'):
+            self._descartar_corpo()
+            return self._responder_json(400, {"erro": "Parâmetros inválidos: formato=json|ndjson|csv; conteudo=corrigido só com formato=csv."})
+        grupos = tuple(parametros.get('desativar', []))
+        carga, arquivo = parametros.get('carga', [None])[0], parametros.get('arquivo', [None])[0]
+        if carga and not arquivo:
+            # O corpo não tem nome: sem `arquivo`, reenvios não substituiriam o índice anterior na carga
+            self._descartar_corpo()
+            return self._responder_json(400, {"erro": "Com carga=NOME, informe também arquivo=NOME (identifica o arquivo na carga)."})
+
+        # 1. Recebe o corpo em pedaços direto para o disco
+        with tempfile.TemporaryDirectory(dir=self.pasta_temporaria, prefix='validacao_') as pasta:
+            caminho = os.path.join(pasta, 'entrada.csv')
+            try:
+                self._gravar_corpo(caminho)
+            except ValueError as e:
+                self.close_connection = True
+                return self._responder_json(413 if isinstance(e, CorpoGrande) else 400, {"erro": str(e)})
+
+            # 2. Espera vaga e valida num processo do pool
+            try:
+                self.controle.entrar()
+            except FilaCheia:
+                return self._responder_json(503, {"erro": "Serviço saturado, tente novamente."}, [('Retry-After', '1')])
+            inicio, linhas, falhou = time.perf_counter(), 0, True
+            caminho_corrigido = os.path.join(pasta, 'corrigido.csv') if conteudo == 'corrigido' else None
+            try:
+                erros, linhas, falhou = self.pool.submit(_validar_no_processo, entidade, caminho, grupos, caminho_corrigido,
+                                                             carga, arquivo).result()
+            except Exception as e:
+                return self._responder_json(500, {"erro": f"{type(e).__name__}: {e}"})
+            finally:
+                self.controle.sair(linhas, time.perf_counter() - inicio, falhou)
+
+            # 3. Responde no formato pedido
+            if falhou:
+                return self._responder_json(422, {"linhas": 0, "total_erros": len(erros), "erros": erros})
+            if formato == 'json':
+                return self._responder_json(200, {"linhas": linhas, "total_erros": len(erros), "erros": erros.para_registros()})
+            if formato == 'ndjson':
+                return self._enviar_ndjson(erros, linhas)
+            self._enviar_csv(erros, caminho_corrigido)
+
+    def _gravar_corpo(self, caminho):
+        """Copia o corpo (Content-Length ou chunked) para `caminho` sem montá-lo na memória."""
+        recebidos = 0
+        with open(caminho, 'wb') as destino:
+            for pedaco in self._ler_corpo():
+                recebidos += len(pedaco)
+                if recebidos > self.max_corpo_bytes:
+                    raise CorpoGrande(f"Corpo acima do limite de {self.max_corpo_bytes // 1024 ** 2} MB.")
+                destino.write(pedaco)
+        if not recebidos:
+            raise ValueError("Corpo vazio: envie o CSV no corpo da requisição.")
+
+    def _ler_corpo(self):
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            while True:
+                tamanho = int(self.rfile.readline().split(b';')[0].strip() or b'0', 16)
+                if tamanho == 0:
+                    while self.rfile.readline().strip(): pass  # trailers
+                    return
+                restante = tamanho
+                while restante:
+                    pedaco = self.rfile.read(min(restante, TAMANHO_PEDACO))
+                    if not pedaco: raise ValueError("Corpo incompleto.")
+                    restante -= len(pedaco)
+                    yield pedaco
+                self.rfile.readline()
+        else:
+            restante = int(self.headers.get('Content-Length') or 0)
+            while restante:
+                pedaco = self.rfile.read(min(restante, TAMANHO_PEDACO))
+                if not pedaco: raise ValueError("Corpo incompleto.")
+                restante -= len(pedaco)
+                yield pedaco
+
+    def _descartar_corpo(self):
+        try:
+            for _ in self._ler_corpo(): pass
+        except ValueError:
+            self.close_connection = True
+
+    def _iniciar_chunked(self, tipo, cabecalhos=()):
+        self.send_response(200)
+        self.send_header('Content-Type', tipo)
+        self.send_header('Transfer-Encoding', 'chunked')
+        for nome, valor in cabecalhos: self.send_header(nome, valor)
+        self.end_headers()
+        return _SaidaChunked(self.wfile)
+
+    def _enviar_ndjson(self, erros, linhas):
+        """Um erro por linha e, por último, o resumo — o cliente processa conforme chega."""
+        saida = self._iniciar_chunked('application/x-ndjson; charset=utf-8')
+        for fatia in erros.fatias(1000):
+            saida.write(''.join(_json(e) + '\n' for e in fatia.to_dict('records')))
+        saida.write(_json({"resumo": {"linhas": linhas, "total_erros": len(erros)}}) + '\n')
+        saida.fechar()
+
+    def _aceita_gzip(self):
+        """Se o cliente aceita resposta gzip (Accept-Encoding com gzip ou *, sem q=0)."""
+        for item in self.headers.get('Accept-Encoding', '').lower().split(','):
+            nome, _, parametros = item.partition(';')
+            if nome.strip() not in ('gzip', '*'): continue
+            try:
+                return float(parametros.replace(' ', '').removeprefix('q=') or 1) > 0
+            except ValueError:
+                return True
+        return False
+
+    def _enviar_csv(self, erros, caminho_corrigido=None):
+        """
+        Relatório de erros (ou a planilha corrigida) em CSV ';', gerado em pedaços; comprimido
+        (Content-Encoding: gzip) só quando o cliente aceita.
+        """
+        gzip_aceito = self._aceita_gzip()
+        cabecalhos = [('Vary', 'Accept-Encoding')] + ([('Content-Encoding', 'gzip')] if gzip_aceito else [])
+        saida = self._iniciar_chunked('text/csv; charset=utf-8', cabecalhos)
+        destino = gzip.GzipFile(fileobj=saida, mode='wb', compresslevel=6) if gzip_aceito else contextlib.nullcontext(saida)
+        with destino as compactado:
+            if caminho_corrigido:
+                with open(caminho_corrigido, 'rb') as origem:
+                    shutil.copyfileobj(origem, compactado, TAMANHO_PEDACO)
+            else:
+                for numero, fatia in enumerate(erros.fatias(LINHAS_POR_PEDACO_CSV)):
+                    fatia.to_csv(compactado, sep=';', index=False, header=numero == 0)
+                if not len(erros):
+                    erros.para_csv(compactado)  # só o cabeçalho
+        saida.fechar()
+
+# --- Inicialização ---
+def criar_servidor(host='127.0.0.1', porta=8000, trabalhadores=None, max_fila=MAX_FILA_PADRAO,
+                   max_corpo_mb=MAX_CORPO_MB_PADRAO, caminho_mestre=None, pasta_temporaria=None):
+    """Cria o pool pré-aquecido e o servidor HTTP (ainda sem atender; use serve_forever)."""
+    trabalhadores = trabalhadores or os.cpu_count() or 1
+    if caminho_mestre:
+        # Compila o snapshot do mestre uma vez aqui; os processos só o abrem por mmap
+        from validador_de_estoque import carregar_mestre
+        if carregar_mestre(caminho_mestre, 'CODPROD') is None:
+            raise ValueError(f"Não foi possível carregar o mestre de produtos '{caminho_mestre}'.")
+    pool = ProcessPoolExecutor(max_workers=trabalhadores, mp_context=contexto_processos(),
+                               initializer=_inicializar_processo, initargs=(caminho_mestre,))
+    avisos = []
+    for futuro in [pool.submit(_aquecer) for _ in range(trabalhadores)]:
+        avisos = futuro.result()
+
+    manipulador = type('Manipulador', (ManipuladorValidacao,), {
+        'pool': pool, 'controle': ControleCarga(trabalhadores, max_fila), 'avisos': avisos,
+        'max_corpo_bytes': max_corpo_mb * 1024 * 1024, 'pasta_temporaria': pasta_temporaria})
+    servidor = ThreadingHTTPServer((host, porta), manipulador)
+    servidor.daemon_threads = True
+    servidor.pool = pool
+    return servidor
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serviço HTTP de validação de cadastros do ERP.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--porta', type=int, default=8000)
+    parser.add_argument('-t', '--trabalhadores', type=int, default=os.cpu_count() or 1,
+                        help="Processos de validação (= validações simultâneas).")
+    parser.add_argument('--max-fila', type=int, default=MAX_FILA_PADRAO, help="Requisições aguardando vaga antes de responder 503.")
+    parser.add_argument('--max-corpo-mb', type=int, default=MAX_CORPO_MB_PADRAO, help="Tamanho máximo do CSV enviado.")
+    parser.add_argument('--mestre', help="Mestre de produtos para /validar/estoque.")
+    args = parser.parse_args(argv)
+
+    servidor = criar_servidor(args.host, args.porta, args.trabalhadores, args.max_fila, args.max_corpo_mb, args.mestre)
+    print(f"Validador ouvindo em http://{args.host}:{args.porta} com {args.trabalhadores} processo(s).")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        servidor.pool.shutdown(cancel_futures=True)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
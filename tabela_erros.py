@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# --- Tabela de Erros (colunar) ---
+# Um arquivo sujo de 1M linhas gera milhões de erros; como lista de dicts isso são
+# gigabytes de objetos Python. A TabelaErros guarda cada campo como uma coluna tipada:
+# linha em int32, coluna/mensagem/valores como categorias (cada texto distinto existe
+# uma vez; cada erro custa só os códigos — valor_corrigido, quase sempre vazio, vira
+# praticamente só códigos) e `corrigido` em bool. É montada em bloco pelo motor de
+# regras, já sem duplicados, e vai direto para relatório, download e cache.
+#
+# Erros críticos (arquivo ilegível, coluna obrigatória faltando) continuam sendo a
+# lista curta de dicts com linha 0: `[{"linha": 0, ...}], None`.
+
+COLUNAS_ERRO = ["linha", "coluna", "valor_encontrado", "valor_corrigido", "erro", "corrigido"]
+COLUNAS_TEXTO = ["coluna", "valor_encontrado", "valor_corrigido", "erro"]
+
+def _categorias(valores):
+    return pd.Categorical(np.asarray(valores, dtype=object))
+
+class TabelaErros:
+    """Erros de validação em colunas tipadas, na ordem (linha, regra) e sem duplicados."""
+
+    def __init__(self, df, colunas=COLUNAS_ERRO):
+        self.colunas = list(colunas)
+        self.df = df[self.colunas].reset_index(drop=True)
+
+    @classmethod
+    def vazia(cls, colunas=COLUNAS_ERRO):
+        return cls.de_colunas({c: [] for c in COLUNAS_ERRO}, colunas)
+
+    @classmethod
+    def de_colunas(cls, dados, colunas=COLUNAS_ERRO):
+        """Monta a tabela a partir de arrays/Series por campo (já ordenados), removendo duplicados."""
+        df = pd.DataFrame({
+            "linha": np.asarray(dados["linha"], dtype=np.int32),
+            **{c: _categorias(dados[c]) for c in COLUNAS_TEXTO},
+            "corrigido": np.asarray(dados["corrigido"], dtype=bool),
+        })
+        # Deduplicar pelos códigos das categorias é bem mais barato que pelos textos
+        return cls(df[~df.duplicated()], colunas)
+
+    @classmethod
+    def concatenar(cls, tabelas, colunas=None):
+        """Junta tabelas de blocos consecutivos do mesmo arquivo (mantém a ordem)."""
+        tabelas = [t for t in tabelas if t is not None]
+        if not tabelas: return cls.vazia(colunas or COLUNAS_ERRO)
+        colunas = colunas or tabelas[0].colunas
+        # Tabelas vazias não somam nada e têm categorias sem tipo (object), que o
+        # union_categoricals recusa junto das de texto (pandas 3: dtype str)
+        tabelas = [t for t in tabelas if len(t)] or tabelas[:1]
+        if len(tabelas) == 1: return cls(tabelas[0].df, colunas)
+        df = pd.DataFrame({
+            "linha": np.concatenate([t.df["linha"].to_numpy() for t in tabelas]),
+            **{c: union_categoricals([t.df[c] for t in tabelas]) for c in COLUNAS_TEXTO},
+            "corrigido": np.concatenate([t.df["corrigido"].to_numpy() for t in tabelas]),
+        })
+        return cls(df, colunas)
+
+    def __len__(self):
+        return len(self.df)
+
+    def __iter__(self):
+        """Registros como dicts, um pedaço por vez (compatível com o formato antigo)."""
+        for pedaco in self.fatias():
+            yield from pedaco.to_dict('records')
+
+    def __eq__(self, outra):
+        if not isinstance(outra, TabelaErros): return NotImplemented
+        return self.colunas == outra.colunas and self.df.astype({c: object for c in COLUNAS_TEXTO}).equals(
+            outra.df.astype({c: object for c in COLUNAS_TEXTO}))
+
+    def __repr__(self):
+        return f"TabelaErros({len(self)} erros, {self.memoria() / 1024 ** 2:.1f} MB)"
+
+    def fatias(self, tamanho=50_000):
+        """DataFrames de até `tamanho` erros, em ordem (para gravar/enviar em pedaços)."""
+        for inicio in range(0, len(self.df), tamanho):
+            yield self.df.iloc[inicio:inicio + tamanho]
+
+    def para_dataframe(self):
+        """A tabela como DataFrame (colunas categóricas; sem cópia)."""
+        return self.df
+
+    def para_registros(self):
+        """Lista de dicts no formato antigo (só para quem precisa de objetos Python, ex.: JSON)."""
+        return self.df.to_dict('records')
+
+    def para_csv(self, destino=None, cabecalho=True, sep=';'):
+        """Grava o relatório em CSV (ou devolve o texto quando `destino` é None)."""
+        return self.df.to_csv(destino, sep=sep, index=False, header=cabecalho)
+
+    # --- Relatório agregado / paginado ---
+    def resumo(self):
+        """Contagem por coluna × mensagem (mais frequentes primeiro), com corrigidos e faixa de linhas."""
+        if not len(self.df):
+            return pd.DataFrame(columns=["coluna", "erro", "quantidade", "corrigidos", "primeira_linha", "ultima_linha"])
+        agrupado = self.df.groupby(["coluna", "erro"], observed=True, sort=False).agg(
+            quantidade=("linha", "size"), corrigidos=("corrigido", "sum"),
+            primeira_linha=("linha", "min"), ultima_linha=("linha", "max"))
+        return agrupado.reset_index().sort_values(["quantidade", "primeira_linha"], ascending=[False, True],
+                                                  kind="stable", ignore_index=True)
+
+    def filtrar(self, coluna=None, erro=None, linha_inicial=None, linha_final=None, so_bloqueantes=False):
+        """Subconjunto da tabela (mesma ordem); filtros None não restringem."""
+        mascara = np.ones(len(self.df), dtype=bool)
+        if coluna is not None: mascara &= (self.df["coluna"] == coluna).to_numpy()
+        if erro is not None: mascara &= (self.df["erro"] == erro).to_numpy()
+        linhas = self.df["linha"].to_numpy()
+        if linha_inicial is not None: mascara &= linhas >= linha_inicial
+        if linha_final is not None: mascara &= linhas <= linha_final
+        if so_bloqueantes: mascara &= ~self.df["corrigido"].to_numpy()
+        if mascara.all(): return self
+        return TabelaErros(self.df[mascara], self.colunas)
+
+    def pagina(self, numero, tamanho):
+        """Erros da página `numero` (começando em 1) com `tamanho` erros por página."""
+        inicio = (max(numero, 1) - 1) * tamanho
+        return self.df.iloc[inicio:inicio + tamanho]
+
+    def bloqueantes(self):
+        """Quantidade de erros que não foram corrigidos automaticamente."""
+        return int((~self.df["corrigido"].to_numpy()).sum())
+
+    def memoria(self):
+        return int(self.df.memory_usage(index=False, deep=True).sum())
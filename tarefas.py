@@ -0,0 +1,108 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from instrumentacao import Medicao
+
+# --- Tarefas em Segundo Plano ---
+# Validações longas rodam num pool limitado de threads (o pandas solta o GIL nas
+# operações pesadas) e o app só guarda o id da tarefa. Os validadores recebem um
+# callback `progresso(fase, feitas=0, total=0)`; é por ele que a tarefa publica o
+# andamento e é nele que um pedido de cancelamento interrompe a validação (entre um
+# bloco de linhas e outro). Tarefas terminadas ficam disponíveis por `RETENCAO_SEGUNDOS`
+# para a interface buscar o resultado — inclusive depois de um rerun/reconexão.
+# Cada tarefa roda dentro de uma Medicao (ver instrumentacao.py): o manifesto com os
+# tempos por etapa e por regra fica em `manifesto` no estado da tarefa terminada.
+
+MAX_TRABALHADORES = 2
+RETENCAO_SEGUNDOS = 60 * 60
+
+NA_FILA, EXECUTANDO, CONCLUIDA, CANCELADA, FALHOU = 'na_fila', 'executando', 'concluida', 'cancelada', 'falhou'
+FINALIZADAS = {CONCLUIDA, CANCELADA, FALHOU}
+
+class TarefaCancelada(Exception):
+    """Levantada dentro do callback de progresso quando o cancelamento foi pedido."""
+
+class GerenciadorTarefas:
+    """Fila de validações com progresso, cancelamento e consulta por id (seguro entre threads)."""
+
+    def __init__(self, max_trabalhadores=MAX_TRABALHADORES, retencao_segundos=RETENCAO_SEGUNDOS):
+        self.retencao_segundos = retencao_segundos
+        self._pool = ThreadPoolExecutor(max_workers=max_trabalhadores, thread_name_prefix='validacao')
+        self._tarefas = {}
+        self._trava = threading.Lock()
+
+    def submeter(self, funcao, *args, descricao="", dados=None, **kwargs):
+        """
+        Agenda `funcao(*args, progresso=..., **kwargs)` e devolve o id da tarefa.
+        `dados` fica guardado junto (ex.: chave de cache), para quem reencontrar a tarefa pelo id.
+        """
+        self._descartar_antigas()
+        id_tarefa = uuid.uuid4().hex
+        tarefa = {"id": id_tarefa, "descricao": descricao, "dados": dados, "status": NA_FILA, "fase": "na fila",
+                  "feitas": 0, "total": 0, "resultado": None, "erro": None, "manifesto": None,
+                  "criada_em": time.time(), "terminada_em": None, "_cancelar": threading.Event()}
+        with self._trava:
+            self._tarefas[id_tarefa] = tarefa
+        tarefa["_futuro"] = self._pool.submit(self._executar, tarefa, funcao, args, kwargs)
+        return id_tarefa
+
+    def _executar(self, tarefa, funcao, args, kwargs):
+        def progresso(fase, feitas=0, total=0):
+            if tarefa["_cancelar"].is_set(): raise TarefaCancelada()
+            with self._trava:
+                tarefa.update(fase=fase, feitas=feitas, total=total)
+
+        with self._trava:
+            if tarefa["_cancelar"].is_set():
+                tarefa.update(status=CANCELADA, fase="cancelada", terminada_em=time.time())
+                return
+            tarefa["status"] = EXECUTANDO
+        medicao = Medicao(tarefa["descricao"], tarefa=tarefa["id"])
+        try:
+            with medicao:
+                resultado = funcao(*args, progresso=progresso, **kwargs)
+                medicao.registrar_resultado(resultado)
+            final = dict(status=CONCLUIDA, resultado=resultado, fase="concluída")
+        except TarefaCancelada:
+            final = dict(status=CANCELADA, fase="cancelada")
+        except Exception as e:
+            final = dict(status=FALHOU, erro=f"{type(e).__name__}: {e}", fase="falhou")
+        with self._trava:
+            tarefa.update(final, manifesto=medicao.manifesto, terminada_em=time.time())
+
+    def estado(self, id_tarefa):
+        """Cópia do estado público da tarefa (sem os campos internos), ou None se não existe."""
+        with self._trava:
+            tarefa = self._tarefas.get(id_tarefa)
+            if tarefa is None: return None
+            return {k: v for k, v in tarefa.items() if not k.startswith('_')}
+
+    def cancelar(self, id_tarefa):
+        """Pede o cancelamento: tarefas na fila nem começam; as em execução param no próximo bloco."""
+        with self._trava:
+            tarefa = self._tarefas.get(id_tarefa)
+            if tarefa is None or tarefa["status"] in FINALIZADAS: return False
+            tarefa["_cancelar"].set()
+            futuro = tarefa.get("_futuro")
+            if tarefa["status"] == NA_FILA and futuro is not None and futuro.cancel():
+                tarefa.update(status=CANCELADA, fase="cancelada", terminada_em=time.time())
+        return True
+
+    def descartar(self, id_tarefa):
+        """Esquece uma tarefa finalizada (libera o resultado da memória)."""
+        with self._trava:
+            tarefa = self._tarefas.get(id_tarefa)
+            if tarefa is not None and tarefa["status"] in FINALIZADAS:
+                del self._tarefas[id_tarefa]
+
+    def em_andamento(self):
+        with self._trava:
+            return sum(1 for t in self._tarefas.values() if t["status"] in (NA_FILA, EXECUTANDO))
+
+    def _descartar_antigas(self):
+        limite = time.time() - self.retencao_segundos
+        with self._trava:
+            for id_tarefa in [i for i, t in self._tarefas.items() if t["terminada_em"] and t["terminada_em"] < limite]:
+                del self._tarefas[id_tarefa]
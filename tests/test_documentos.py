@@ -0,0 +1,38 @@
+import random
+import string
+
+import pandas as pd
+
+from validador_de_parceiro import (_calcular_digito_cnpj, _calcular_digito_cpf, validar_cnpj, validar_cpf,
+                                   validar_documentos_lote)
+
+def _com_digitos(base, calcular):
+    primeiro = str(calcular(base))
+    return base + primeiro + str(calcular(base + primeiro))
+
+def _documentos(quantidade=400, semente=7):
+    sorteio = random.Random(semente)
+    alfanumerico = string.digits + string.ascii_uppercase
+    docs = ['00000000000', '11111111111', '00000000000000', '99999999999999', 'AAAAAAAAAAAA00',
+            '', '1', '1234567890', '123456789012', '1234567890123', '123456789012345', '1234567890AB1',
+            '12ABC34501DE35', '12abc34501de35', '12.345.678/0001-95', '529.982.247-25']
+    for _ in range(quantidade):
+        cpf = _com_digitos(''.join(sorteio.choices(string.digits, k=9)), _calcular_digito_cpf)
+        cnpj = _com_digitos(''.join(sorteio.choices(string.digits, k=12)), _calcular_digito_cnpj)
+        cnpj_alfa = _com_digitos(''.join(sorteio.choices(alfanumerico, k=12)), _calcular_digito_cnpj)
+        errado = list(sorteio.choice([cpf, cnpj, cnpj_alfa]))
+        posicao = sorteio.randrange(len(errado))
+        errado[posicao] = sorteio.choice(string.digits.replace(errado[posicao], '') or string.digits)
+        docs += [cpf, cnpj, cnpj_alfa, ''.join(errado), cpf[:-1], cnpj + '0']
+    return docs
+
+def test_lote_confere_com_a_validacao_escalar():
+    docs = _documentos()
+    esperado = [validar_cpf(doc) or validar_cnpj(doc) for doc in docs]
+    obtido = validar_documentos_lote(pd.Series(docs, index=range(10, 10 + len(docs))))
+    assert obtido.index.tolist() == list(range(10, 10 + len(docs)))
+    divergentes = [(doc, e) for doc, e, o in zip(docs, esperado, obtido.tolist()) if e != o]
+    assert divergentes == []
+    # O conjunto cobre os dois lados: válidos e inválidos de cada tipo
+    assert any(esperado) and not all(esperado)
+    assert validar_documentos_lote(pd.Series(['12ABC34501DE35']))[0]
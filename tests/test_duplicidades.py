@@ -0,0 +1,63 @@
+import pandas as pd
+
+from duplicidades import DetectorDuplicidades, arquivos_da_carga, erros_na_carga
+from tabela_erros import COLUNAS_ERRO
+
+COLUNAS = ('AD_IDEXTERNO', 'CGC_CPF')
+
+def _parceiros(ids, documentos=None):
+    """Saída corrigida mínima: a linha no arquivo é o índice + 2."""
+    return pd.DataFrame({'AD_IDEXTERNO': ids, 'CGC_CPF': documentos or [''] * len(ids)})
+
+def _gravar(pasta, arquivo, df, consultar_carga=False, carga='carga1'):
+    with DetectorDuplicidades(COLUNAS, 'parceiros', carga, arquivo, str(pasta), consultar_carga=consultar_carga) as detector:
+        detector.observar(df)
+        return detector.erros(COLUNAS_ERRO)
+
+def _achados(erros):
+    return [(r['linha'], r['coluna'], r['valor_encontrado'], r['erro']) for r in erros.para_registros()]
+
+def test_repetidos_no_arquivo_apontam_a_primeira_linha(tmp_path):
+    df = _parceiros(['A', 'B', 'A', 'C', 'A', ''], ['1', '2', '3', '2', '5', ''])
+    esperado = [
+        (2, 'AD_IDEXTERNO', 'A', "Duplicado no arquivo: primeira de 3 ocorrências."),
+        (3, 'CGC_CPF', '2', "Duplicado no arquivo: primeira de 2 ocorrências."),
+        (4, 'AD_IDEXTERNO', 'A', "Duplicado no arquivo: repete a linha 2."),
+        (5, 'CGC_CPF', '2', "Duplicado no arquivo: repete a linha 3."),
+        (6, 'AD_IDEXTERNO', 'A', "Duplicado no arquivo: repete a linha 2."),
+    ]
+    with DetectorDuplicidades(COLUNAS, 'parceiros', pasta=str(tmp_path)) as detector:
+        detector.observar(df)
+        assert _achados(detector.erros(COLUNAS_ERRO)) == esperado
+    # Em blocos e com as chaves despejadas em disco (limite baixo): mesmo resultado
+    with DetectorDuplicidades(COLUNAS, 'parceiros', pasta=str(tmp_path), limite=2) as detector:
+        for inicio in range(0, len(df), 2):
+            detector.observar(df.iloc[inicio:inicio + 2])
+        assert _achados(detector.erros(COLUNAS_ERRO)) == esperado
+
+def test_lote_de_arquivos_confere_as_chaves_entre_todos(tmp_path):
+    _gravar(tmp_path, 'sp.csv', _parceiros(['P1', 'X', 'P3']))
+    _gravar(tmp_path, 'rj.csv', _parceiros(['X', 'R2', 'R3', 'X']))
+    assert [a['arquivo'] for a in arquivos_da_carga('carga1', 'parceiros', str(tmp_path))] == ['rj.csv', 'sp.csv']
+
+    assert _achados(erros_na_carga('carga1', 'parceiros', 'sp.csv', COLUNAS, COLUNAS_ERRO, str(tmp_path))) == [
+        (3, 'AD_IDEXTERNO', 'X', "Duplicado na carga 'carga1': já existe em rj.csv (linha 2)."),
+    ]
+    assert _achados(erros_na_carga('carga1', 'parceiros', 'rj.csv', COLUNAS, COLUNAS_ERRO, str(tmp_path))) == [
+        (2, 'AD_IDEXTERNO', 'X', "Duplicado na carga 'carga1': já existe em sp.csv (linha 3)."),
+        (5, 'AD_IDEXTERNO', 'X', "Duplicado na carga 'carga1': já existe em sp.csv (linha 3)."),
+    ]
+    # Outra carga não enxerga estas chaves
+    assert not len(_gravar(tmp_path, 'rj.csv', _parceiros(['X']), consultar_carga=True, carga='carga2'))
+
+def test_reenviar_o_arquivo_substitui_o_indice_dele(tmp_path):
+    _gravar(tmp_path, 'sp.csv', _parceiros(['X', 'S2']))
+    assert len(_gravar(tmp_path, 'rj.csv', _parceiros(['R1', 'X']), consultar_carga=True)) == 1
+
+    # sp.csv corrigido e reenviado sem a chave X: rj.csv deixa de acusar
+    _gravar(tmp_path, 'sp.csv', _parceiros(['S1', 'S2']))
+    assert len(arquivos_da_carga('carga1', 'parceiros', str(tmp_path))) == 2
+    assert not len(erros_na_carga('carga1', 'parceiros', 'rj.csv', COLUNAS, COLUNAS_ERRO, str(tmp_path)))
+    assert _achados(_gravar(tmp_path, 'sp.csv', _parceiros(['S1', 'R1']), consultar_carga=True)) == [
+        (3, 'AD_IDEXTERNO', 'R1', "Duplicado na carga 'carga1': já existe em rj.csv (linha 2)."),
+    ]
@@ -0,0 +1,23 @@
+from leitor_csv import detectar_dialeto, ler_csv
+
+def test_separador_no_fim_das_linhas_de_dados_nao_desloca_o_cabecalho():
+    conteudo = b'AD_IDEXTERNO;NOME;CGC_CPF\n1;ANA;123;\n2;BIA;456;\n3;CAU;789;\n'
+    dialeto, _ = detectar_dialeto(conteudo)
+    assert dialeto['linha_cabecalho'] == 0
+    assert dialeto['colunas'] == 3
+
+    df, _ = ler_csv(conteudo)
+    assert list(df.columns) == ['AD_IDEXTERNO', 'NOME', 'CGC_CPF']
+    assert df['AD_IDEXTERNO'].tolist() == ['1', '2', '3']
+    assert df['CGC_CPF'].tolist() == ['123', '456', '789']
+
+def test_titulo_antes_do_cabecalho_e_ultimo_campo_vazio():
+    conteudo = b'Cadastro de parceiros;;\nAD_IDEXTERNO;NOME;CGC_CPF\n1;ANA;\n2;BIA;456\n3;CAU;789\n'
+    dialeto, _ = detectar_dialeto(conteudo)
+    assert dialeto['linha_cabecalho'] == 1
+
+    df, _ = ler_csv(conteudo)
+    assert list(df.columns) == ['AD_IDEXTERNO', 'NOME', 'CGC_CPF']
+    assert df['NOME'].tolist() == ['ANA', 'BIA', 'CAU']
+    # Linha no arquivo = índice + 2, contando o título
+    assert df.index.tolist() == [1, 2, 3]
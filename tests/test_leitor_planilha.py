@@ -0,0 +1,45 @@
+import io
+import zipfile
+
+from leitor_planilha import ler_planilha
+from validador_de_estoque import limpar_numero
+
+# --- XLSX montado à mão (só o mínimo que o leitor usa) ---
+WORKBOOK = ('<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+            '<sheets><sheet name="Estoque" sheetId="1" r:id="rId1"/></sheets></workbook>')
+RELACOES = ('<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '<Relationship Id="rId1" Target="worksheets/sheet1.xml"/></Relationships>')
+
+def _celula(referencia, valor):
+    if isinstance(valor, str):
+        return f'<c r="{referencia}" t="inlineStr"><is><t>{valor}</t></is></c>'
+    return f'<c r="{referencia}"><v>{valor[0]}</v></c>'
+
+def _xlsx(linhas):
+    """Bytes de um XLSX com uma aba; valores numéricos vão como (texto cru do XML,)."""
+    corpo = ''.join(
+        f'<row r="{numero}">' + ''.join(_celula(f'{chr(65 + coluna)}{numero}', valor) for coluna, valor in enumerate(linha)) + '</row>'
+        for numero, linha in enumerate(linhas, start=1))
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as pacote:
+        pacote.writestr('xl/workbook.xml', WORKBOOK)
+        pacote.writestr('xl/_rels/workbook.xml.rels', RELACOES)
+        pacote.writestr('xl/worksheets/sheet1.xml',
+                        '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+                        f'<sheetData>{corpo}</sheetData></worksheet>')
+    return buffer.getvalue()
+
+def test_numeros_com_decimais_e_expoente_chegam_em_pt_br():
+    df, dialeto = ler_planilha(_xlsx([
+        ['CODPROD', 'ESTMIN', 'ESTMAX'],
+        [('12345678901234',), ('4.2E3',), ('706.80000000000007',)],
+        [('7',), ('-0.5',), ('1E-3',)],
+    ]))
+    assert dialeto['formato'] == 'xlsx'
+    assert df['CODPROD'].tolist() == ['12345678901234', '7']
+    assert df['ESTMIN'].tolist() == ['4200', '-0,5']
+    assert df['ESTMAX'].tolist() == ['706,8', '0,001']
+    # O que os validadores fazem com o texto (ponto = milhar, vírgula = decimal)
+    assert limpar_numero(df['ESTMAX']).tolist() == ['706.8', '0.001']
+    assert limpar_numero(df['ESTMIN']).tolist() == ['4200', '-0.5']
@@ -0,0 +1,40 @@
+import io
+
+import pandas as pd
+
+from gerador_dados import gerar_arquivo
+from validador_de_parceiro import validar_parceiros, validar_parceiros_em_lotes
+
+def _relatorio(texto):
+    """Relatório de erros (CSV) como texto, na ordem das linhas (estável dentro de cada linha)."""
+    df = pd.read_csv(io.StringIO(texto), sep=';', dtype=str, keep_default_na=False)
+    ordem = df['linha'].astype(int).argsort(kind='stable')
+    return df.iloc[ordem].reset_index(drop=True)
+
+def _arquivo_com_repetidos(pasta):
+    """Parceiros sintéticos + cópias de linhas que caem em lotes diferentes (chaves repetidas)."""
+    with open(gerar_arquivo('parceiros', 40, 3, str(pasta)), encoding='utf-8-sig') as f:
+        linhas = f.read().splitlines()
+    # Linha 9 repetida na 10 (mesmo lote de 7); linhas 2 e 22 repetidas no último lote (43 e 44)
+    linhas = linhas[:9] + [linhas[8]] + linhas[9:] + [linhas[1], linhas[20]]
+    caminho = pasta / 'parceiros_repetidos.csv'
+    caminho.write_text('\n'.join(linhas) + '\n', encoding='utf-8')
+    return caminho
+
+def test_lotes_pequenos_dao_o_mesmo_resultado_do_arquivo_inteiro(tmp_path):
+    caminho = _arquivo_com_repetidos(tmp_path)
+    erros, df = validar_parceiros(str(caminho))
+
+    corrigido, relatorio = tmp_path / 'corrigido.csv', tmp_path / 'erros.csv'
+    criticos, resumo = validar_parceiros_em_lotes(str(caminho), str(corrigido), str(relatorio), tamanho_lote=7)
+    assert criticos == []
+    assert resumo['lotes'] == 7 and resumo['linhas'] == len(df) == 43
+    assert resumo['erros'] == len(erros) and resumo['bloqueantes'] == erros.bloqueantes()
+
+    assert corrigido.read_text(encoding='utf-8') == df.to_csv(sep=';', index=False)
+    esperado, obtido = _relatorio(erros.para_csv()), _relatorio(relatorio.read_text(encoding='utf-8'))
+    pd.testing.assert_frame_equal(obtido, esperado)
+
+    # Repetidos apontados nas linhas do arquivo, inclusive entre lotes
+    duplicados = obtido[obtido['erro'].str.contains('duplicad', case=False)]
+    assert set(duplicados['linha']) == {'2', '9', '10', '22', '43', '44'}
@@ -0,0 +1,30 @@
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from gerador_dados import caminho_gerado, gerar_arquivo, linhas_mestre
+from leitor_csv import ler_csv
+from processamento_paralelo import validar_em_paralelo
+from validador_de_estoque import carregar_mestre, validar_df_estoque
+from validador_de_parceiro import validar_df_parceiros
+
+def _comparar(df, validar_bloco):
+    erros, corrigido = validar_bloco(df.copy())
+    erros_paralelo, corrigido_paralelo = validar_em_paralelo(df, validar_bloco, processos=2)
+    pd.testing.assert_frame_equal(erros_paralelo.para_dataframe().reset_index(drop=True),
+                                  erros.para_dataframe().reset_index(drop=True), check_categorical=False)
+    pd.testing.assert_frame_equal(corrigido_paralelo, corrigido)
+    return erros
+
+def test_dois_processos_dao_o_mesmo_resultado_de_um(tmp_path):
+    df, _ = ler_csv(gerar_arquivo('parceiros', 50, 5, str(tmp_path)))
+    assert len(_comparar(df, partial(validar_df_parceiros)))
+
+def test_mestre_em_snapshot_chega_aos_processos_por_mmap(tmp_path):
+    df, _ = ler_csv(gerar_arquivo('estoque', 50, 5, str(tmp_path)))
+    fonte, cache = caminho_gerado('mestre', linhas_mestre(50), 5, str(tmp_path)), str(tmp_path / 'cache')
+    carregar_mestre(fonte, 'CODPROD', pasta_cache=cache)  # compila; a segunda carga abre o snapshot
+    mestre = carregar_mestre(fonte, 'CODPROD', pasta_cache=cache)
+    assert isinstance(mestre, np.memmap)
+    _comparar(df, partial(validar_df_estoque, produtos_validos=mestre))
@@ -0,0 +1,38 @@
+import pandas as pd
+
+from cache_resultados import CacheLRU
+from gerador_dados import gerar_arquivo
+from leitor_csv import ler_csv
+from revalidacao_incremental import validar_incremental
+from validador_de_parceiro import validar_df_parceiros
+
+def _editar(df):
+    """Remove as linhas 3 e 4, altera a 20, insere uma linha nova na posição 10 e repete a primeira no fim."""
+    nova = df.iloc[[5]].assign(NOMEPARC='PARCEIRO INSERIDO', CGC_CPF='123')
+    alterado = df.drop(index=[3, 4]).copy()
+    alterado.loc[20, 'UF'] = 'XX'
+    partes = [alterado.iloc[:10], nova, alterado.iloc[10:], df.iloc[[0]]]
+    return pd.concat(partes).reset_index(drop=True)
+
+def test_revalidar_depois_de_inserir_e_remover_linhas_igual_a_validar_tudo(tmp_path):
+    df, _ = ler_csv(gerar_arquivo('parceiros', 40, 11, str(tmp_path)))
+    historico, chave = CacheLRU(), ('parceiros', 'arquivo.csv')
+    validadas = []
+    def validar_bloco(bloco):
+        validadas.append(len(bloco))
+        return validar_df_parceiros(bloco)
+
+    validar_incremental(df, validar_bloco, historico, chave)
+    assert validadas == [40]
+
+    editado = _editar(df)
+    erros, corrigido = validar_incremental(editado, validar_bloco, historico, chave)
+    assert validadas[1:] == [2]  # só a linha inserida e a alterada
+
+    erros_completos, corrigido_completo = validar_df_parceiros(editado.copy())
+    pd.testing.assert_frame_equal(erros.para_dataframe().reset_index(drop=True),
+                                  erros_completos.para_dataframe().reset_index(drop=True), check_categorical=False)
+    pd.testing.assert_frame_equal(corrigido, corrigido_completo)
+    # Linha inserida (12) e alterada (21) com os próprios erros
+    tabela = erros.para_dataframe()
+    assert {('CGC_CPF', 12), ('UF', 21)} <= set(zip(tabela['coluna'].astype(str), tabela['linha']))
@@ -0,0 +1,49 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+except ImportError:  # Arrow é opcional: sem pyarrow, tudo segue em texto do pandas
+    pa = pa_csv = None
+
+# --- Texto em Arrow (opcional) ---
+# Com pyarrow instalado, os CSVs são lidos pelo leitor multithread do Arrow e as colunas
+# de texto ficam em strings Arrow (buffer contíguo + offsets, em vez de um objeto Python
+# de ~50 bytes por célula). Os `.str.*` dessas colunas (strip, upper, replace, regex)
+# rodam nos kernels do pyarrow.compute, sem laço Python.
+#
+# O dtype usa NaN como ausente (mesma semântica do texto do pandas), então as regras não
+# mudam. VALIDADOR_MOTOR_CSV=pandas força o caminho antigo (C do pandas + texto Python).
+
+MOTORES = ('arrow', 'pandas')
+MOTOR_PADRAO = 'arrow' if pa is not None else 'pandas'
+
+def motor_csv():
+    """'arrow' ou 'pandas', conforme VALIDADOR_MOTOR_CSV e a disponibilidade do pyarrow."""
+    motor = os.environ.get('VALIDADOR_MOTOR_CSV', MOTOR_PADRAO).strip().lower()
+    if motor not in MOTORES:
+        raise ValueError(f"VALIDADOR_MOTOR_CSV inválido: '{motor}' (use {' ou '.join(MOTORES)}).")
+    return motor if pa is not None else 'pandas'
+
+def tipo_texto():
+    """Dtype das colunas de texto lidas: string Arrow (ausente = NaN) ou None (texto padrão do pandas)."""
+    if motor_csv() != 'arrow': return None
+    try:
+        return pd.StringDtype('pyarrow', na_value=np.nan)  # pandas >= 2.3
+    except TypeError:
+        return pd.StringDtype('pyarrow_numpy')  # pandas 2.1/2.2
+
+def como_texto(serie):
+    """A série como texto; colunas que já são string (Arrow ou não) seguem sem conversão nem cópia."""
+    if isinstance(serie.dtype, pd.StringDtype): return serie
+    return serie.astype(str)
+
+def para_texto(df):
+    """Converte as colunas de objeto de um DataFrame lido para o dtype de texto do motor atual."""
+    tipo = tipo_texto()
+    if tipo is None: return df
+    objetos = [c for c, dtype in df.dtypes.items() if dtype == object]
+    return df.astype({c: tipo for c in objetos}) if objetos else df
@@ -1,7 +1,21 @@
+import logging
+import os
+import numpy as np
 import pandas as pd
 import re
 import sys
 from datetime import datetime
+from functools import partial
+
+from instrumentacao import etapa
+from motor_regras import COLUNAS_ERRO, compilar_regras, executar_regras, sem_espacos, versao_regras
+from indice_mestre import PASTA_CACHE_PADRAO, carregar_snapshot, montar_conjunto
+from leitor_csv import descrever_dialeto, ler_csv, nome_fonte
+from processamento_em_lotes import TAMANHO_LOTE_PADRAO, validar_em_blocos, validar_em_lotes
+from revalidacao_incremental import validar_incremental
+from texto_arrow import como_texto
+
+logger = logging.getLogger(__name__)
 
 # --- Domínios ---
 DOMINIO_TIPO_ESTOQUE = {'P', 'T'}
@@ -13,54 +27,157 @@ MAP_TIPO_ESTOQUE = {
     'TERCEIRO': 'T', 'TERCEIROS': 'T', 'T': 'T'
 }
 
+COLUNAS_NUMERICAS = ['ESTOQUE', 'ESTMIN', 'ESTMAX']
+
 MAP_ATIVO = {
     'SIM': 'S', 'S': 'S', 'ATIVO': 'S', 'YES': 'S', '1': 'S',
     'NÃO': 'N', 'NAO': 'N', 'N': 'N', 'INATIVO': 'N', 'NO': 'N', '0': 'N'
 }
 
-def carregar_mestre(caminho_arquivo, nome_coluna):
-    """Carrega um arquivo mestre e retorna um SET com os valores válidos."""
+# O mestre de produtos (milhões de códigos, reenviado igual a cada arquivo de estoque)
+# vira um array ordenado guardado em snapshot, identificado pelo hash do conteúdo:
+# só o primeiro estoque validado contra um mestre paga o parse do CSV.
+VERSOES_MESTRE_MANTIDAS = 4
+
+def _construir_conjunto_mestre(caminho_arquivo, nome_coluna):
+    df_mestre, _ = ler_csv(caminho_arquivo, encoding_errors='ignore')
+    if df_mestre is None or nome_coluna not in df_mestre.columns:
+        raise ValueError(f"Coluna '{nome_coluna}' não encontrada no mestre.")
+    return montar_conjunto(df_mestre[nome_coluna])
+
+def carregar_mestre(caminho_arquivo, nome_coluna, pasta_cache=PASTA_CACHE_PADRAO):
+    """Carrega um mestre (caminho, bytes ou buffer) e retorna os valores válidos (array ordenado, ver indice_mestre)."""
+    if isinstance(caminho_arquivo, (str, os.PathLike)) and not os.path.exists(caminho_arquivo):
+        return None
     try:
-        df_mestre = pd.read_csv(caminho_arquivo, sep=';', encoding='utf-8', encoding_errors='ignore', dtype=str, engine='python')
-        if len(df_mestre.columns) < 2: 
-            df_mestre = pd.read_csv(caminho_arquivo, sep=',', encoding='utf-8', encoding_errors='ignore', dtype=str, engine='python')
-    except Exception:
-        return None 
-    if nome_coluna not in df_mestre.columns: 
+        arrays, _ = carregar_snapshot(f'mestre_{nome_coluna.lower()}', [caminho_arquivo],
+                                      lambda: _construir_conjunto_mestre(caminho_arquivo, nome_coluna),
+                                      pasta_cache, VERSOES_MESTRE_MANTIDAS, codigo=(_construir_conjunto_mestre, montar_conjunto))
+    except ValueError:
         return None
-    return set(df_mestre[nome_coluna].dropna().unique())
+    return arrays['chaves']
+
+def limpar_numero(serie):
+    """Remove pontos de milhar e troca vírgula decimal por ponto."""
+    return como_texto(serie).str.replace('.', '', regex=False).str.replace(',', '.', regex=False).str.strip()
+
+# --- Regras de Estoque (ver motor_regras.py) ---
+# A posição na lista define a ordem dos erros dentro de cada linha.
+REGRAS_ESTOQUE = [
+    # Correções automáticas
+    {'tipo': 'normalizacao', 'coluna': 'TIPO', 'mapa': MAP_TIPO_ESTOQUE,
+     'mensagem': "Tipo de estoque padronizado.", 'grupo': 'padronizacao'},
+    {'tipo': 'normalizacao', 'coluna': 'ATIVO', 'mapa': MAP_ATIVO,
+     'mensagem': "Status padronizado para 'S' ou 'N'.", 'grupo': 'padronizacao'},
+    {'tipo': 'normalizacao', 'coluna': 'CODPROD', 'funcao': sem_espacos,
+     'mensagem': "Espaços extras removidos do código.", 'grupo': 'padronizacao'},
+    *[{'tipo': 'normalizacao', 'coluna': col, 'funcao': limpar_numero,
+       'mensagem': "Formato numérico corrigido.", 'grupo': 'padronizacao'}
+      for col in COLUNAS_NUMERICAS],
+
+    # Cross-Reference (CODPROD x Mestre de Produtos)
+    {'tipo': 'obrigatorio', 'coluna': 'CODPROD', 'valor': 'CODPROD_original',
+     'mensagem': "Código do Produto está vazio.", 'grupo': 'obrigatorios'},
+    {'tipo': 'referencia', 'coluna': 'CODPROD', 'valor': 'CODPROD_original', 'conjunto': 'produtos_validos',
+     'quando': [('CODPROD', '!=', '')],
+     'mensagem': "Código do Produto não encontrado no Arquivo Mestre de Produtos.", 'grupo': 'referencia'},
+
+    # Domínios TIPO / ATIVO
+    {'tipo': 'obrigatorio', 'coluna': 'TIPO', 'valor': 'TIPO_original',
+     'mensagem': "Campo obrigatório (Tipo) está vazio.", 'grupo': 'obrigatorios'},
+    {'tipo': 'dominio', 'coluna': 'TIPO', 'valor': 'TIPO_original', 'valores': DOMINIO_TIPO_ESTOQUE, 'quando': [('TIPO', '!=', '')],
+     'mensagem': "Valor inválido. Esperado 'P' (Próprio) ou 'T' (Terceiro).", 'grupo': 'dominios'},
+    {'tipo': 'obrigatorio', 'coluna': 'ATIVO', 'valor': 'ATIVO_original',
+     'mensagem': "Campo obrigatório (Ativo) está vazio.", 'grupo': 'obrigatorios'},
+    {'tipo': 'dominio', 'coluna': 'ATIVO', 'valor': 'ATIVO_original', 'valores': DOMINIO_ATIVO, 'quando': [('ATIVO', '!=', '')],
+     'mensagem': "Valor inválido. Esperado 'S' ou 'N'.", 'grupo': 'dominios'},
+
+    # Numéricos
+    *[regra
+      for col in COLUNAS_NUMERICAS
+      for regra in (
+          {'tipo': 'obrigatorio', 'coluna': col, 'valor': f'{col}_original',
+           'mensagem': f"{col} está vazio.", 'grupo': 'obrigatorios'},
+          {'tipo': 'numerico', 'coluna': col, 'valor': f'{col}_original', 'quando': [(col, '!=', '')],
+           'mensagem': f"{col} não é um número válido.", 'grupo': 'numericos'},
+          {'tipo': 'minimo', 'coluna': col, 'valor': f'{col}_original', 'minimo': 0, 'quando': [(col, '!=', '')],
+           'mensagem': f"{col} não pode ser negativo.", 'grupo': 'numericos'})],
+
+    # Validação lógica: ESTMIN <= ESTMAX
+    {'tipo': 'comparacao', 'coluna': 'ESTMIN', 'valor': 'ESTMIN_original', 'operador': '>', 'outro': 'ESTMAX',
+     'mensagem': "Estoque Mínimo ({valor}) não pode ser maior que Estoque Máximo ({outro}).", 'grupo': 'numericos'},
+]
+REGRAS_ESTOQUE_COMPILADAS = compilar_regras(REGRAS_ESTOQUE)
+VERSAO_REGRAS_ESTOQUE = versao_regras(REGRAS_ESTOQUE)
 
 # --- Função Principal de Validação ---
 
-def validar_estoque(caminho_arquivo):
+def _resolver_mestre(mestre_produtos):
+    """Aceita o mestre já carregado (array ordenado ou set) ou a fonte dele (caminho, bytes, buffer)."""
+    if isinstance(mestre_produtos, (np.ndarray, set, frozenset)): return mestre_produtos
+    with etapa('mestre'):
+        return carregar_mestre(mestre_produtos, 'CODPROD')
+
+def _erro_mestre(mestre_produtos):
+    return [{"linha": 0, "coluna": "Mestre", "valor_encontrado": nome_fonte(mestre_produtos, "mestre_produtos.csv"), 
+            "erro": "Arquivo Mestre de Produtos não encontrado ou incompleto (Verifique o cabeçalho 'CODPROD')."}], None
+
+def _erro_leitura(msg_erro):
+    return [{"linha": 0, "coluna": "Arquivo", "valor_encontrado": "N/A", 
+            "erro": f"ERRO FATAL DE LEITURA. O arquivo pode estar corrompido. Detalhe: {msg_erro}"}], None
+
+def validar_estoque(caminho_arquivo, mestre_produtos, grupos_desativados=(), progresso=None, processos=None, incremental=None):
     """
-    Valida e corrige planilha de estoque.
+    Valida e corrige planilha de estoque (caminho, bytes ou buffer do upload).
+    `mestre_produtos`: fonte do mestre (caminho, bytes, buffer) ou o mestre já carregado
+    (ex.: vindo de cache). `grupos_desativados` desliga grupos de REGRAS_ESTOQUE (ex.: {'referencia'}).
+    `progresso(fase, feitas, total)` opcional recebe o andamento (ver tarefas.py); `processos` > 1
+    valida arquivos grandes em vários núcleos (ver processamento_paralelo.py).
+    `incremental=(historico, chave)` reaproveita a validação anterior do mesmo arquivo lógico
+    e só valida as linhas alteradas (ver revalidacao_incremental.py); a chave precisa
+    identificar também o mestre.
     Retorna: (lista_erros, dataframe_corrigido)
     """
-    erros_encontrados = []
-    
     # 1. CARREGAR ARQUIVO MESTRE DE PRODUTOS
-    produtos_validos = carregar_mestre("mestre_produtos.csv", 'CODPROD')
+    if progresso: progresso('mestre')
+    produtos_validos = _resolver_mestre(mestre_produtos)
     if produtos_validos is None:
-        return [{"linha": 0, "coluna": "Mestre", "valor_encontrado": "mestre_produtos.csv", 
-                "erro": "Arquivo Mestre de Produtos não encontrado ou incompleto (Verifique o cabeçalho 'CODPROD')."}], None
+        return _erro_mestre(mestre_produtos)
 
     # 2. CARREGAR OS DADOS DE ESTOQUE
-    df = None
-    try:
-        df_temp = pd.read_csv(caminho_arquivo, sep=';', encoding='utf-8', encoding_errors='ignore', dtype=str, engine='python')
-        if len(df_temp.columns) < 2: 
-            df = pd.read_csv(caminho_arquivo, sep=',', encoding='utf-8', encoding_errors='ignore', dtype=str, engine='python')
-        else: 
-            df = df_temp
-    except Exception as e:
-        return [{"linha": 0, "coluna": "Arquivo", "valor_encontrado": "N/A", 
-                "erro": f"ERRO FATAL DE DADOS. O arquivo pode estar corrompido. Detalhe: {str(e)}"}], None
-    
+    if progresso: progresso('leitura')
+    df, dialeto = ler_csv(caminho_arquivo, encoding_errors='ignore')
     if df is None:
-        return [{"linha": 0, "coluna": "Arquivo", "valor_encontrado": "N/A", 
-                "erro": "ERRO FATAL DE LEITURA. Não foi possível ler o arquivo com vírgula ou ponto e vírgula."}], None
+        return _erro_leitura(dialeto)
+    logger.info("Arquivo lido: %s", descrever_dialeto(dialeto))
     
+    validar_bloco = partial(validar_df_estoque, produtos_validos=produtos_validos, grupos_desativados=grupos_desativados)
+    if incremental:
+        historico, chave = incremental
+        return validar_incremental(df, validar_bloco, historico, (*chave, VERSAO_REGRAS_ESTOQUE, tuple(sorted(grupos_desativados))),
+                                   progresso, processos)
+    return validar_em_blocos(df, validar_bloco, progresso, processos=processos)
+
+def validar_estoque_em_lotes(caminho_arquivo, mestre_produtos, caminho_corrigido, caminho_erros, tamanho_lote=TAMANHO_LOTE_PADRAO, grupos_desativados=(), processos=None):
+    """
+    Versão streaming de validar_estoque para arquivos grandes: lê em blocos e grava
+    a planilha corrigida e o relatório de erros em disco conforme avança.
+    O mestre de produtos vem do snapshot (array ordenado aberto por mmap).
+    Retorna: (erros_criticos, resumo) — ver processamento_em_lotes.validar_em_lotes.
+    """
+    produtos_validos = _resolver_mestre(mestre_produtos)
+    if produtos_validos is None:
+        return _erro_mestre(mestre_produtos)
+
+    lotes, dialeto = ler_csv(caminho_arquivo, tamanho_lote=tamanho_lote, encoding_errors='ignore')
+    if lotes is None:
+        return _erro_leitura(dialeto)
+    logger.info("Arquivo lido: %s", descrever_dialeto(dialeto))
+    return validar_em_lotes(lotes, partial(validar_df_estoque, produtos_validos=produtos_validos, grupos_desativados=grupos_desativados),
+                            caminho_corrigido, caminho_erros, COLUNAS_ERRO, processos)
+
+def validar_df_estoque(df, produtos_validos, grupos_desativados=()):
+    """Valida um DataFrame já lido (arquivo inteiro ou um bloco; a linha vem do índice)."""
     df = df.fillna('')
 
     # 3. VERIFICAR COLUNAS CRÍTICAS
@@ -70,130 +187,18 @@ def validar_estoque(caminho_arquivo):
             return [{"linha": 0, "coluna": col, "valor_encontrado": "-", 
                     "erro": f"Coluna obrigatória '{col}' não encontrada no cabeçalho do arquivo de estoque."}], None
     
-    # 4. APLICAR CORREÇÕES AUTOMÁTICAS
+    # 4. CORREÇÕES AUTOMÁTICAS + VALIDAÇÃO DE REGRAS (motor de regras, em bloco)
     
-    # Backup das colunas originais
-    df['TIPO_original'] = df['TIPO'].copy()
-    df['ATIVO_original'] = df['ATIVO'].copy()
-    df['CODPROD_original'] = df['CODPROD'].copy()
+    logger.info("Iniciando validação de %d itens de estoque...", len(df))
     
-    # CORREÇÃO 1: Padronizar TIPO
-    df['TIPO'] = df['TIPO'].astype(str).str.upper().str.strip()
-    df['TIPO'] = df['TIPO'].replace(MAP_TIPO_ESTOQUE, regex=False)
-    
-    # CORREÇÃO 2: Padronizar ATIVO
-    df['ATIVO'] = df['ATIVO'].astype(str).str.upper().str.strip()
-    df['ATIVO'] = df['ATIVO'].replace(MAP_ATIVO, regex=False)
-    
-    # CORREÇÃO 3: Limpar CODPROD (remover espaços)
-    df['CODPROD'] = df['CODPROD'].astype(str).str.strip()
-    
-    # CORREÇÃO 4: Limpar valores numéricos (estoque, min, max)
-    for col in ['ESTOQUE', 'ESTMIN', 'ESTMAX']:
-        if col in df.columns:
-            df[f'{col}_original'] = df[col].copy()
-            # Remover vírgulas e pontos como separadores de milhar
-            df[col] = df[col].astype(str).str.replace('.', '', regex=False)
-            df[col] = df[col].str.replace(',', '.', regex=False)
-            df[col] = df[col].str.strip()
-
-    # 5. VALIDAÇÃO DE REGRAS (LINHA A LINHA)
-    
-    print(f"Iniciando validação de {len(df)} itens de estoque...")
-    
-    for index, row in df.iterrows():
-        linha_num = index + 2 
-        
-        def adicionar_erro(coluna, valor_original, valor_corrigido, mensagem, foi_corrigido=False):
-            erros_encontrados.append({
-                "linha": linha_num,
-                "coluna": coluna,
-                "valor_encontrado": str(valor_original),
-                "valor_corrigido": str(valor_corrigido) if foi_corrigido else "",
-                "erro": mensagem,
-                "corrigido": foi_corrigido
-            })
-        
-        # Registrar correções aplicadas
-        if row['TIPO'] != row['TIPO_original']:
-            adicionar_erro('TIPO', row['TIPO_original'], row['TIPO'], 
-                          "Tipo de estoque padronizado.", True)
-        
-        if row['ATIVO'] != row['ATIVO_original']:
-            adicionar_erro('ATIVO', row['ATIVO_original'], row['ATIVO'], 
-                          "Status padronizado para 'S' ou 'N'.", True)
-        
-        if row['CODPROD'] != row['CODPROD_original']:
-            adicionar_erro('CODPROD', row['CODPROD_original'], row['CODPROD'], 
-                          "Espaços extras removidos do código.", True)
-        
-        # Correções numéricas
-        for col in ['ESTOQUE', 'ESTMIN', 'ESTMAX']:
-            col_orig = f'{col}_original'
-            if col_orig in row and row[col] != row[col_orig]:
-                adicionar_erro(col, row[col_orig], row[col], 
-                              "Formato numérico corrigido.", True)
-        
-        # --- Validação de Cross-Reference (CODPROD) ---
-        if not row['CODPROD']:
-            adicionar_erro('CODPROD', row['CODPROD_original'], "", 
-                          "Código do Produto está vazio.", False)
-        elif row['CODPROD'] not in produtos_validos:
-            adicionar_erro('CODPROD', row['CODPROD_original'], "", 
-                          "Código do Produto não encontrado no Arquivo Mestre de Produtos.", False)
-        
-        # --- Validação de Domínio TIPO ---
-        if not row['TIPO']:
-            adicionar_erro('TIPO', row['TIPO_original'], "", 
-                          "Campo obrigatório (Tipo) está vazio.", False)
-        elif row['TIPO'] not in DOMINIO_TIPO_ESTOQUE:
-            adicionar_erro('TIPO', row['TIPO_original'], "", 
-                          "Valor inválido. Esperado 'P' (Próprio) ou 'T' (Terceiro).", False)
-
-        # --- Validação de ATIVO ---
-        if not row['ATIVO']:
-            adicionar_erro('ATIVO', row['ATIVO_original'], "", 
-                          "Campo obrigatório (Ativo) está vazio.", False)
-        elif row['ATIVO'] not in DOMINIO_ATIVO:
-            adicionar_erro('ATIVO', row['ATIVO_original'], "", 
-                          "Valor inválido. Esperado 'S' ou 'N'.", False)
-        
-        # --- Validação Numérica ---
-        for col in ['ESTOQUE', 'ESTMIN', 'ESTMAX']:
-            valor = row[col]
-            if not valor:
-                adicionar_erro(col, row.get(f'{col}_original', ''), "", 
-                              f"{col} está vazio.", False)
-            elif pd.isna(pd.to_numeric(valor, errors='coerce')):
-                adicionar_erro(col, row.get(f'{col}_original', valor), "", 
-                              f"{col} não é um número válido.", False)
-            else:
-                # Validar se é positivo ou zero
-                num_valor = float(valor)
-                if num_valor < 0:
-                    adicionar_erro(col, row.get(f'{col}_original', valor), "", 
-                                  f"{col} não pode ser negativo.", False)
-        
-        # Validação lógica: ESTMIN <= ESTMAX
-        try:
-            estmin = float(row['ESTMIN']) if row['ESTMIN'] and not pd.isna(pd.to_numeric(row['ESTMIN'], errors='coerce')) else None
-            estmax = float(row['ESTMAX']) if row['ESTMAX'] and not pd.isna(pd.to_numeric(row['ESTMAX'], errors='coerce')) else None
-            
-            if estmin is not None and estmax is not None and estmin > estmax:
-                adicionar_erro('ESTMIN', row.get('ESTMIN_original', row['ESTMIN']), "", 
-                              f"Estoque Mínimo ({estmin}) não pode ser maior que Estoque Máximo ({estmax}).", False)
-        except:
-            pass
-
-    print(f"Validação concluída. Total de erros encontrados: {len(erros_encontrados)}")
+    erros_encontrados = executar_regras(REGRAS_ESTOQUE_COMPILADAS, df, {'produtos_validos': produtos_validos},
+                                        grupos_desativados)
+
+    logger.info("Validação concluída. Total de erros encontrados: %d", len(erros_encontrados))
     
     # Remover colunas auxiliares
     colunas_remover = [col for col in df.columns if col.endswith('_original')]
     df_corrigido = df.drop(columns=colunas_remover, errors='ignore')
     
     # Retorna erros e DataFrame corrigido
-    if erros_encontrados:
-        df_erros = pd.DataFrame(erros_encontrados)
-        return df_erros.drop_duplicates().to_dict('records'), df_corrigido
-    
-    return [], df_corrigido
\ No newline at end of file
+    return erros_encontrados, df_corrigido
\ No newline at end of file
@@ -1,9 +1,24 @@
 import pandas as pd
+import numpy as np
 import re
 import sys
 import os
 import csv
+import logging
 import unicodedata
+from functools import partial
+
+from motor_regras import compilar_regras, converter_valor_monetario, executar_regras, maiusculas, versao_regras
+from instrumentacao import etapa
+from indice_mestre import (PASTA_CACHE_PADRAO, buscar_aproximado, buscar_em_indice, carregar_snapshot, indice_vazio,
+                           montar_indice, montar_indice_trigramas, trigramas)
+from leitor_csv import descrever_dialeto, ler_csv, nome_fonte
+from duplicidades import DetectorDuplicidades, GRUPO_DUPLICIDADES, adicionar_duplicidades
+from processamento_em_lotes import TAMANHO_LOTE_PADRAO, validar_em_blocos, validar_em_lotes
+from revalidacao_incremental import validar_incremental
+from texto_arrow import como_texto
+
+logger = logging.getLogger(__name__)
 
 # --- Funções Auxiliares ---
 MAP_SIM_NAO = {'SIM': 'S', 'S': 'S', 'NÃO': 'N', 'NAO': 'N', 'N': 'N', 'YES': 'S', 'NO': 'N', '1': 'S', '0': 'N'}
@@ -12,99 +27,167 @@ def remover_acentos(texto):
     if not isinstance(texto, str): return str(texto)
     return ''.join(c for c in unicodedata.normalize('NFD', texto) if unicodedata.category(c) != 'Mn').upper().strip()
 
-def ler_csv_robusto(caminho_arquivo):
-    """Lê CSV e remove BOM/Sujeira dos headers à força."""
-    if not os.path.exists(caminho_arquivo): return None, "Arquivo não encontrado no servidor."
-    
-    # Tenta utf-8-sig PRIMEIRO (ele remove o BOM nativamente)
-    tentativas = [
-        (';', 'utf-8-sig'), (',', 'utf-8-sig'), ('\t', 'utf-8-sig'),
-        (';', 'latin-1'), (',', 'latin-1'), ('\t', 'latin-1')
-    ]
-    
-    for sep, enc in tentativas:
-        try:
-            df = pd.read_csv(caminho_arquivo, sep=sep, encoding=enc, dtype=str, on_bad_lines='skip')
-            if len(df.columns) > 1:
-                # 🚨 LIMPEZA CIRÚRGICA DE HEADERS 🚨
-                # 1. Força string e maiúscula
-                df.columns = df.columns.astype(str).str.upper()
-                # 2. Remove a sujeira exata do BOM (Ï»¿) que aparece no Latin-1
-                df.columns = df.columns.str.replace('Ï»¿', '', regex=False)
-                # 3. Remove qualquer caractere que NÃO seja letra, número ou underline
-                df.columns = df.columns.str.replace(r'[^A-Z0-9_]', '', regex=True).str.strip()
-                
-                return df, "Sucesso"
-        except Exception:
-            continue
-            
-    return None, "Falha na leitura: Nenhum separador ou encoding funcionou."
+def _limpar_cabecalho(df):
+    # 🚨 LIMPEZA CIRÚRGICA DE HEADERS 🚨
+    # 1. Força string e maiúscula
+    df.columns = df.columns.astype(str).str.upper()
+    # 2. Remove a sujeira exata do BOM (Ï»¿) que aparece no Latin-1
+    df.columns = df.columns.str.replace('Ï»¿', '', regex=False)
+    # 3. Remove qualquer caractere que NÃO seja letra, número ou underline
+    df.columns = df.columns.str.replace(r'[^A-Z0-9_]', '', regex=True).str.strip()
+    return df
+
+def ler_csv_robusto(caminho_arquivo, tamanho_lote=None):
+    """Lê CSV (formato detectado por leitor_csv) e remove BOM/Sujeira dos headers à força.
+
+    Com `tamanho_lote`, o retorno é um iterador de DataFrames (blocos) em vez do DataFrame inteiro.
+    Retorna: (df, dialeto) ou (None, mensagem_de_erro).
+    """
+    df, dialeto = ler_csv(caminho_arquivo, tamanho_lote, on_bad_lines='skip')
+    if df is None: return None, dialeto
+    if tamanho_lote: return (_limpar_cabecalho(bloco) for bloco in df), dialeto
+    return _limpar_cabecalho(df), dialeto
+
+def _normalizar_unicos(serie):
+    """Aplica remover_acentos só uma vez por valor distinto (cidades/UFs se repetem muito)."""
+    unicos = pd.unique(serie)
+    return serie.map(dict(zip(unicos, map(remover_acentos, unicos))))
 
 # --- CARREGAMENTO MESTRE ---
-MAP_CIDADE_CODIGO = {}
-MAP_UF_CODIGO = {}
+# Os mestres viram índices ordenados (ver indice_mestre.py) guardados num snapshot
+# binário; os CSVs só são lidos de novo quando o conteúdo deles muda.
+# Cidades têm dois índices: só pelo nome (legado, homônimos se sobrescrevem) e por
+# "CODUF|NOME", com os trigramas dos nomes para a busca aproximada.
+INDICE_CIDADES = indice_vazio()
+INDICE_CIDADES_UF = indice_vazio()
+INDICE_UF = indice_vazio()
 ERRO_MESTRE_MSG = ""
+ORIGEM_MESTRE = ""
+
+def _ler_mestre_cidades(arquivos):
+    leituras = [ler_csv_robusto(caminho) for caminho in arquivos]
+    dfs = [df for df, _ in leituras if df is not None]
+    if not dfs:
+        raise ValueError(f"Falha leitura. Status: {'/'.join(str(s) for _, s in leituras)}")
+    df_full = pd.concat(dfs, ignore_index=True)
+
+    # Tenta identificar colunas (agora limpas)
+    col_nome = next((c for c in df_full.columns if c in ['NOMECID', 'CIDADE', 'NOME_CIDADE']), None)
+    col_cod = next((c for c in df_full.columns if c in ['CODCID', 'CODIGO', 'COD_CIDADE']), None)
+    if not (col_nome and col_cod):
+        raise ValueError(f"Colunas NOMECID/CODCID não encontradas. Lidas: {list(df_full.columns)}")
+    return df_full, _normalizar_unicos(df_full[col_nome]), df_full[col_cod]
+
+def _construir_indice_cidades(arquivos):
+    _, nomes, codigos = _ler_mestre_cidades(arquivos)
+    return montar_indice(nomes, codigos)
+
+def _construir_indice_cidades_uf(arquivos):
+    df_full, nomes, codigos = _ler_mestre_cidades(arquivos)
+    # No mestre de cidades a coluna UF guarda o código do estado (CODUF = CODREG do parceiro)
+    col_uf = next((c for c in df_full.columns if c in ['UF', 'CODUF', 'CODREG']), None)
+    if not col_uf:
+        raise ValueError(f"Coluna UF não encontrada no mestre de cidades. Lidas: {list(df_full.columns)}")
+    indice = montar_indice(df_full[col_uf].fillna('').astype(str).str.strip() + '|' + nomes, codigos)
+    partes = np.char.partition(indice['chaves'], '|')
+    nomes_unicos = partes[:, 2]
+    return dict(indice, ufs=partes[:, 0], nomes=nomes_unicos, **montar_indice_trigramas(nomes_unicos.tolist()))
+
+def _construir_indice_uf(arquivo):
+    df_uf, s_uf = ler_csv_robusto(arquivo)
+    if df_uf is None:
+        raise ValueError(f"Falha leitura. Status: {s_uf}")
+    col_uf = next((c for c in df_uf.columns if c in ['UF', 'SIGLA', 'ESTADO']), None)
+    # Aceita tanto CODREG quanto CODUF
+    col_cod = next((c for c in df_uf.columns if c in ['CODREG', 'CODUF', 'CODIGO']), None)
+    if not (col_uf and col_cod):
+        raise ValueError(f"Colunas UF/CODREG não encontradas. Lidas: {list(df_uf.columns)}")
+    return montar_indice(_normalizar_unicos(df_uf[col_uf]), df_uf[col_cod])
 
-def carregar_dados_mestre():
-    global MAP_CIDADE_CODIGO, MAP_UF_CODIGO, ERRO_MESTRE_MSG
+# Código que monta cada índice (entra na chave do snapshot, ver indice_mestre.carregar_snapshot)
+CODIGO_INDICE_UF = (_construir_indice_uf, ler_csv_robusto, _limpar_cabecalho, _normalizar_unicos, remover_acentos, montar_indice)
+CODIGO_INDICE_CIDADES = (_construir_indice_cidades, _construir_indice_cidades_uf, _ler_mestre_cidades, *CODIGO_INDICE_UF[1:],
+                         montar_indice_trigramas, trigramas)
+
+def carregar_dados_mestre(pasta_cache=PASTA_CACHE_PADRAO):
+    """Carrega (ou recompila) os snapshots de cidades e UF. Também serve de etapa de build."""
+    global INDICE_CIDADES, INDICE_CIDADES_UF, INDICE_UF, ERRO_MESTRE_MSG, ORIGEM_MESTRE
     base_path = os.path.dirname(os.path.abspath(__file__)) 
-    
-    f_cid1 = "cidades1.csv"
-    f_cid2 = "cidades2.csv"
-    f_uf = "estados.csv"
+    ERRO_MESTRE_MSG = ""
+    origens = []
 
     # 1. CIDADES
-    df1, s1 = ler_csv_robusto(os.path.join(base_path, f_cid1))
-    df2, s2 = ler_csv_robusto(os.path.join(base_path, f_cid2))
-    
-    dfs = []
-    if df1 is not None: dfs.append(df1)
-    if df2 is not None: dfs.append(df2)
-    
-    if dfs:
-        df_full = pd.concat(dfs, ignore_index=True)
-        
-        # Tenta identificar colunas (agora limpas)
-        col_nome = next((c for c in df_full.columns if c in ['NOMECID', 'CIDADE', 'NOME_CIDADE']), None)
-        col_cod = next((c for c in df_full.columns if c in ['CODCID', 'CODIGO', 'COD_CIDADE']), None)
-        
-        if col_nome and col_cod:
-            df_full['CHAVE'] = df_full[col_nome].apply(remover_acentos)
-            MAP_CIDADE_CODIGO = df_full.set_index('CHAVE')[col_cod].to_dict()
-        else:
-            ERRO_MESTRE_MSG += f" [CIDADES: Colunas NOMECID/CODCID não encontradas. Lidas: {list(df_full.columns)}]"
-    else:
-        ERRO_MESTRE_MSG += f" [CIDADES: Falha leitura. Status: {s1}/{s2}]"
+    f_cidades = [os.path.join(base_path, "cidades1.csv"), os.path.join(base_path, "cidades2.csv")]
+    try:
+        INDICE_CIDADES, origem = carregar_snapshot('cidades', f_cidades, lambda: _construir_indice_cidades(f_cidades), pasta_cache,
+                                                   codigo=CODIGO_INDICE_CIDADES)
+        INDICE_CIDADES_UF, _ = carregar_snapshot('cidades_uf', f_cidades, lambda: _construir_indice_cidades_uf(f_cidades), pasta_cache,
+                                                 codigo=CODIGO_INDICE_CIDADES)
+        origens.append(f"cidades: {origem}")
+    except ValueError as e:
+        INDICE_CIDADES, INDICE_CIDADES_UF = indice_vazio(), indice_vazio()
+        ERRO_MESTRE_MSG += f" [CIDADES: {e}]"
 
     # 2. UF
-    df_uf, s_uf = ler_csv_robusto(os.path.join(base_path, f_uf))
-    if df_uf is not None:
-        col_uf = next((c for c in df_uf.columns if c in ['UF', 'SIGLA', 'ESTADO']), None)
-        # Aceita tanto CODREG quanto CODUF
-        col_cod = next((c for c in df_uf.columns if c in ['CODREG', 'CODUF', 'CODIGO']), None)
-        
-        if col_uf and col_cod:
-            df_uf['CHAVE'] = df_uf[col_uf].apply(remover_acentos)
-            MAP_UF_CODIGO = df_uf.set_index('CHAVE')[col_cod].to_dict()
-        else:
-            ERRO_MESTRE_MSG += f" [UF: Colunas UF/CODREG não encontradas. Lidas: {list(df_uf.columns)}]"
-    else:
-        ERRO_MESTRE_MSG += f" [UF: Falha leitura. Status: {s_uf}]"
+    f_uf = os.path.join(base_path, "estados.csv")
+    try:
+        INDICE_UF, origem = carregar_snapshot('uf', [f_uf], lambda: _construir_indice_uf(f_uf), pasta_cache, codigo=CODIGO_INDICE_UF)
+        origens.append(f"uf: {origem}")
+    except ValueError as e:
+        INDICE_UF = indice_vazio()
+        ERRO_MESTRE_MSG += f" [UF: {e}]"
+
+    ORIGEM_MESTRE = ", ".join(origens)
 
 carregar_dados_mestre()
 
+# --- Resolução de Cidades ---
+# Ordem: (UF, nome) exato -> só o nome (como antes, cobre UF vazia/divergente) ->
+# nome parecido no mestre (trigramas + distância de edição), dentro da UF quando ela
+# é conhecida. A busca aproximada roda uma vez por par (UF, nome) distinto.
+TAMANHO_MINIMO_APROXIMADO = 4
+
+def _limite_edicao(nome):
+    return 1 if len(nome) < 10 else 2
+
+def resolver_cidades(nomes, codigos_uf):
+    """
+    Devolve (CODCID, nome sugerido) para cada linha; o nome sugerido só vem preenchido
+    quando o código saiu da busca aproximada (é a correção reportada no relatório).
+    """
+    sugestao = pd.Series('', index=nomes.index, dtype=object)
+    if len(nomes) == 0: return pd.Series('', index=nomes.index, dtype=object), sugestao
+    codcid = buscar_em_indice(codigos_uf.astype(str) + '|' + nomes, INDICE_CIDADES_UF)
+    falta = codcid == ''
+    if falta.any(): codcid[falta] = buscar_em_indice(nomes[falta], INDICE_CIDADES)
+
+    falta = (codcid == '') & (nomes.str.len() >= TAMANHO_MINIMO_APROXIMADO)
+    if not falta.any() or 'trigramas' not in INDICE_CIDADES_UF: return codcid, sugestao
+    nomes_mestre, ufs_mestre = INDICE_CIDADES_UF['nomes'], INDICE_CIDADES_UF['ufs']
+    encontrados = {}
+    for uf, nome in pd.DataFrame({'uf': codigos_uf[falta], 'nome': nomes[falta]}).drop_duplicates().itertuples(index=False):
+        posicao = buscar_aproximado(nome, INDICE_CIDADES_UF, nomes_mestre, _limite_edicao(nome),
+                                    permitidos=(ufs_mestre == uf) if uf else None)
+        if posicao >= 0: encontrados[(uf, nome)] = (str(INDICE_CIDADES_UF['codigos'][posicao]), str(nomes_mestre[posicao]))
+    if encontrados:
+        pares = pd.Series(list(zip(codigos_uf[falta], nomes[falta])), index=nomes[falta].index).map(encontrados).dropna()
+        codcid[pares.index] = pares.str[0]
+        sugestao[pares.index] = pares.str[1]
+    return codcid, sugestao
+
 # --- Validação e Mapeamento ---
 def limpar_documento(doc_series):
-    return doc_series.astype(str).str.replace(r'[./-]', '', regex=True).str.strip()
+    # Maiúsculas por causa do CNPJ alfanumérico; documentos numéricos não mudam.
+    return como_texto(doc_series).str.replace(r'[./-]', '', regex=True).str.strip().str.upper()
     
 def limpar_valor_monetario(df, coluna):
     if coluna in df.columns:
-        df[coluna] = df[coluna].astype(str).str.strip().str.upper()
-        df[coluna] = df[coluna].str.replace('R$', '', regex=False).str.replace('$', '', regex=False)
-        df[coluna] = df[coluna].str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
-        df[coluna] = pd.to_numeric(df[coluna], errors='coerce') 
+        df[coluna] = converter_valor_monetario(df[coluna])
     return df
 
+def limpar_cep(cep_series):
+    return como_texto(cep_series).str.replace(r'[^0-9]', '', regex=True).str.strip()
+
 MAPEAMENTO_COLUNAS = {
     'CGC_CPF': ['CGC_CPF', 'CNPJ_CPF', 'DOCUMENTO', 'DOC', 'CPF_CNPJ'],
     'AD_IDEXTERNO': ['AD_IDEXTERNO', 'COD_SIST_ANTERIOR', 'ID_LEGADO'],
@@ -129,13 +212,21 @@ def mapear_colunas(df, mapeamento):
     return df
 
 # Validadores CPF/CNPJ
+# CNPJ alfanumérico: as 12 primeiras posições aceitam [0-9A-Z] e valem ord(c) - 48
+# (dígitos continuam 0-9, 'A' = 17, ...); os 2 dígitos verificadores seguem numéricos.
+PADRAO_CPF = r'[0-9]{11}'
+PADRAO_CNPJ = r'[0-9A-Z]{12}[0-9]{2}'
+PESOS_CPF = (np.arange(10, 1, -1, dtype=np.int32), np.arange(11, 1, -1, dtype=np.int32))
+PESOS_CNPJ = (np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], dtype=np.int32),
+              np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2], dtype=np.int32))
+
 def _calcular_digito_cpf(cpf_parcial):
     soma = 0; fator = len(cpf_parcial) + 1
     for digito in cpf_parcial: soma += int(digito) * fator; fator -= 1
     resto = soma % 11
     return 0 if resto < 2 else 11 - resto
 def validar_cpf(cpf):
-    if not cpf.isdigit() or len(cpf) != 11: return False
+    if not re.fullmatch(PADRAO_CPF, cpf): return False
     if len(set(cpf)) == 1: return False
     cpf_parcial = cpf[:9]; digito1 = _calcular_digito_cpf(cpf_parcial)
     cpf_parcial += str(digito1); digito2 = _calcular_digito_cpf(cpf_parcial)
@@ -143,107 +234,178 @@ def validar_cpf(cpf):
 def _calcular_digito_cnpj(cnpj_parcial):
     soma = 0; fatores = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
     if len(cnpj_parcial) == 13: fatores.insert(0, 6)
-    for i, digito in enumerate(cnpj_parcial): soma += int(digito) * fatores[i]; resto = soma % 11
+    for i, digito in enumerate(cnpj_parcial): soma += (ord(digito) - 48) * fatores[i]; resto = soma % 11
     return 0 if resto < 2 else 11 - resto
 def validar_cnpj(cnpj):
-    if not cnpj.isdigit() or len(cnpj) != 14: return False
+    if not re.fullmatch(PADRAO_CNPJ, cnpj): return False
     if len(set(cnpj)) == 1: return False
     cnpj_parcial = cnpj[:12]; digito1 = _calcular_digito_cnpj(cnpj_parcial)
     cnpj_parcial += str(digito1); digito2 = _calcular_digito_cnpj(cnpj_parcial)
     return cnpj == f"{cnpj[:12]}{digito1}{digito2}"
 
-def validar_parceiros(caminho_arquivo):
+def _matriz_digitos(docs, tamanho):
+    """Empilha documentos de mesmo tamanho (ASCII) numa matriz uint8 com o valor de cada posição."""
+    bruto = np.frombuffer(''.join(docs).encode('ascii'), dtype=np.uint8)
+    return bruto.reshape(-1, tamanho) - np.uint8(48)
+
+def _conferir_digitos(matriz, pesos):
+    """Recalcula os dois dígitos verificadores por produto escalar e confere com os informados."""
+    n = len(pesos[0])
+    confere = np.ones(len(matriz), dtype=bool)
+    for i, p in enumerate(pesos):
+        resto = (matriz[:, :n + i] @ p) % 11
+        confere &= matriz[:, n + i] == np.where(resto < 2, 0, 11 - resto)
+    repetido = (matriz == matriz[:, :1]).all(axis=1)
+    return confere & ~repetido
+
+def validar_documentos_lote(docs):
+    """Valida uma coluna inteira de CPF/CNPJ já limpa, sem laço por linha.
+
+    11 caracteres são conferidos como CPF e 14 como CNPJ (numérico ou alfanumérico);
+    retorna uma Series booleana alinhada ao índice de `docs`.
+    """
+    docs = como_texto(docs)
+    valido = np.zeros(len(docs), dtype=bool)
+    for padrao, tamanho, pesos in ((PADRAO_CPF, 11, PESOS_CPF), (PADRAO_CNPJ, 14, PESOS_CNPJ)):
+        candidatos = docs.str.fullmatch(padrao).fillna(False).to_numpy(dtype=bool)
+        if candidatos.any():
+            valido[candidatos] = _conferir_digitos(_matriz_digitos(docs[candidatos], tamanho), pesos)
+    return pd.Series(valido, index=docs.index)
+
+# --- Regras de Parceiros (ver motor_regras.py) ---
+# A posição na lista define a ordem dos erros dentro de cada linha.
+COLUNAS_ERRO_PARCEIRO = ["linha", "coluna", "valor_encontrado", "erro", "valor_corrigido", "corrigido"]
+COLUNAS_SIM_NAO = ['ATIVO', 'CLIENTE', 'FORNECEDOR']
+
+REGRAS_PARCEIRO = [
+    # Validação Mestre (CODCID/CODREG vêm da busca no mestre de cidades/UF)
+    {'tipo': 'obrigatorio', 'coluna': 'CIDADE', 'campo': 'CODCID', 'valor': 'CIDADE', 'quando': [('CIDADE', 'preenchido')],
+     'mensagem': "Cidade não encontrada no mestre.", 'grupo': 'mestre'},
+    {'tipo': 'obrigatorio', 'coluna': 'UF', 'campo': 'CODREG', 'valor': 'UF', 'quando': [('UF', 'preenchido')],
+     'mensagem': "UF não encontrada no mestre.", 'grupo': 'mestre'},
+
+    {'tipo': 'normalizacao', 'coluna': 'CIDADE', 'fonte': 'CIDADE_SUGERIDA',
+     'mensagem': "Cidade corrigida para o nome do mestre (grafia semelhante).", 'grupo': 'mestre'},
+
+    # Correções
+    {'tipo': 'normalizacao', 'coluna': 'CGC_CPF', 'funcao': limpar_documento, 'mensagem': "Formatado.", 'grupo': 'padronizacao'},
+    *[{'tipo': 'normalizacao', 'coluna': col, 'mapa': MAP_SIM_NAO, 'mensagem': "Padronizado {valor}.", 'grupo': 'padronizacao'}
+      for col in COLUNAS_SIM_NAO],
+    {'tipo': 'normalizacao', 'coluna': 'TIPPESSOA', 'destino': 'TIPPESSOA_limpo', 'funcao': maiusculas},
+    {'tipo': 'normalizacao', 'coluna': 'CEP', 'destino': 'CEP_limpo', 'funcao': limpar_cep},
+    {'tipo': 'normalizacao', 'coluna': 'LIMITECREDITO', 'funcao': converter_valor_monetario},
+
+    # Obrigatórios e domínios
+    {'tipo': 'obrigatorio', 'coluna': 'AD_IDEXTERNO', 'valor': None, 'mensagem': "Vazio.", 'grupo': 'obrigatorios'},
+    {'tipo': 'obrigatorio', 'coluna': 'NOMEPARC', 'valor': None, 'mensagem': "Vazio.", 'grupo': 'obrigatorios'},
+    {'tipo': 'obrigatorio', 'coluna': 'TIPPESSOA', 'campo': 'TIPPESSOA_limpo', 'valor': None, 'mensagem': "Vazio.", 'grupo': 'obrigatorios'},
+    {'tipo': 'dominio', 'coluna': 'TIPPESSOA', 'campo': 'TIPPESSOA_limpo', 'valor': 'TIPPESSOA', 'valores': {'F', 'J'},
+     'quando': [('TIPPESSOA_limpo', '!=', '')], 'mensagem': "Inválido.", 'grupo': 'dominios'},
+    *[{'tipo': 'dominio', 'coluna': col, 'valor': f'{col}_original', 'valores': {'S', 'N'},
+       'mensagem': "Inválido (S/N).", 'grupo': 'dominios'}
+      for col in COLUNAS_SIM_NAO],
+
+    # Documento (CPF/CNPJ)
+    {'tipo': 'obrigatorio', 'coluna': 'CGC_CPF', 'valor': None, 'mensagem': "Vazio.", 'grupo': 'documentos'},
+    *[regra
+      for letra, nome, tamanho in (('F', 'CPF', 11), ('J', 'CNPJ', 14))
+      for regra in (
+          {'tipo': 'tamanho', 'coluna': 'CGC_CPF', 'valor': 'CGC_CPF_original', 'tamanho': tamanho,
+           'quando': [('TIPPESSOA_limpo', '==', letra), ('CGC_CPF', '!=', '')],
+           'mensagem': nome + " tam. errado ({tamanho}).", 'grupo': 'documentos'},
+          {'tipo': 'funcao', 'coluna': 'CGC_CPF', 'valor': 'CGC_CPF_original', 'funcao': validar_documentos_lote,
+           'quando': [('TIPPESSOA_limpo', '==', letra), ('CGC_CPF', 'tamanho', tamanho)],
+           'mensagem': nome + " Inválido.", 'grupo': 'documentos'})],
+
+    # Endereço
+    {'tipo': 'obrigatorio', 'coluna': 'CEP', 'campo': 'CEP_limpo', 'valor': 'CEP', 'mensagem': "Vazio.", 'grupo': 'endereco'},
+    {'tipo': 'tamanho', 'coluna': 'CEP', 'campo': 'CEP_limpo', 'valor': 'CEP', 'tamanho': 8,
+     'quando': [('CEP_limpo', '!=', '')], 'mensagem': "CEP inválido.", 'grupo': 'endereco'},
+]
+REGRAS_PARCEIRO_COMPILADAS = compilar_regras(REGRAS_PARCEIRO)
+VERSAO_REGRAS_PARCEIRO = versao_regras(REGRAS_PARCEIRO, mestres=('cidades', 'cidades_uf', 'uf'))
+# Chaves que não podem se repetir no arquivo nem na carga (grupo 'duplicidades', ver duplicidades.py)
+CHAVES_UNICAS_PARCEIRO = ('AD_IDEXTERNO', 'CGC_CPF')
+
+def _erro_mestre():
+    return [{"linha": 0, "coluna": "SISTEMA", "valor_encontrado": "-", "erro": f"ERRO CRÍTICO CARREGAMENTO MESTRE: {ERRO_MESTRE_MSG}"}], None
+
+def _erro_leitura(msg_erro):
+    return [{"linha": 0, "coluna": "Arquivo", "valor_encontrado": "N/A", "erro": f"Erro crítico de leitura. {msg_erro}"}], None
+
+def validar_parceiros(caminho_arquivo, grupos_desativados=(), progresso=None, processos=None, incremental=None,
+                      carga=None, arquivo=None):
+    """Valida a planilha de parceiros (caminho, bytes ou buffer do upload). `grupos_desativados` desliga grupos de REGRAS_PARCEIRO.
+
+    `progresso(fase, feitas, total)` opcional recebe o andamento (ver tarefas.py); `processos` > 1
+    valida arquivos grandes em vários núcleos (ver processamento_paralelo.py).
+    `incremental=(historico, chave)` reaproveita a validação anterior do mesmo arquivo lógico
+    e só valida as linhas alteradas (ver revalidacao_incremental.py).
+    Chaves únicas repetidas no arquivo viram erro; com `carga`, também as que já existem em
+    outro arquivo da mesma carga de migração (`arquivo` = nome deste; ver duplicidades.py).
+    """
     # Se o mestre falhar, mostra o erro
-    if not MAP_CIDADE_CODIGO or not MAP_UF_CODIGO:
-        return [{"linha": 0, "coluna": "SISTEMA", "valor_encontrado": "-", "erro": f"ERRO CRÍTICO CARREGAMENTO MESTRE: {ERRO_MESTRE_MSG}"}], None
+    if not len(INDICE_CIDADES['chaves']) or not len(INDICE_UF['chaves']): return _erro_mestre()
 
-    erros_encontrados = []
-    
     # 1. Leitura
-    df, msg_erro = ler_csv_robusto(caminho_arquivo)
-    if df is None:
-        return [{"linha": 0, "coluna": "Arquivo", "valor_encontrado": "N/A", "erro": f"Erro crítico de leitura. {msg_erro}"}], None
+    if progresso: progresso('leitura')
+    df, dialeto = ler_csv_robusto(caminho_arquivo)
+    if df is None: return _erro_leitura(dialeto)
+    logger.info("Arquivo lido: %s", descrever_dialeto(dialeto))
+    validar_bloco = partial(validar_df_parceiros, grupos_desativados=grupos_desativados)
+    if incremental:
+        historico, chave = incremental
+        resultado = validar_incremental(df, validar_bloco, historico, (*chave, VERSAO_REGRAS_PARCEIRO, tuple(sorted(grupos_desativados))),
+                                        progresso, processos)
+    else:
+        resultado = validar_em_blocos(df, validar_bloco, progresso, processos=processos)
+    return adicionar_duplicidades(resultado, CHAVES_UNICAS_PARCEIRO, 'parceiros', carga, arquivo or nome_fonte(caminho_arquivo),
+                                  grupos_desativados, progresso)
+
+def validar_parceiros_em_lotes(caminho_arquivo, caminho_corrigido, caminho_erros, tamanho_lote=TAMANHO_LOTE_PADRAO, grupos_desativados=(), processos=None,
+                               carga=None, arquivo=None, consultar_carga=True):
+    """
+    Versão streaming de validar_parceiros para arquivos grandes: lê em blocos e grava
+    a planilha corrigida e o relatório de erros em disco conforme avança.
+    `consultar_carga=False` só grava as chaves na carga (ver duplicidades.erros_na_carga).
+    Retorna: (erros_criticos, resumo) — ver processamento_em_lotes.validar_em_lotes.
+    """
+    if not len(INDICE_CIDADES['chaves']) or not len(INDICE_UF['chaves']): return _erro_mestre()
+    lotes, dialeto = ler_csv_robusto(caminho_arquivo, tamanho_lote=tamanho_lote)
+    if lotes is None: return _erro_leitura(dialeto)
+    logger.info("Arquivo lido: %s", descrever_dialeto(dialeto))
+    with DetectorDuplicidades(CHAVES_UNICAS_PARCEIRO, 'parceiros', carga, arquivo or nome_fonte(caminho_arquivo),
+                              consultar_carga=consultar_carga) as duplicidades:
+        return validar_em_lotes(lotes, partial(validar_df_parceiros, grupos_desativados=grupos_desativados),
+                                caminho_corrigido, caminho_erros, COLUNAS_ERRO_PARCEIRO, processos,
+                                None if GRUPO_DUPLICIDADES in grupos_desativados else duplicidades)
+
+def validar_df_parceiros(df, grupos_desativados=()):
+    """Valida um DataFrame já lido (arquivo inteiro ou um bloco; a linha vem do índice)."""
     df = df.fillna('')
 
     # 2. Pré-processamento
-    df = mapear_colunas(df, MAPEAMENTO_COLUNAS)
+    with etapa('mapeamento'):
+        df = mapear_colunas(df, MAPEAMENTO_COLUNAS)
     colunas_criticas = ['CGC_CPF', 'TIPPESSOA', 'AD_IDEXTERNO', 'NOMEPARC', 'RAZAOSOCIAL', 'ATIVO', 'CLIENTE', 'FORNECEDOR']
     for col in colunas_criticas:
         if col not in df.columns: return [{"linha": 0, "coluna": col, "valor_encontrado": "-", "erro": f"Coluna obrigatória '{col}' não encontrada no arquivo."}], None
 
-    tem_cep = 'CEP' in df.columns
-    
     # --- LÓGICA DE CONVERSÃO CIDADE/UF ---
-    if 'CIDADE' in df.columns:
-        df['CIDADE_BUSCA'] = df['CIDADE'].apply(remover_acentos)
-        df['CODCID'] = df['CIDADE_BUSCA'].apply(lambda x: MAP_CIDADE_CODIGO.get(x, None))
-        df['CODCID'] = df['CODCID'].fillna('')
-    else: df['CODCID'] = ''
-
-    if 'UF' in df.columns:
-        df['UF_BUSCA'] = df['UF'].apply(remover_acentos)
-        df['CODREG'] = df['UF_BUSCA'].apply(lambda x: MAP_UF_CODIGO.get(x, None))
-        df['CODREG'] = df['CODREG'].fillna('')
-    else: df['CODREG'] = ''
-
-    # Limpezas
-    df['CGC_CPF_original'] = df['CGC_CPF'].copy()
-    df['CGC_CPF'] = limpar_documento(df['CGC_CPF'])
-    df['TIPPESSOA_limpo'] = df['TIPPESSOA'].astype(str).str.upper().str.strip()
-    
-    for col in ['ATIVO', 'CLIENTE', 'FORNECEDOR']:
-        df[f'{col}_original'] = df[col].copy()
-        df[col] = df[col].astype(str).str.upper().str.strip().replace(MAP_SIM_NAO, regex=False)
-    
-    if tem_cep: df['CEP_limpo'] = df['CEP'].astype(str).str.replace(r'[^0-9]', '', regex=True).str.strip()
-    
-    df = limpar_valor_monetario(df, 'LIMITECREDITO')
-
-    # 3. Validação
-    for index, row in df.iterrows():
-        linha_num = index + 2 
-        def adicionar_erro(coluna, valor, mensagem, valor_corrigido="", foi_corrigido=False):
-            erros_encontrados.append({"linha": linha_num, "coluna": coluna, "valor_encontrado": str(valor), "erro": mensagem, "valor_corrigido": str(valor_corrigido), "corrigido": foi_corrigido})
+    with etapa('busca_mestre'):
+        if 'UF' in df.columns:
+            df['UF_BUSCA'] = _normalizar_unicos(df['UF'])
+            df['CODREG'] = buscar_em_indice(df['UF_BUSCA'], INDICE_UF)
+        else: df['CODREG'] = ''
 
-        # Validação Mestre
         if 'CIDADE' in df.columns:
-            if row['CODCID']: pass
-            elif row['CIDADE'] and str(row['CIDADE']).strip():
-                adicionar_erro('CIDADE', row['CIDADE'], "Cidade não encontrada no mestre.", "", False)
+            df['CIDADE_BUSCA'] = _normalizar_unicos(df['CIDADE'])
+            df['CODCID'], df['CIDADE_SUGERIDA'] = resolver_cidades(df['CIDADE_BUSCA'], df['CODREG'])
+        else: df['CODCID'] = ''
 
-        if 'UF' in df.columns:
-            if row['CODREG']: pass
-            elif row['UF'] and str(row['UF']).strip():
-                adicionar_erro('UF', row['UF'], "UF não encontrada no mestre.", "", False)
-
-        # Correções e Validações (Mantidas do código anterior)
-        if row['CGC_CPF'] != row['CGC_CPF_original']:
-             adicionar_erro('CGC_CPF', row['CGC_CPF_original'], "Formatado.", row['CGC_CPF'], True)
-        for col_dom in ['ATIVO', 'CLIENTE', 'FORNECEDOR']:
-            if row[col_dom] != row[f'{col_dom}_original']:
-                 adicionar_erro(col_dom, row[f'{col_dom}_original'], f"Padronizado {row[col_dom]}.", row[col_dom], True)
-
-        if not row['AD_IDEXTERNO']: adicionar_erro('AD_IDEXTERNO', '', "Vazio.", "", False)
-        if not row['NOMEPARC']: adicionar_erro('NOMEPARC', '', "Vazio.", "", False)
-        tipo = row['TIPPESSOA_limpo']
-        if not tipo: adicionar_erro('TIPPESSOA', '', "Vazio.", "", False)
-        elif tipo not in ('F', 'J'): adicionar_erro('TIPPESSOA', row['TIPPESSOA'], "Inválido.", "", False)
-        
-        for c in ['ATIVO', 'CLIENTE', 'FORNECEDOR']:
-            if row[c] not in ('S', 'N'): adicionar_erro(c, row[f'{c}_original'], "Inválido (S/N).", "", False)
-        
-        doc = row['CGC_CPF']
-        if not doc: adicionar_erro('CGC_CPF', '', "Vazio.", "", False)
-        elif tipo == 'F':
-            if len(doc) != 11: adicionar_erro('CGC_CPF', row['CGC_CPF_original'], f"CPF tam. errado ({len(doc)}).", "", False)
-            elif not validar_cpf(doc): adicionar_erro('CGC_CPF', row['CGC_CPF_original'], "CPF Inválido.", "", False)
-        elif tipo == 'J':
-            if len(doc) != 14: adicionar_erro('CGC_CPF', row['CGC_CPF_original'], f"CNPJ tam. errado ({len(doc)}).", "", False)
-            elif not validar_cnpj(doc): adicionar_erro('CGC_CPF', row['CGC_CPF_original'], "CNPJ Inválido.", "", False)
-
-        if tem_cep:
-            if not row['CEP_limpo']: adicionar_erro('CEP', row['CEP'], "Vazio.", "", False)
-            elif len(row['CEP_limpo']) != 8: adicionar_erro('CEP', row['CEP'], "CEP inválido.", "", False)
+    # 3. Limpezas + Validação (motor de regras, em bloco)
+    erros_encontrados = executar_regras(REGRAS_PARCEIRO_COMPILADAS, df, grupos_desativados=grupos_desativados,
+                                        colunas=COLUNAS_ERRO_PARCEIRO)
 
     # 4. SUBSTITUIÇÃO FINAL (Coloca o CÓDIGO no lugar do NOME)
     if 'CIDADE' in df.columns and 'CODCID' in df.columns:
@@ -252,9 +414,7 @@ def validar_parceiros(caminho_arquivo):
         df['UF'] = df['CODREG'].fillna(df['UF'])
 
     # Remove colunas auxiliares
-    cols_to_drop = [c for c in df.columns if '_original' in c or '_BUSCA' in c or '_limpo' in c or c in ['CODCID', 'CODREG']]
+    cols_to_drop = [c for c in df.columns if '_original' in c or '_BUSCA' in c or '_limpo' in c or c in ['CODCID', 'CODREG', 'CIDADE_SUGERIDA']]
     df_final = df.drop(columns=cols_to_drop, errors='ignore')
 
-    if erros_encontrados:
-        return pd.DataFrame(erros_encontrados).drop_duplicates().to_dict('records'), df_final
-    return [], df_final
\ No newline at end of file
+    return erros_encontrados, df_final
\ No newline at end of file
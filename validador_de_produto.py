@@ -1,6 +1,21 @@
+import numpy as np
 import pandas as pd
+import logging
+import os
 import re
 import sys
+from functools import partial
+
+from instrumentacao import etapa
+from motor_regras import COLUNAS_ERRO, compilar_regras, converter_valor_monetario, executar_regras, maiusculas, versao_regras
+from indice_mestre import PASTA_CACHE_PADRAO, carregar_snapshot, montar_indice_codigos, niveis_prefixo
+from leitor_csv import descrever_dialeto, ler_csv, nome_fonte
+from duplicidades import DetectorDuplicidades, GRUPO_DUPLICIDADES, adicionar_duplicidades
+from processamento_em_lotes import TAMANHO_LOTE_PADRAO, validar_em_blocos, validar_em_lotes
+from revalidacao_incremental import validar_incremental
+from texto_arrow import como_texto
+
+logger = logging.getLogger(__name__)
 
 # --- Domínios e Mapeamentos ---
 MAP_SIM_NAO = {'SIM': 'S', 'S': 'S', 'NÃO': 'N', 'NAO': 'N', 'N': 'N', 'YES': 'S', 'NO': 'N', '1': 'S', '0': 'N'}
@@ -8,6 +23,21 @@ DOMINIO_UNIDADE = {'CM', 'M', 'MM', 'KG', 'G', 'L', 'ML', 'UN', 'PC', 'CX', 'FD'
 DOMINIO_USOPROD = {'1', '2', '4', 'B', 'C', 'D', 'E', 'F', 'I', 'M', 'O', 'P', 'R', 'T', 'V'}
 DOMINIO_SIM_NAO = {'S', 'N'}
 
+def ler_tamanhos_maximos(texto):
+    """'DESCRPROD=100,MARCA=20' -> {'DESCRPROD': 100, 'MARCA': 20}; itens inválidos são ignorados com aviso."""
+    tamanhos = {}
+    for item in filter(None, (parte.strip() for parte in texto.split(','))):
+        coluna, _, maximo = item.partition('=')
+        if not maximo.strip().isdigit():
+            print(f"Aviso: tamanho máximo inválido em VALIDADOR_TAMANHOS_PRODUTO: '{item}'.", file=sys.stderr)
+            continue
+        tamanhos[coluna.strip().upper()] = int(maximo)
+    return tamanhos
+
+# Tamanho máximo dos campos de texto no cadastro de produtos do ERP. Depende do dicionário de dados
+# da versão do cliente, então não há padrão: sem VALIDADOR_TAMANHOS_PRODUTO a regra fica desligada.
+TAMANHOS_MAXIMOS = ler_tamanhos_maximos(os.environ.get('VALIDADOR_TAMANHOS_PRODUTO', ''))
+
 # Mapeamento de unidades comuns
 MAP_UNIDADES = {
     'METRO': 'M', 'METROS': 'M', 'MTS': 'M', 'MT': 'M',
@@ -24,16 +54,15 @@ MAP_UNIDADES = {
 }
 
 def limpar_valor_monetario(df, coluna):
-    """Remove R$, pontos de milhar e substitui vírgula por ponto decimal."""
+    """Versão em DataFrame de converter_valor_monetario (altera a coluna no lugar)."""
     if coluna in df.columns:
-        df[coluna] = df[coluna].astype(str).str.strip().str.upper()
-        df[coluna] = df[coluna].str.replace('R$', '', regex=False)
-        df[coluna] = df[coluna].str.replace('$', '', regex=False)
-        df[coluna] = df[coluna].str.replace('.', '', regex=False)
-        df[coluna] = df[coluna].str.replace(',', '.', regex=False)
-        df[coluna] = pd.to_numeric(df[coluna], errors='coerce') 
+        df[coluna] = converter_valor_monetario(df[coluna])
     return df
 
+def limpar_ncm(serie):
+    """Limpeza NCM (Solução anti-RegEx): remove pontos, barras, hífens e espaços."""
+    return como_texto(serie).str.replace('.', '', regex=False).str.replace('/', '', regex=False).str.replace('-', '', regex=False).str.replace(' ', '', regex=False).str.strip()
+
 def mapear_colunas(df, mapeamento):
     """Renomeia colunas do DF para os nomes oficiais do script."""
     colunas_encontradas = {}
@@ -45,105 +74,219 @@ def mapear_colunas(df, mapeamento):
     df.rename(columns=colunas_encontradas, inplace=True)
     return df
 
+# --- Tabela NCM (mestre local) ---
+# A tabela NCM vigente (exportação da Receita/Siscomex: uma linha por código, com a coluna
+# NCM ou CÓDIGO, pontuada ou não) fica em tabela_ncm.csv ao lado do app, ou no caminho de
+# VALIDADOR_TABELA_NCM. Vira um snapshot (ver indice_mestre.py) com os códigos de 8 dígitos
+# ordenados; capítulo e posição são conferidos pelo prefixo, no mesmo array. Linhas de
+# capítulo/posição da tabela (menos de 8 dígitos) são ignoradas. Sem a tabela, o NCM é
+# conferido só no formato.
+DIGITOS_NCM = 8
+NIVEIS_NCM = (2, 4, 8)  # capítulo, posição, código
+INDICE_NCM = {'codigos': np.array([], dtype=np.int64)}
+ERRO_NCM_MSG = ""
+
+def _construir_indice_ncm(arquivo):
+    df, status = ler_csv(arquivo)
+    if df is None:
+        raise ValueError(f"Falha leitura. Status: {status}")
+    df.columns = df.columns.astype(str).str.upper().str.strip()
+    col_ncm = next((c for c in df.columns if c in ['NCM', 'CODNCM', 'CODIGO', 'CÓDIGO']), None)
+    if not col_ncm:
+        raise ValueError(f"Coluna NCM/CODIGO não encontrada. Lidas: {list(df.columns)}")
+    indice = montar_indice_codigos(limpar_ncm(df[col_ncm]), DIGITOS_NCM)
+    if not len(indice['codigos']):
+        raise ValueError("Nenhum código NCM de 8 dígitos na tabela.")
+    return indice
+
+def carregar_tabela_ncm(arquivo=None, pasta_cache=PASTA_CACHE_PADRAO):
+    """Carrega (ou recompila) o snapshot da tabela NCM. Sem tabela, INDICE_NCM fica vazio."""
+    global INDICE_NCM, ERRO_NCM_MSG
+    arquivo = arquivo or os.environ.get('VALIDADOR_TABELA_NCM') or \
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tabela_ncm.csv')
+    INDICE_NCM, ERRO_NCM_MSG = {'codigos': np.array([], dtype=np.int64)}, ""
+    if not os.path.exists(arquivo):
+        ERRO_NCM_MSG = f"Tabela NCM não encontrada ({arquivo}): NCM conferido só no formato."
+        return
+    try:
+        INDICE_NCM, _ = carregar_snapshot('ncm', [arquivo], lambda: _construir_indice_ncm(arquivo), pasta_cache,
+                                          codigo=(_construir_indice_ncm, limpar_ncm, montar_indice_codigos))
+    except ValueError as e:
+        ERRO_NCM_MSG = f"Tabela NCM inválida ({arquivo}): {e}"
+        print(f"Aviso: {ERRO_NCM_MSG}", file=sys.stderr)
+
+carregar_tabela_ncm()
+
+def aviso_tabela_ncm():
+    """Aviso para o usuário quando o NCM não é conferido na tabela (vazio se a tabela carregou)."""
+    return ERRO_NCM_MSG
+
+def _nivel_ncm(serie):
+    return niveis_prefixo(serie, INDICE_NCM['codigos'], DIGITOS_NCM, NIVEIS_NCM)
+
+# Funções das regras de NCM (máscara de válidos), todas sobre o mesmo cálculo de níveis (os
+# valores distintos da coluna contra o índice; bem mais barato que regex linha a linha).
+# As de existência apontam o primeiro nível que falta; sem tabela carregada, ou com NCM
+# fora do formato (regra própria), não acusam nada.
+def formato_ncm_valido(serie):
+    return _nivel_ncm(serie) >= 0
+
+def capitulo_ncm_existe(serie):
+    if not len(INDICE_NCM['codigos']): return np.ones(len(serie), dtype=bool)
+    return _nivel_ncm(serie) != 0
+
+def posicao_ncm_existe(serie):
+    if not len(INDICE_NCM['codigos']): return np.ones(len(serie), dtype=bool)
+    return _nivel_ncm(serie) != 1
+
+def ncm_existe(serie):
+    if not len(INDICE_NCM['codigos']): return np.ones(len(serie), dtype=bool)
+    return _nivel_ncm(serie) != 2
+
+# --- Regras de Produtos (ver motor_regras.py) ---
+# A posição na lista define a ordem dos erros dentro de cada linha (e a ordem dos backups _original).
+COLUNAS_SIM_NAO = ['TEMIPICOMPRA', 'TEMIPIVENDA', 'USACODBARRASQTD', 'ATIVO']
+
+REGRAS_PRODUTO = [
+    # Correções automáticas (sem registro de erro, mas com backup da coluna original)
+    {'tipo': 'normalizacao', 'coluna': 'NCM', 'funcao': limpar_ncm, 'backup': True},
+    {'tipo': 'normalizacao', 'coluna': 'UNIDADE', 'mapa': MAP_UNIDADES, 'backup': True},
+    {'tipo': 'normalizacao', 'coluna': 'PRECO_VENDA', 'funcao': converter_valor_monetario, 'backup': True},
+    {'tipo': 'normalizacao', 'coluna': 'PRECO_CUSTO', 'funcao': converter_valor_monetario, 'backup': True},
+    {'tipo': 'normalizacao', 'coluna': 'USOPROD', 'funcao': maiusculas, 'backup': True},
+    # Padronizar campos Sim/Não (Resolve o erro do 'sim' e 'não')
+    *[{'tipo': 'normalizacao', 'coluna': col, 'mapa': MAP_SIM_NAO,
+       'mensagem': "Valor padronizado para 'S' ou 'N'.", 'grupo': 'padronizacao'}
+      for col in COLUNAS_SIM_NAO],
+
+    # Validações obrigatórias
+    {'tipo': 'obrigatorio', 'coluna': 'AD_IDEXTERNO', 'mensagem': "Campo obrigatório está vazio.", 'grupo': 'obrigatorios'},
+    {'tipo': 'obrigatorio', 'coluna': 'DESCRPROD', 'mensagem': "Campo obrigatório (Descrição do Produto) está vazio.", 'grupo': 'obrigatorios'},
+    {'tipo': 'obrigatorio', 'coluna': 'NCM', 'valor': None, 'mensagem': "Campo obrigatório (NCM) está vazio.", 'grupo': 'obrigatorios'},
+    {'tipo': 'obrigatorio', 'coluna': 'UNIDADE', 'valor': None, 'mensagem': "Campo obrigatório (Unidade) está vazio.", 'grupo': 'obrigatorios'},
+
+    # NCM: formato e existência na tabela NCM (capítulo -> posição -> código)
+    *[{'tipo': 'funcao', 'coluna': 'NCM', 'funcao': funcao, 'valor': 'NCM_original', 'quando': [('NCM', 'preenchido')],
+       'mensagem': mensagem, 'grupo': 'ncm'}
+      for funcao, mensagem in [(formato_ncm_valido, "NCM inválido (precisa ter 8 dígitos)."),
+                               (capitulo_ncm_existe, "Capítulo do NCM (2 primeiros dígitos) não existe na tabela NCM."),
+                               (posicao_ncm_existe, "Posição do NCM (4 primeiros dígitos) não existe na tabela NCM."),
+                               (ncm_existe, "NCM não existe na tabela NCM (capítulo e posição válidos).")]],
+
+    # Domínios
+    {'tipo': 'dominio', 'coluna': 'UNIDADE', 'valor': 'UNIDADE_original', 'valores': DOMINIO_UNIDADE,
+     'quando': [('UNIDADE', 'preenchido')], 'mensagem': "Unidade não reconhecida ({valor}).", 'grupo': 'dominios'},
+    {'tipo': 'dominio', 'coluna': 'USOPROD', 'valor': 'USOPROD_original', 'valores': DOMINIO_USOPROD,
+     'quando': [('USOPROD', 'preenchido')], 'mensagem': "Uso do produto inválido.", 'grupo': 'dominios'},
+    *[{'tipo': 'dominio', 'coluna': col, 'valor': f'{col}_original', 'valores': DOMINIO_SIM_NAO,
+       'quando': [(col, 'preenchido')], 'mensagem': "Inválido (S/N).", 'grupo': 'dominios'}
+      for col in COLUNAS_SIM_NAO],
+
+    # Tamanhos
+    *[{'tipo': 'tamanho', 'coluna': col, 'maximo': maximo, 'mensagem': f"Texto com {{tamanho}} caracteres (máximo {maximo}).",
+       'grupo': 'tamanhos'}
+      for col, maximo in TAMANHOS_MAXIMOS.items()],
+
+    # Preços (já convertidos para número pelas normalizações; vazio continua permitido)
+    *[regra for col in ['PRECO_VENDA', 'PRECO_CUSTO'] for regra in (
+        {'tipo': 'numerico', 'coluna': col, 'valor': f'{col}_original', 'quando': [(f'{col}_original', 'preenchido')],
+         'mensagem': "Preço inválido (não é um número).", 'grupo': 'precos'},
+        {'tipo': 'minimo', 'coluna': col, 'valor': f'{col}_original', 'minimo': 0,
+         'mensagem': "Preço negativo.", 'grupo': 'precos'})],
+    {'tipo': 'comparacao', 'coluna': 'PRECO_VENDA', 'valor': 'PRECO_VENDA_original', 'operador': '<', 'outro': 'PRECO_CUSTO',
+     'mensagem': "Preço de venda menor que o preço de custo.", 'grupo': 'preco_abaixo_custo'},
+]
+REGRAS_PRODUTO_COMPILADAS = compilar_regras(REGRAS_PRODUTO)
+# Grupos opcionais: desligados até o cliente ativar em VALIDADOR_GRUPOS_ATIVADOS (separados por vírgula).
+# Venda abaixo do custo pode ser legítima (promoção, queima de estoque), então não bloqueia por padrão.
+GRUPOS_OPCIONAIS_PRODUTO = {'preco_abaixo_custo'}
+GRUPOS_DESLIGADOS_PRODUTO = GRUPOS_OPCIONAIS_PRODUTO - {g.strip() for g in os.environ.get('VALIDADOR_GRUPOS_ATIVADOS', '').split(',')}
+VERSAO_REGRAS_PRODUTO = versao_regras(REGRAS_PRODUTO, mestres=('ncm',))
+# Chaves que não podem se repetir no arquivo nem na carga (grupo 'duplicidades', ver duplicidades.py)
+CHAVES_UNICAS_PRODUTO = ('AD_IDEXTERNO',)
+
 # --- Função Principal de Validação ---
+def _erro_leitura(erro_leitura):
+    return [{"linha": 0, "coluna": "Arquivo", "valor_encontrado": "N/A", "erro": f"Erro crítico de leitura. Detalhe: {erro_leitura}"}], None
 
-def validar_produtos(caminho_arquivo):
-    erros_encontrados = []
-    
+def validar_produtos(caminho_arquivo, grupos_desativados=(), progresso=None, processos=None, incremental=None,
+                     carga=None, arquivo=None):
+    """Valida a planilha de produtos (caminho, bytes ou buffer do upload). `grupos_desativados` desliga grupos de REGRAS_PRODUTO
+    (os de GRUPOS_OPCIONAIS_PRODUTO já vêm desligados, salvo se ativados no ambiente).
+
+    `progresso(fase, feitas, total)` opcional recebe o andamento (ver tarefas.py); `processos` > 1
+    valida arquivos grandes em vários núcleos (ver processamento_paralelo.py).
+    `incremental=(historico, chave)` reaproveita a validação anterior do mesmo arquivo lógico
+    e só valida as linhas alteradas (ver revalidacao_incremental.py).
+    Chaves únicas repetidas no arquivo viram erro; com `carga`, também as que já existem em
+    outro arquivo da mesma carga de migração (`arquivo` = nome deste; ver duplicidades.py).
+    """
     # ----------------------------------------------------
     # 1. CARREGAR OS DADOS (Leitura Robusta)
     # ----------------------------------------------------
-    df = None
-    erro_leitura = "Formato desconhecido"
-    tentativas = [(';', 'latin-1'), (',', 'latin-1'), (';', 'utf-8'), (',', 'utf-8')]
-
-    for sep, enc in tentativas:
-        try:
-            df_temp = pd.read_csv(caminho_arquivo, sep=sep, encoding=enc, dtype=str, engine='python')
-            if len(df_temp.columns) > 1: 
-                df = df_temp
-                break 
-        except Exception as e: 
-            erro_leitura = str(e)
-            continue 
-
+    if progresso: progresso('leitura')
+    df, dialeto = ler_csv(caminho_arquivo)
     if df is None:
-        return [{"linha": 0, "coluna": "Arquivo", "valor_encontrado": "N/A", "erro": f"Erro crítico de leitura. Detalhe: {erro_leitura}"}], None
+        return _erro_leitura(dialeto)
+    logger.info("Arquivo lido: %s", descrever_dialeto(dialeto))
     
+    validar_bloco = partial(validar_df_produtos, grupos_desativados=grupos_desativados)
+    if incremental:
+        historico, chave = incremental
+        resultado = validar_incremental(df, validar_bloco, historico,
+                                        (*chave, VERSAO_REGRAS_PRODUTO, tuple(sorted({*grupos_desativados, *GRUPOS_DESLIGADOS_PRODUTO}))),
+                                        progresso, processos)
+    else:
+        resultado = validar_em_blocos(df, validar_bloco, progresso, processos=processos)
+    return adicionar_duplicidades(resultado, CHAVES_UNICAS_PRODUTO, 'produtos', carga, arquivo or nome_fonte(caminho_arquivo),
+                                  grupos_desativados, progresso)
+
+def validar_produtos_em_lotes(caminho_arquivo, caminho_corrigido, caminho_erros, tamanho_lote=TAMANHO_LOTE_PADRAO, grupos_desativados=(), processos=None,
+                              carga=None, arquivo=None, consultar_carga=True):
+    """
+    Versão streaming de validar_produtos para arquivos grandes: lê em blocos e grava
+    a planilha corrigida e o relatório de erros em disco conforme avança.
+    `consultar_carga=False` só grava as chaves na carga (ver duplicidades.erros_na_carga).
+    Retorna: (erros_criticos, resumo) — ver processamento_em_lotes.validar_em_lotes.
+    """
+    lotes, dialeto = ler_csv(caminho_arquivo, tamanho_lote=tamanho_lote)
+    if lotes is None:
+        return _erro_leitura(dialeto)
+    logger.info("Arquivo lido: %s", descrever_dialeto(dialeto))
+    with DetectorDuplicidades(CHAVES_UNICAS_PRODUTO, 'produtos', carga, arquivo or nome_fonte(caminho_arquivo),
+                              consultar_carga=consultar_carga) as duplicidades:
+        return validar_em_lotes(lotes, partial(validar_df_produtos, grupos_desativados=grupos_desativados),
+                                caminho_corrigido, caminho_erros, COLUNAS_ERRO, processos,
+                                None if GRUPO_DUPLICIDADES in grupos_desativados else duplicidades)
+
+def validar_df_produtos(df, grupos_desativados=()):
+    """Valida um DataFrame já lido (arquivo inteiro ou um bloco; a linha vem do índice)."""
     df = df.fillna('')
 
     # ----------------------------------------------------
     # 2. PRÉ-PROCESSAMENTO E CORREÇÕES
     # ----------------------------------------------------
     
-    # 2.1 Limpeza de Cabeçalhos
-    df.columns = df.columns.str.upper().str.strip() 
+    with etapa('mapeamento'):
+        # 2.1 Limpeza de Cabeçalhos
+        df.columns = df.columns.str.upper().str.strip() 
 
-    # 2.2 Mapeamento de Colunas (Unidades)
-    df = mapear_colunas(df, {'UNIDADE': ['UNIDADE', 'UND', 'UNID_MEDIDA', 'CODVOL', 'UN']})
+        # 2.2 Mapeamento de Colunas (Unidades)
+        df = mapear_colunas(df, {'UNIDADE': ['UNIDADE', 'UND', 'UNID_MEDIDA', 'CODVOL', 'UN']})
     
     colunas_criticas = ['AD_IDEXTERNO', 'DESCRPROD', 'NCM', 'MARCA', 'REFERENCIA', 'UNIDADE']
     for col in colunas_criticas:
         if col not in df.columns:
             return [{"linha": 0, "coluna": col, "valor_encontrado": "-", "erro": f"Coluna obrigatória '{col}' não encontrada."}], None
     
-    # Backup de colunas originais
-    colunas_para_backup = ['NCM', 'UNIDADE', 'PRECO_VENDA', 'PRECO_CUSTO', 'USOPROD']
-    colunas_sim_nao = ['TEMIPICOMPRA', 'TEMIPIVENDA', 'USACODBARRASQTD', 'ATIVO']
-    for col in colunas_para_backup + colunas_sim_nao:
-        if col in df.columns: df[f'{col}_original'] = df[col].copy()
-
-    # 2.3 CORREÇÕES AUTOMÁTICAS
-    
-    # Limpeza NCM (Solução anti-RegEx)
-    df['NCM'] = df['NCM'].astype(str).str.replace('.', '', regex=False).str.replace('/', '', regex=False).str.replace('-', '', regex=False).str.replace(' ', '', regex=False).str.strip()
-    
-    # Padronizar UNIDADE e tratar por extenso
-    df['UNIDADE'] = df['UNIDADE'].str.upper().str.strip().replace(MAP_UNIDADES, regex=False)
-    
-    # Limpar valores monetários
-    df = limpar_valor_monetario(df, 'PRECO_VENDA')
-    df = limpar_valor_monetario(df, 'PRECO_CUSTO')
-    
-    # Padronizar campos Sim/Não (Resolve o erro do 'sim' e 'não')
-    for col in colunas_sim_nao:
-        if col in df.columns:
-            df[col] = df[col].astype(str).str.upper().str.strip().replace(MAP_SIM_NAO, regex=False)
-    
-    # Padronizar USOPROD
-    if 'USOPROD' in df.columns:
-        df['USOPROD'] = df['USOPROD'].str.upper().str.strip()
-
     # ----------------------------------------------------
-    # 3. VALIDAÇÃO LINHA A LINHA
+    # 3. CORREÇÕES AUTOMÁTICAS + VALIDAÇÃO (motor de regras, em bloco)
     # ----------------------------------------------------
     
-    print(f"Iniciando validação de {len(df)} produtos...")
-
-    for index, row in df.iterrows():
-        linha_num = index + 2
-        
-        def adicionar_erro(coluna, valor_original, valor_corrigido, mensagem, foi_corrigido=False):
-            erros_encontrados.append({
-                "linha": linha_num, "coluna": coluna, "valor_encontrado": str(valor_original), 
-                "valor_corrigido": str(valor_corrigido) if foi_corrigido else "", "erro": mensagem, 
-                "corrigido": foi_corrigido
-            })
-        
-        # --- Lógica de Correção de Domínio (Registra se S/N mudou) ---
-        for col in colunas_sim_nao:
-            if col in row and row[f'{col}_original'] != row[col]:
-                adicionar_erro(col, row[f'{col}_original'], row[col], "Valor padronizado para 'S' ou 'N'.", True)
-
-        # Validações obrigatórias
-        if not row['AD_IDEXTERNO']: adicionar_erro('AD_IDEXTERNO', row['AD_IDEXTERNO'], "", "Campo obrigatório está vazio.", False)
-        if not row['DESCRPROD']: adicionar_erro('DESCRPROD', row['DESCRPROD'], "", "Campo obrigatório (Descrição do Produto) está vazio.", False)
-        
-        # [Validações de Domínio/Tamanho omitidas por brevidade]
+    logger.info("Iniciando validação de %d produtos...", len(df))
+
+    erros_encontrados = executar_regras(REGRAS_PRODUTO_COMPILADAS, df,
+                                        grupos_desativados={*grupos_desativados, *GRUPOS_DESLIGADOS_PRODUTO})
 
     # Retorna erros e DataFrame corrigido
-    if erros_encontrados:
-        df_erros = pd.DataFrame(erros_encontrados)
-        return df_erros.drop_duplicates().to_dict('records'), df
-    
-    return [], df
\ No newline at end of file
+    return erros_encontrados, df
\ No newline at end of file